@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path as _Path
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = _Path(__file__).resolve().parents[3]
+BATCH_STATE_PATH = REPO_ROOT / ".cache" / "quiet_logos" / "batch_state.json"
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from core.agents.quiet_logos.comment_cache import CommentCache, cache_key, default_cache  # noqa: E402
+from core.agents.quiet_logos.engine import AgentInput, _compact_user_text, _load_prompt, _report_compaction  # noqa: E402
+
+# Пакетная пересборка комментариев через Batch API вместо запроса на каждую запись.
+#
+# batch_state.json — задача в полёте:
+#     {"version", "model", "input_file_id", "batch_id", "items": {custom_id (дата): ключ кэша}}
+# Состояние пишется после каждого шага (загрузка файла, создание задачи), так что после
+# падения run_batch() продолжает ту же задачу, а не отправляет архив повторно.
+#
+# Результаты кладутся в CommentCache под теми же ключами, что и у синхронных вызовов:
+# сборка берёт их оттуда и пишет docs/log/comments/ как обычно.
+
+BATCH_STATE_VERSION = 1
+TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+
+@dataclass
+class BatchReport:
+    batch_id: str | None = None
+    status: str = "idle"  # idle | submitted | in_progress | ...статусы API... | completed
+    submitted: int = 0
+    collected: int = 0
+    failed: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def pending(self) -> bool:
+        return self.batch_id is not None and self.status not in TERMINAL
+
+
+def _read_state(path: _Path) -> dict | None:
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return state if state.get("version") == BATCH_STATE_VERSION else None
+
+
+def _write_state(path: _Path, state: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=1, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _submit(provider, inputs: list[AgentInput], *, cache: CommentCache, state_path: _Path) -> dict | None:
+    """JSONL из записей без готового фрагмента в кэше -> /files -> /batches. None — отправлять нечего."""
+    system_prompt = _load_prompt()
+    items: dict[str, str] = {}
+    lines: list[str] = []
+    for inp in inputs:
+        user_text, saved = _compact_user_text(inp)
+        key = cache_key(user_text=user_text, prompt=system_prompt, provider="openai", model=provider.model)
+        if cache.get(key) is not None:
+            continue
+        _report_compaction(inp, user_text, saved)
+        items[inp.date] = key
+        line = provider.batch_line(custom_id=inp.date, system_prompt=system_prompt, user_text=user_text)
+        lines.append(json.dumps(line, ensure_ascii=False))
+    if not items:
+        return None
+
+    state = {"version": BATCH_STATE_VERSION, "model": provider.model, "input_file_id": None, "batch_id": None, "items": items}
+    uploaded = provider.upload_file(filename="quiet_logos_batch.jsonl", data=("\n".join(lines) + "\n").encode("utf-8"))
+    state["input_file_id"] = uploaded["id"]
+    _write_state(state_path, state)
+    return _create(provider, state, state_path)
+
+
+def _create(provider, state: dict, state_path: _Path) -> dict:
+    batch = provider.create_batch(input_file_id=state["input_file_id"])
+    state["batch_id"] = batch["id"]
+    _write_state(state_path, state)
+    return state
+
+
+def _collect(provider, state: dict, batch: dict, *, cache: CommentCache, report: BatchReport) -> None:
+    """
+    Разбирает выходной файл (и файл ошибок). Для expired/cancelled выходной файл
+    содержит то, что успело выполниться, — эти результаты тоже сохраняются.
+    """
+    from core.agents.quiet_logos.provider_openai import OpenAIProviderError, response_text
+
+    items: dict[str, str] = state["items"]
+    seen: set[str] = set()
+    for file_key in ("output_file_id", "error_file_id"):
+        file_id = batch.get(file_key)
+        if not file_id:
+            continue
+        for raw in provider.file_content(file_id).splitlines():
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            custom_id = line.get("custom_id")
+            if custom_id not in items:
+                continue
+            seen.add(custom_id)
+            resp = line.get("response") or {}
+            if line.get("error") or resp.get("status_code", 500) >= 400:
+                err = line.get("error") or (resp.get("body") or {}).get("error") or resp
+                report.failed[custom_id] = str(err.get("message", err) if isinstance(err, dict) else err)
+                continue
+            try:
+                html = response_text(resp.get("body") or {})
+            except OpenAIProviderError as e:
+                report.failed[custom_id] = str(e)
+                continue
+            cache.put(items[custom_id], html)
+            report.collected += 1
+
+    errors = (batch.get("errors") or {}).get("data") or []
+    reason = "; ".join(str(e.get("message", e)) for e in errors) or f"no result (batch {batch.get('status')})"
+    for custom_id in items:
+        if custom_id not in seen:
+            report.failed[custom_id] = reason
+
+
+def run_batch(
+    inputs: list[AgentInput],
+    *,
+    wait_s: float = 0.0,
+    poll_s: float | None = None,
+    state_path: _Path = BATCH_STATE_PATH,
+    cache: CommentCache | None = None,
+) -> BatchReport:
+    """
+    Один шаг пакетной пересборки:
+    - есть незавершённая задача (batch_state.json) — продолжаем её, inputs не отправляются;
+    - иначе отправляем записи, которых нет в кэше;
+    затем опрашиваем задачу не дольше wait_s секунд. Готовые результаты — в кэш,
+    состояние удаляется; неудавшиеся записи попадут в следующую задачу.
+    """
+    from core.agents.quiet_logos.provider_openai import OpenAIProvider
+
+    provider = OpenAIProvider()
+    if cache is None:
+        cache = default_cache()
+    if poll_s is None:
+        poll_s = float(os.environ.get("QUIET_LOGOS_BATCH_POLL_S", "10"))
+
+    report = BatchReport()
+    state = _read_state(state_path)
+    if state is None:
+        state = _submit(provider, inputs, cache=cache, state_path=state_path)
+        if state is None:
+            return report
+        report.status = "submitted"
+    elif state["batch_id"] is None:
+        # упали между загрузкой файла и созданием задачи
+        state = _create(provider, state, state_path)
+    report.batch_id = state["batch_id"]
+    report.submitted = len(state["items"])
+
+    deadline = time.monotonic() + max(0.0, wait_s)
+    while True:
+        batch = provider.retrieve_batch(state["batch_id"])
+        report.status = batch.get("status", "unknown")
+        if report.status in TERMINAL:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return report
+        time.sleep(min(poll_s, remaining))
+
+    _collect(provider, state, batch, cache=cache, report=report)
+    state_path.unlink(missing_ok=True)
+    return report
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from pathlib import Path as _Path
+import hashlib
+import os
+import threading
+
+REPO_ROOT = _Path(__file__).resolve().parents[3]
+CACHE_DIR = REPO_ROOT / ".cache" / "quiet_logos" / "agent"
+
+
+def cache_key(*, user_text: str, prompt: str, provider: str, model: str) -> str:
+    """
+    Ключ фрагмента = хэш всего, от чего зависит ответ модели:
+    текст запроса (заголовок, дата, post_md), системный промпт, провайдер, модель.
+    Поля разделены длиной, чтобы "ab"+"c" не совпадало с "a"+"bc".
+    """
+    h = hashlib.sha256()
+    for part in (provider, model, prompt, user_text):
+        data = part.encode("utf-8")
+        h.update(str(len(data)).encode("ascii") + b":")
+        h.update(data)
+    return h.hexdigest()
+
+
+class CommentCache:
+    """
+    Content-addressed кэш HTML-фрагментов агента.
+
+    Файлы: <root>/<key[:2]>/<key>.html
+    mtime файла = время последнего обращения; при превышении max_bytes
+    удаляются самые давно использованные фрагменты.
+    """
+
+    def __init__(self, root: _Path = CACHE_DIR, max_bytes: int | None = None) -> None:
+        self.root = root
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("QUIET_LOGOS_CACHE_MAX_KB", "8192")) * 1024
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> _Path:
+        return self.root / key[:2] / f"{key}.html"
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            html = path.read_text(encoding="utf-8")
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return html
+
+    def put(self, key: str, html: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(html, encoding="utf-8")
+        tmp.replace(path)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries: list[tuple[float, int, _Path]] = []
+        total = 0
+        for path in self.root.glob("*/*.html"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+_default_cache: CommentCache | None = None
+
+
+def default_cache() -> CommentCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = CommentCache()
+    return _default_cache
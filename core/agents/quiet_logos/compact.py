@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from pathlib import Path as _Path
+import os
+import re
+import sys
+import threading
+
+REPO_ROOT = _Path(__file__).resolve().parents[3]
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.agent_stub import _extract_sections  # noqa: E402
+
+# Сжатие post_md перед отправкой модели.
+#
+# journal_server дописывает записи дня через "---", и длинный день целиком уходит в запрос.
+# Если оценка токенов превышает бюджет (QUIET_LOGOS_INPUT_BUDGET_TOKENS, 0 — без сжатия):
+#   - заголовок дня и последняя запись остаются как есть;
+#   - в ранних записях сохраняются шапка (время — заголовок) и разделы ## quiet / ## tech,
+#     а их текст обрезается по границе слова всё сильнее, пока не влезет;
+#   - если не влезают даже пустые разделы, самые ранние записи опускаются с пометкой.
+# Результат детерминирован: от него считается ключ кэша комментариев.
+
+DEFAULT_BUDGET_TOKENS = 1500
+ENTRY_SEP_RE = re.compile(r"\n---[ \t]*\n")
+TRIM_LIMITS = (2400, 1200, 600, 300, 150, 60, 0)  # символов на раздел ранней записи
+
+_STATS = {"calls": 0, "compacted": 0, "tokens_sent": 0, "tokens_saved": 0}
+_STATS_LOCK = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Дешёвая локальная оценка без токенизатора: ~4 байта UTF-8 на токен
+    (латиница — ~4 символа, кириллица — ~2 символа на токен).
+    """
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def budget_from_env() -> int:
+    return int(os.environ.get("QUIET_LOGOS_INPUT_BUDGET_TOKENS", str(DEFAULT_BUDGET_TOKENS)))
+
+
+def _split_lead(entry: str) -> tuple[str, str]:
+    """(шапка записи до первого ## раздела, остальное)."""
+    m = re.search(r"^##\s+", entry, flags=re.M)
+    if m is None:
+        return entry.strip(), ""
+    return entry[:m.start()].strip(), entry[m.start():]
+
+
+def _trim(body: str, limit: int) -> str:
+    body = body.strip()
+    if len(body) <= limit:
+        return body
+    if limit <= 0:
+        return "_…_"
+    cut = body[:limit]
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,.;:—-") + " …"
+
+
+def _compact_entry(entry: str, limit: int) -> str:
+    lead, rest = _split_lead(entry)
+    sections = _extract_sections(rest)
+    if sections:
+        parts = [f"## {name}\n\n{_trim(sections[name], limit)}" for name in ("quiet", "tech") if name in sections]
+    else:
+        parts = [_trim(rest, limit)] if rest.strip() else []
+    return "\n\n".join(p for p in [lead, *parts] if p)
+
+
+def compact_post_md(post_md: str, budget: int) -> tuple[str, int]:
+    """
+    Возвращает (post_md, сэкономлено токенов по оценке). Записи дня короче бюджета
+    и дни из одной записи не меняются; последняя запись не обрезается никогда.
+    """
+    before = estimate_tokens(post_md)
+    if budget <= 0 or before <= budget:
+        return post_md, 0
+
+    entries = ENTRY_SEP_RE.split(post_md.replace("\r\n", "\n"))
+    if len(entries) < 2:
+        return post_md, 0
+    older, latest = entries[:-1], entries[-1].strip()
+
+    def join(parts: list[str]) -> str:
+        return "\n\n---\n\n".join(parts) + "\n"
+
+    text = post_md
+    for limit in TRIM_LIMITS:
+        text = join([_compact_entry(e, limit) for e in older] + [latest])
+        if estimate_tokens(text) <= budget:
+            return text, before - estimate_tokens(text)
+
+    # даже пустые разделы не влезают — опускаем ранние записи, заголовок дня оставляем
+    title, _ = _split_lead(older[0])
+    kept = [_compact_entry(e, 0) for e in older]
+    dropped = 0
+    while kept:
+        kept.pop(0)
+        dropped += 1
+        note = f"{title}\n\n_(ранние записи дня опущены: {dropped})_"
+        text = join([note, *kept, latest])
+        if estimate_tokens(text) <= budget:
+            break
+    return text, max(0, before - estimate_tokens(text))
+
+
+def record(sent_text: str, saved: int) -> None:
+    """Учёт одного запроса к модели: сколько токенов ушло и сколько сэкономлено (сжатием или дополнением)."""
+    with _STATS_LOCK:
+        _STATS["calls"] += 1
+        _STATS["tokens_sent"] += estimate_tokens(sent_text)
+        if saved:
+            _STATS["compacted"] += 1
+            _STATS["tokens_saved"] += saved
+
+
+def compaction_stats() -> dict[str, int]:
+    with _STATS_LOCK:
+        return dict(_STATS)
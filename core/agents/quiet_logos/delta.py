@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from pathlib import Path as _Path
+import html
+import re
+
+DELTA_PROMPT_PATH = _Path(__file__).resolve().parent / "prompt_delta.md"
+
+# Дополнение комментария для дней из нескольких записей.
+#
+# Каталог помнит длину текста записи, к которой написан комментарий (comment_md_len).
+# Если с тех пор к файлу только дописали (ранняя часть совпадает с закэшированной версией),
+# в модель уходит лишь новая часть и короткий дайджест прежнего комментария,
+# а ответ вклеивается в конец прежней карточки. Стоимость каждой следующей записи дня
+# не растёт с длиной дня.
+
+DIGEST_CHARS = 400
+CARD_START_RE = re.compile(r'^\s*<div class="card agent">\s*', re.S)
+SIGNATURE_RE = re.compile(r"^\s*<p>\s*<strong>\s*Аристарх\s*</strong>\s*</p>\s*", re.S)
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def load_delta_prompt() -> str:
+    if not DELTA_PROMPT_PATH.exists():
+        raise FileNotFoundError(f"Prompt not found: {DELTA_PROMPT_PATH}")
+    return DELTA_PROMPT_PATH.read_text(encoding="utf-8")
+
+
+def comment_digest(fragment: str, limit: int = DIGEST_CHARS) -> str:
+    """Текст прежнего комментария без разметки, не длиннее limit символов."""
+    text = " ".join(html.unescape(TAG_RE.sub(" ", fragment)).split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > limit // 2 else cut) + " …"
+
+
+def format_delta_user_text(*, title: str, date: str, digest: str, new_md: str) -> str:
+    return (
+        f"TITLE: {title}\n"
+        f"DATE: {date}\n"
+        "EARLIER_COMMENT:\n"
+        f"{digest}\n"
+        "NEW_ENTRY_MD:\n"
+        f"{new_md}\n"
+    )
+
+
+def merge_fragments(previous: str, addition: str) -> str:
+    """
+    Вклеивает дополнение в конец карточки previous (перед последним </div>).
+    Если модель всё же вернула карточку целиком, берётся только её содержимое.
+    """
+    addition = addition.strip()
+    m = CARD_START_RE.match(addition)
+    if m is not None and addition.endswith("</div>"):
+        addition = SIGNATURE_RE.sub("", addition[m.end():-len("</div>")]).strip()
+
+    previous = previous.strip()
+    close = previous.rfind("</div>")
+    if close == -1:
+        return f"{previous}\n<hr />\n{addition}"
+    return f"{previous[:close].rstrip()}\n  <hr />\n  {addition}\n{previous[close:]}"
@@ -1,19 +1,43 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from pathlib import Path as _Path
+from typing import TYPE_CHECKING, Iterator
+import hashlib
 import os
 import sys
 
 REPO_ROOT = _Path(__file__).resolve().parents[3]
 PROMPT_PATH = _Path(__file__).resolve().parent / "prompt.md"
 
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from core.agents.quiet_logos.comment_cache import CommentCache, cache_key, default_cache  # noqa: E402
+from core.agents.quiet_logos.compact import budget_from_env, compact_post_md, estimate_tokens, record  # noqa: E402
+
+if TYPE_CHECKING:
+    from core.agents.quiet_logos.guard import AgentGuard
+
+# Метка заглушки, поставленной вместо упавшего облачного вызова (сеть, дедлайн, предохранитель).
+# Лежит внутри фрагмента, поэтому сохраняется в странице комментария; следующий запуск
+# в real-режиме пересобирает такие комментарии даже в режиме --agent-latest-only.
+STUB_FALLBACK_MARK = "<!--quiet_logos:stub-fallback-->"
+
 
 @dataclass
 class AgentInput:
     title: str
     date: str
     post_md: str
+    # Нужны только заглушке; в ключ кэша и в запрос к API не входят.
+    # sections — уже выделенные разделы quiet/tech (иначе заглушка разберёт post_md сама),
+    # corpus — scripts.corpus_terms.Corpus
+    sections: dict[str, str] | None = field(default=None, repr=False, compare=False)
+    corpus: object | None = field(default=None, repr=False, compare=False)
+    # Длина post_md, к которой уже написан комментарий (каталог, comment_md_len):
+    # дописанное после неё комментируется дополнением (см. delta.py).
+    commented_len: int | None = field(default=None, repr=False, compare=False)
 
 
 def _read_text(path: _Path) -> str:
@@ -26,15 +50,83 @@ def _load_prompt() -> str:
     return _read_text(PROMPT_PATH)
 
 
-def _format_user_text(inp: AgentInput) -> str:
-    return (
+def _compact_user_text(inp: AgentInput) -> tuple[str, int]:
+    """
+    Текст запроса с post_md, сжатым до QUIET_LOGOS_INPUT_BUDGET_TOKENS (см. compact.py),
+    и сколько токенов это сэкономило.
+    """
+    post_md, saved = compact_post_md(inp.post_md, budget_from_env())
+    text = (
         f"TITLE: {inp.title}\n"
         f"DATE: {inp.date}\n"
         "POST_MD:\n"
-        f"{inp.post_md}\n"
+        f"{post_md}\n"
+    )
+    return text, saved
+
+
+def _format_user_text(inp: AgentInput) -> str:
+    return _compact_user_text(inp)[0]
+
+
+def _report_compaction(inp: AgentInput, user_text: str, saved: int, how: str = "input compacted") -> None:
+    """Вызывается перед каждым реальным запросом (не для кэша)."""
+    record(user_text, saved)
+    if saved:
+        print(f"agent: {inp.date}: {how}, ~{saved} tokens saved", file=sys.stderr)
+
+
+def _generate(provider, guard: AgentGuard | None, *, system_prompt: str, user_text: str) -> str:
+    """Один облачный запрос; с guard — в пределах дедлайна сборки, с повторами и предохранителем."""
+    if guard is None:
+        return provider.generate_html_fragment(system_prompt=system_prompt, user_text=user_text)
+    return guard.call(
+        lambda timeout_s: provider.generate_html_fragment(system_prompt=system_prompt, user_text=user_text, timeout_s=timeout_s),
+        timeout_s=provider.timeout_s,
     )
 
 
+def _render_delta(
+    inp: AgentInput,
+    *,
+    provider,
+    system_prompt: str,
+    full_user_text: str,
+    cache: CommentCache,
+    guard: AgentGuard | None = None,
+) -> str | None:
+    """
+    Дополнение к уже написанному комментарию, если к записи только дописали.
+    Прежний комментарий берётся из кэша по версии post_md[:commented_len] — так ранняя часть
+    заодно проверяется на неизменность, а заглушка (она не кэшируется) не дополняется.
+    None — дополнение невозможно, нужен полный комментарий.
+    """
+    from core.agents.quiet_logos.delta import comment_digest, format_delta_user_text, load_delta_prompt, merge_fragments
+
+    n = inp.commented_len
+    if not n or n >= len(inp.post_md):
+        return None
+    new_md = inp.post_md[n:].strip()
+    if not new_md:
+        return None
+
+    prior_text, _ = _compact_user_text(replace(inp, post_md=inp.post_md[:n]))
+    prior = cache.get(cache_key(user_text=prior_text, prompt=system_prompt, provider="openai", model=provider.model))
+    if prior is None:
+        return None
+
+    delta_prompt = system_prompt + "\n\n" + load_delta_prompt()
+    user_text = format_delta_user_text(title=inp.title, date=inp.date, digest=comment_digest(prior), new_md=new_md)
+    key = cache_key(user_text=user_text, prompt=delta_prompt, provider="openai", model=provider.model)
+    addition = cache.get(key)
+    if addition is None:
+        saved = max(0, estimate_tokens(full_user_text) - estimate_tokens(user_text))
+        _report_compaction(inp, user_text, saved, how="delta comment")
+        addition = _generate(provider, guard, system_prompt=delta_prompt, user_text=user_text)
+        cache.put(key, addition)
+    return merge_fragments(prior, addition)
+
+
 def render_comment_html_stub(inp: AgentInput) -> str:
     root_str = str(REPO_ROOT)
     if root_str not in sys.path:
@@ -47,47 +139,189 @@ def render_comment_html_stub(inp: AgentInput) -> str:
         post_date=inp.date,
         post_md=inp.post_md,
         comment_href=None,
+        sections=inp.sections,
+        corpus=inp.corpus,
     )
 
 
-def render_comment_html_real(inp: AgentInput) -> str:
+def render_comment_html_fallback(inp: AgentInput) -> str:
+    """Заглушка вместо неудавшегося облачного комментария, с меткой для пересборки."""
+    return STUB_FALLBACK_MARK + "\n" + render_comment_html_stub(inp).strip()
+
+
+def is_stub_fallback(html: str) -> bool:
+    return STUB_FALLBACK_MARK in html
+
+
+def agent_mode() -> str:
+    """
+    QUIET_LOGOS_MODE, по умолчанию stub: облако (платные запросы) включается только явно,
+    даже если OPENAI_API_KEY есть в окружении (например, в CI).
+    """
+    return os.environ.get("QUIET_LOGOS_MODE", "stub").strip().lower()
+
+
+def real_mode_configured() -> bool:
+    """real-режим с ключом: комментарии пишет облако."""
+    return agent_mode() == "real" and bool(os.environ.get("OPENAI_API_KEY", "").strip())
+
+
+def config_fingerprint() -> str:
+    """
+    Всё, кроме самих записей, от чего зависит комментарий: в real-режиме — модель,
+    системный промпт и бюджет входа, в stub — код заглушки и корпуса.
+    Сборка хранит его в манифесте и не зовёт агента для записей, где не изменилось ничего.
+    """
+    h = hashlib.sha256()
+    if real_mode_configured():
+        from core.agents.quiet_logos.provider_openai import OpenAIProvider  # type: ignore
+
+        parts = ["real", OpenAIProvider().model, _load_prompt(), str(budget_from_env())]
+    else:
+        parts = ["stub"] + [_read_text(REPO_ROOT / "scripts" / name) for name in ("agent_stub.py", "corpus_terms.py")]
+    for part in parts:
+        data = part.encode("utf-8")
+        h.update(str(len(data)).encode("ascii") + b":")
+        h.update(data)
+    return h.hexdigest()
+
+
+def render_comment_html_real(inp: AgentInput, *, cache: CommentCache | None = None, guard: AgentGuard | None = None) -> str:
+    """
+    Облачный комментарий. Ответы кэшируются по хэшу (запрос, промпт, провайдер, модель),
+    так что неизменённая запись не отправляется в API повторно.
+    Stub не кэшируется: он дешёвый и локальный.
+    guard (guard.AgentGuard) — дедлайн, повторы и предохранитель сборки; при отказе
+    исключение уходит вызывающему (сборка ставит render_comment_html_fallback).
+    """
     from core.agents.quiet_logos.provider_openai import OpenAIProvider  # type: ignore
 
+    provider = OpenAIProvider()
+    if not provider.is_configured():
+        return render_comment_html_stub(inp)
+
     system_prompt = _load_prompt()
-    user_text = _format_user_text(inp)
+    user_text, saved = _compact_user_text(inp)
+
+    if cache is None:
+        cache = default_cache()
+    key = cache_key(user_text=user_text, prompt=system_prompt, provider="openai", model=provider.model)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # день дописан: дополнение к прежнему комментарию; итог кэшируется как комментарий всего текста
+    merged = _render_delta(inp, provider=provider, system_prompt=system_prompt, full_user_text=user_text, cache=cache, guard=guard)
+    if merged is not None:
+        cache.put(key, merged)
+        return merged
+
+    _report_compaction(inp, user_text, saved)
+    html = _generate(provider, guard, system_prompt=system_prompt, user_text=user_text)
+    cache.put(key, html)
+    return html
+
+
+def lookup_cached_comment_html(inp: AgentInput, *, cache: CommentCache | None = None) -> str | None:
+    """
+    Только кэш, без обращения к API: готовый фрагмент для текущих
+    записи/промпта/модели или None.
+    """
+    if agent_mode() != "real":
+        return None
+
+    from core.agents.quiet_logos.provider_openai import OpenAIProvider  # type: ignore
 
     provider = OpenAIProvider()
     if not provider.is_configured():
-        return render_comment_html_stub(inp)
+        return None
 
-    return provider.generate_html_fragment(
-        system_prompt=system_prompt,
-        user_text=user_text,
-    )
+    if cache is None:
+        cache = default_cache()
+    key = cache_key(user_text=_format_user_text(inp), prompt=_load_prompt(), provider="openai", model=provider.model)
+    return cache.get(key)
 
 
-def render_comment_html(inp: AgentInput) -> str:
-    mode = os.environ.get("QUIET_LOGOS_MODE", "real").strip().lower()
-    if mode == "real":
-        return render_comment_html_real(inp)
+def render_comment_html(inp: AgentInput, *, cache: CommentCache | None = None, guard: AgentGuard | None = None) -> str:
+    if agent_mode() == "real":
+        return render_comment_html_real(inp, cache=cache, guard=guard)
     return render_comment_html_stub(inp)
 
 
+def stream_comment_html(inp: AgentInput, *, cache: CommentCache | None = None) -> Iterator[str]:
+    """
+    Потоковый вариант render_comment_html: отдаёт HTML-фрагмент кусками
+    по мере генерации. Готовый фрагмент кладётся в кэш.
+    Кэш-попадание и stub отдаются одним куском.
+    Если облако упало до первого куска — отдаём stub.
+    Дополнение к прежнему комментарию (delta.py) короткое и отдаётся одним куском.
+    """
+    if agent_mode() != "real":
+        yield render_comment_html_stub(inp)
+        return
+
+    from core.agents.quiet_logos.provider_openai import OpenAIProvider  # type: ignore
+
+    provider = OpenAIProvider()
+    if not provider.is_configured():
+        yield render_comment_html_stub(inp)
+        return
+
+    system_prompt = _load_prompt()
+    user_text, saved = _compact_user_text(inp)
+
+    if cache is None:
+        cache = default_cache()
+    key = cache_key(user_text=user_text, prompt=system_prompt, provider="openai", model=provider.model)
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    try:
+        merged = _render_delta(inp, provider=provider, system_prompt=system_prompt, full_user_text=user_text, cache=cache)
+    except Exception:
+        merged = None
+    if merged is not None:
+        cache.put(key, merged)
+        yield merged
+        return
+
+    _report_compaction(inp, user_text, saved)
+    chunks: list[str] = []
+    try:
+        for delta in provider.stream_text_deltas(system_prompt=system_prompt, user_text=user_text):
+            chunks.append(delta)
+            yield delta
+    except Exception:
+        if chunks:
+            raise
+        yield render_comment_html_fallback(inp)
+        return
+
+    html = "".join(chunks).strip()
+    if html:
+        cache.put(key, html)
+
+
 def _cli() -> int:
     if len(sys.argv) != 2:
         print("Usage: python -m core.agents.quiet_logos.engine YYYY-MM-DD")
         return 2
 
+    from scripts.post_catalog import PostCatalog
+
     d = sys.argv[1].strip()
-    md_path = REPO_ROOT / "docs" / "log" / f"{d}.md"
-    if not md_path.exists():
-        print(f"Not found: {md_path}")
+    catalog = PostCatalog(REPO_ROOT / ".cache" / "quiet_logos" / "catalog.sqlite3", REPO_ROOT / "docs" / "log")
+    fresh = catalog.refresh()
+    entry = catalog.get(d)
+    if entry is None:
+        print(f"Not found: {catalog.md_path(d)}")
         return 2
 
-    post_md = md_path.read_text(encoding="utf-8")
-    title = f"quiet_logos — {d}"
+    post_md = fresh.get(d) or catalog.md_path(d).read_text(encoding="utf-8")
 
-    html = render_comment_html(AgentInput(title=title, date=d, post_md=post_md))
+    html = render_comment_html(AgentInput(title=entry.title, date=d, post_md=post_md))
     print(html)
     return 0
 
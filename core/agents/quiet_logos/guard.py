@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from typing import Callable, TypeVar
+import os
+import random
+import threading
+import time
+
+# Ограничители облачных вызовов на одну сборку.
+#
+# AgentGuard общий для всех потоков сборки:
+#   - общий дедлайн (QUIET_LOGOS_BUILD_DEADLINE_S): таймаут каждого запроса не больше
+#     остатка, после дедлайна запросы не отправляются;
+#   - повторы временных ошибок (сеть, таймаут, 408/409/429/5xx) с экспоненциальной
+#     задержкой и джиттером (QUIET_LOGOS_RETRIES, QUIET_LOGOS_BACKOFF_S), но не раньше Retry-After;
+#   - предохранитель: после QUIET_LOGOS_BREAKER_FAILURES неудачных вызовов подряд
+#     размыкается (open) — вызывающий получает AgentUnavailable и ставит заглушку;
+#     через QUIET_LOGOS_BREAKER_COOLDOWN_S пропускает один пробный вызов без повторов
+#     (half-open): удачный замыкает его снова, неудачный размыкает ещё на столько же.
+#
+# clock / sleep подменяются в тестах (tests/test_guard.py).
+
+T = TypeVar("T")
+
+
+class AgentUnavailable(RuntimeError):
+    """Вызов не делался: предохранитель разомкнут или дедлайн сборки истёк."""
+
+
+def _is_transient(e: Exception) -> bool:
+    return bool(getattr(e, "transient", False))
+
+
+class AgentGuard:
+    def __init__(
+        self,
+        *,
+        deadline_s: float,
+        retries: int = 2,
+        backoff_s: float = 0.5,
+        backoff_cap_s: float = 8.0,
+        breaker_failures: int = 3,
+        breaker_cooldown_s: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.clock = clock
+        self.sleep = sleep
+        self.deadline = clock() + deadline_s
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.backoff_cap_s = backoff_cap_s
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown_s = breaker_cooldown_s
+        self.consecutive_failures = 0
+        self.open_reason: str | None = None
+        self.opened_at = 0.0
+        self.retried = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AgentGuard":
+        return cls(
+            deadline_s=float(os.environ.get("QUIET_LOGOS_BUILD_DEADLINE_S", "600")),
+            retries=int(os.environ.get("QUIET_LOGOS_RETRIES", "2")),
+            backoff_s=float(os.environ.get("QUIET_LOGOS_BACKOFF_S", "0.5")),
+            breaker_failures=int(os.environ.get("QUIET_LOGOS_BREAKER_FAILURES", "3")),
+            breaker_cooldown_s=float(os.environ.get("QUIET_LOGOS_BREAKER_COOLDOWN_S", "30")),
+        )
+
+    def remaining(self) -> float:
+        return self.deadline - self.clock()
+
+    @property
+    def state(self) -> str:
+        """closed | open | half-open (идёт пробный вызов)."""
+        with self._lock:
+            if self.open_reason is None:
+                return "closed"
+            return "half-open" if self._probing else "open"
+
+    def _check(self) -> bool:
+        """Можно ли звать; True — это пробный вызов разомкнутого предохранителя."""
+        with self._lock:
+            if self.remaining() <= 0:
+                self.open_reason = "build deadline exceeded"
+                raise AgentUnavailable(self.open_reason)
+            if self.open_reason is None:
+                return False
+            if self._probing or self.clock() - self.opened_at < self.breaker_cooldown_s:
+                raise AgentUnavailable(self.open_reason)
+            self._probing = True
+            return True
+
+    def _record(self, ok: bool, error: Exception | None = None, *, probe: bool = False) -> None:
+        with self._lock:
+            if probe:
+                self._probing = False
+            if ok:
+                self.consecutive_failures = 0
+                if probe:
+                    self.open_reason = None
+                return
+            self.consecutive_failures += 1
+            if probe:
+                self.open_reason = f"circuit re-opened after a failed probe (last: {error})"
+                self.opened_at = self.clock()
+            elif self.open_reason is None and self.consecutive_failures >= self.breaker_failures:
+                self.open_reason = f"circuit open after {self.consecutive_failures} consecutive failures (last: {error})"
+                self.opened_at = self.clock()
+
+    def _delay(self, attempt: int) -> float:
+        # «equal jitter»: половина задержки фиксирована, половина случайна
+        base = min(self.backoff_cap_s, self.backoff_s * (2 ** attempt))
+        return base / 2 + random.uniform(0, base / 2)
+
+    def call(self, fn: Callable[[float], T], *, timeout_s: float) -> T:
+        """
+        fn(timeout) — один запрос с таймаутом не больше остатка дедлайна.
+        Временные ошибки повторяются, пока есть попытки и время; неудачный итог
+        (после повторов) считается предохранителем. Пробный вызов не повторяется.
+        """
+        attempt = 0
+        while True:
+            probe = self._check()
+            try:
+                result = fn(max(0.1, min(timeout_s, self.remaining())))
+            except Exception as e:
+                # 429 Retry-After / ожидание ограничителя — не короче, чем просит сервер
+                delay = max(self._delay(attempt), getattr(e, "retry_after", None) or 0.0)
+                if probe or not _is_transient(e) or attempt >= self.retries or delay >= self.remaining():
+                    self._record(False, e, probe=probe)
+                    raise
+                with self._lock:
+                    self.retried += 1
+                self.sleep(delay)
+                attempt += 1
+                continue
+            self._record(True, probe=probe)
+            return result
@@ -1,13 +1,223 @@
 from __future__ import annotations
 
+from typing import Iterator
+from urllib.parse import unquote, urlsplit
+import base64
+import http.client
 import json
 import os
+import threading
 import urllib.request
-import urllib.error
+import uuid
+
+from core.agents.quiet_logos.ratelimit import RateLimitTimeout, get_limiter, parse_retry_after
 
 
 class OpenAIProviderError(RuntimeError):
-    pass
+    """
+    status — HTTP-код ответа (None для сетевых ошибок);
+    transient — имеет ли смысл повторить запрос (сеть, таймаут, 408/409/429/5xx);
+    retry_after — сколько секунд сервер (или ограничитель) просит подождать.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        *,
+        status: int | None = None,
+        transient: bool = False,
+        retry_after: float | None = None,
+    ) -> None:
+        super().__init__(message)
+        self.status = status
+        self.transient = transient
+        self.retry_after = retry_after
+
+
+TRANSIENT_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+def _http_error(status: int, body: str, headers=None) -> OpenAIProviderError:
+    retry_after = parse_retry_after({k.lower(): v for k, v in headers.items()}) if headers is not None else None
+    return OpenAIProviderError(
+        f"HTTPError {status}: {body}",
+        status=status,
+        transient=status in TRANSIENT_STATUSES,
+        retry_after=retry_after,
+    )
+
+
+# Запросы к модели идут через общий ограничитель RPM/TPM (ratelimit.py);
+# /files и /batches считаются отдельно и не ограничиваются.
+_LIMITED_PATHS = ("/responses",)
+
+
+# Ошибки, которые означают «сервер уже закрыл keep-alive соединение».
+# На переиспользованном сокете это нормально — переподключаемся один раз.
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+def _proxy_for(scheme: str, host: str) -> tuple[str, int, dict[str, str]] | None:
+    """
+    (хост, порт, заголовки) прокси из HTTPS_PROXY / HTTP_PROXY с учётом NO_PROXY —
+    как у urllib, который провайдер использовал раньше. None — напрямую.
+    """
+    proxy = urllib.request.getproxies().get(scheme)
+    if not proxy or urllib.request.proxy_bypass(host):
+        return None
+    parts = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+    if not parts.hostname:
+        return None
+    headers = {}
+    if parts.username:
+        cred = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+        headers["Proxy-Authorization"] = "Basic " + base64.b64encode(cred.encode("utf-8")).decode("ascii")
+    return parts.hostname, parts.port or 80, headers
+
+
+class ConnectionPool:
+    """
+    Пул keep-alive HTTP(S) соединений к одному хосту.
+    Потокобезопасен: каждый вызывающий берёт своё соединение, а после ответа возвращает.
+    Через прокси: https — туннель CONNECT (set_tunnel), http — абсолютный URL в запросе.
+    """
+
+    def __init__(self, *, scheme: str, host: str, port: int | None, timeout_s: float, maxsize: int = 8) -> None:
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout_s = timeout_s
+        self.maxsize = maxsize
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.proxy = _proxy_for(scheme, host)
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        if self.proxy is None:
+            conn = cls(self.host, self.port, timeout=self.timeout_s)
+        else:
+            proxy_host, proxy_port, proxy_headers = self.proxy
+            conn = cls(proxy_host, proxy_port, timeout=self.timeout_s)
+            if self.scheme == "https":
+                conn.set_tunnel(self.host, self.port, headers=proxy_headers)
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def target(self, path: str, headers: dict[str, str]) -> tuple[str, dict[str, str]]:
+        """(цель запроса, заголовки): для http через прокси — абсолютный URL и авторизация прокси."""
+        if self.proxy is None or self.scheme == "https":
+            return path, headers
+        netloc = self.host if self.port is None else f"{self.host}:{self.port}"
+        return f"http://{netloc}{path}", {**headers, **self.proxy[2]}
+
+    def acquire(self, *, fresh: bool = False) -> tuple[http.client.HTTPConnection, bool]:
+        """Возвращает (соединение, было_ли_оно_переиспользовано)."""
+        if not fresh:
+            with self._lock:
+                if self._idle:
+                    self.reused += 1
+                    return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def discard(self, conn: http.client.HTTPConnection) -> None:
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"opened": self.opened, "reused": self.reused, "idle": len(self._idle)}
+
+
+# Пулы общие для всех экземпляров провайдера в процессе:
+# engine создаёт OpenAIProvider на каждый комментарий, а соединения живут всю сборку.
+_POOLS: dict[tuple[str, str, int | None], ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _get_pool(scheme: str, host: str, port: int | None, timeout_s: float) -> ConnectionPool:
+    key = (scheme, host, port)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            maxsize = int(os.environ.get("QUIET_LOGOS_POOL_SIZE", "8"))
+            pool = ConnectionPool(scheme=scheme, host=host, port=port, timeout_s=timeout_s, maxsize=maxsize)
+            _POOLS[key] = pool
+        return pool
+
+
+def pool_stats() -> dict[str, int]:
+    """Суммарные счётчики по всем пулам: сколько соединений открыто и сколько раз переиспользовано."""
+    total = {"opened": 0, "reused": 0, "idle": 0}
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        for k, v in pool.stats().items():
+            total[k] += v
+    return total
+
+
+def close_pools() -> None:
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
+def _set_timeout(conn: http.client.HTTPConnection, timeout_s: float) -> None:
+    """Таймаут на запрос: соединения из пула общие, поэтому выставляется при каждой отправке."""
+    conn.timeout = timeout_s
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout_s)
+
+
+def _iter_sse_json(resp: http.client.HTTPResponse) -> Iterator[dict]:
+    """
+    Разбирает text/event-stream: события разделены пустой строкой,
+    полезная нагрузка — строки "data: ...". "[DONE]" завершает поток.
+    """
+    data_lines: list[str] = []
+    while True:
+        raw = resp.readline()
+        if not raw:
+            break
+        line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        if line:
+            if line.startswith("data:"):
+                data_lines.append(line[5:].lstrip())
+            continue
+        if not data_lines:
+            continue
+        data = "\n".join(data_lines)
+        data_lines = []
+        if data == "[DONE]":
+            break
+        try:
+            yield json.loads(data)
+        except ValueError:
+            continue
 
 
 class OpenAIProvider:
@@ -23,15 +233,115 @@ class OpenAIProvider:
         self.timeout_s = int(os.environ.get("QUIET_LOGOS_TIMEOUT_S", "45"))
         self.max_output_tokens = int(os.environ.get("QUIET_LOGOS_MAX_OUTPUT_TOKENS", "700"))
 
+        parts = urlsplit(self.base_url)
+        self._path_prefix = parts.path.rstrip("/")
+        self.pool = _get_pool(parts.scheme or "https", parts.hostname or "", parts.port, self.timeout_s)
+        self.limiter = get_limiter(parts.netloc, self.model)
+
     def is_configured(self) -> bool:
         return bool(self.api_key)
 
-    def generate_html_fragment(self, *, system_prompt: str, user_text: str) -> str:
-        if not self.api_key:
-            raise OpenAIProviderError("OPENAI_API_KEY is not set")
+    def connection_stats(self) -> dict[str, int]:
+        return self.pool.stats()
+
+    def _send(
+        self,
+        method: str,
+        path: str,
+        data: bytes | None = None,
+        content_type: str = "application/json",
+        timeout_s: float | None = None,
+    ) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Отправляет запрос и возвращает (соединение, ответ) с непрочитанным телом.
+        timeout_s — таймаут сокета для этого запроса (по умолчанию QUIET_LOGOS_TIMEOUT_S).
+        """
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if data is not None:
+            headers["Content-Type"] = content_type
+        timeout = self.timeout_s if timeout_s is None else timeout_s
+
+        limited = path in _LIMITED_PATHS
+        if limited:
+            # TPM считает и вход (~4 байта на токен), и запрошенный максимум выхода
+            estimate = (len(data or b"") + 3) // 4 + self.max_output_tokens
+            try:
+                self.limiter.acquire(estimate, max_wait_s=timeout)
+            except RateLimitTimeout as e:
+                raise OpenAIProviderError(f"Rate limited: {e}", transient=True, retry_after=e.wait_s) from None
+
+        conn, resp = self._send_once(method, path, data, headers, timeout)
+        if limited:
+            self.limiter.observe(resp.status, resp.headers)
+        return conn, resp
+
+    def _send_once(
+        self,
+        method: str,
+        path: str,
+        data: bytes | None,
+        headers: dict[str, str],
+        timeout: float,
+    ) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        target, headers = self.pool.target(self._path_prefix + path, headers)
+        conn, reused = self.pool.acquire()
+        try:
+            try:
+                _set_timeout(conn, timeout)
+                conn.request(method, target, body=data, headers=headers)
+                return conn, conn.getresponse()
+            except _STALE_ERRORS:
+                if not reused:
+                    raise
+                # сокет из пула протух (сервер закрыл idle-соединение) — одна попытка на новом
+                self.pool.discard(conn)
+                conn, reused = self.pool.acquire(fresh=True)
+                _set_timeout(conn, timeout)
+                conn.request(method, target, body=data, headers=headers)
+                return conn, conn.getresponse()
+        except Exception as e:
+            self.pool.discard(conn)
+            raise OpenAIProviderError(f"Request failed: {e}", transient=True) from e
 
-        url = f"{self.base_url}/responses"
-        payload = {
+    def _open(self, path: str, payload: dict, timeout_s: float | None = None) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """POST с JSON-телом."""
+        return self._send("POST", path, json.dumps(payload).encode("utf-8"), timeout_s=timeout_s)
+
+    def _finish(self, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse) -> None:
+        """Возвращает соединение в пул, если тело дочитано и сервер не просил закрыть."""
+        if resp.will_close or not resp.isclosed():
+            self.pool.discard(conn)
+        else:
+            self.pool.release(conn)
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        data: bytes | None = None,
+        content_type: str = "application/json",
+        timeout_s: float | None = None,
+    ) -> str:
+        conn, resp = self._send(method, path, data, content_type, timeout_s)
+        try:
+            body = resp.read().decode("utf-8", errors="replace")
+        except Exception as e:
+            self.pool.discard(conn)
+            raise OpenAIProviderError(f"Request failed: {e}", transient=True) from e
+        self._finish(conn, resp)
+
+        if resp.status >= 400:
+            raise _http_error(resp.status, body, resp.headers)
+        return body
+
+    def _post_json(self, path: str, payload: dict, timeout_s: float | None = None) -> str:
+        return self._request("POST", path, json.dumps(payload).encode("utf-8"), timeout_s=timeout_s)
+
+    def _get_json(self, path: str) -> dict:
+        return json.loads(self._request("GET", path))
+
+    def _payload(self, *, system_prompt: str, user_text: str) -> dict:
+        return {
             "model": self.model,
             "input": [
                 {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]},
@@ -40,40 +350,119 @@ class OpenAIProvider:
             "max_output_tokens": self.max_output_tokens,
         }
 
-        data = json.dumps(payload).encode("utf-8")
-        req = urllib.request.Request(
-            url,
-            data=data,
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            },
-            method="POST",
-        )
+    def stream_text_deltas(self, *, system_prompt: str, user_text: str, timeout_s: float | None = None) -> Iterator[str]:
+        """
+        SSE-режим /responses: отдаёт куски текста по мере генерации
+        (события response.output_text.delta).
+        """
+        if not self.api_key:
+            raise OpenAIProviderError("OPENAI_API_KEY is not set")
 
+        payload = self._payload(system_prompt=system_prompt, user_text=user_text)
+        payload["stream"] = True
+
+        conn, resp = self._open("/responses", payload, timeout_s)
+        if resp.status >= 400:
+            msg = resp.read().decode("utf-8", errors="replace")
+            self._finish(conn, resp)
+            raise _http_error(resp.status, msg, resp.headers)
+
+        done = False
         try:
-            with urllib.request.urlopen(req, timeout=self.timeout_s) as resp:
-                body = resp.read().decode("utf-8", errors="replace")
-        except urllib.error.HTTPError as e:
-            msg = e.read().decode("utf-8", errors="replace")
-            raise OpenAIProviderError(f"HTTPError {e.code}: {msg}") from e
+            for obj in _iter_sse_json(resp):
+                kind = obj.get("type", "")
+                if kind == "response.output_text.delta":
+                    delta = obj.get("delta")
+                    if isinstance(delta, str) and delta:
+                        yield delta
+                elif kind in ("response.failed", "error"):
+                    err = obj.get("error") or obj.get("response", {}).get("error") or obj
+                    raise OpenAIProviderError(f"Stream failed: {err}")
+                elif kind == "response.completed":
+                    done = True
+                    break
+            if done:
+                # дочитываем хвост, чтобы соединение можно было вернуть в пул
+                resp.read()
+        except OpenAIProviderError:
+            self.pool.discard(conn)
+            raise
         except Exception as e:
-            raise OpenAIProviderError(f"Request failed: {e}") from e
-
-        obj = json.loads(body)
-        text = obj.get("output_text")
-        if isinstance(text, str) and text.strip():
-            return text.strip()
-
-        out = obj.get("output", [])
-        chunks: list[str] = []
-        for item in out:
-            for c in item.get("content", []):
-                t = c.get("text")
-                if isinstance(t, str):
-                    chunks.append(t)
-
-        result = "\n".join(chunks).strip()
-        if not result:
-            raise OpenAIProviderError("Empty response text")
-        return result
+            self.pool.discard(conn)
+            raise OpenAIProviderError(f"Stream failed: {e}", transient=True) from e
+        finally:
+            # если потребитель бросил генератор на середине — соединение в пул не возвращаем
+            if not done:
+                self.pool.discard(conn)
+        if done:
+            self._finish(conn, resp)
+
+    def generate_html_fragment(self, *, system_prompt: str, user_text: str, timeout_s: float | None = None) -> str:
+        if not self.api_key:
+            raise OpenAIProviderError("OPENAI_API_KEY is not set")
+
+        payload = self._payload(system_prompt=system_prompt, user_text=user_text)
+        body = self._post_json("/responses", payload, timeout_s)
+        return response_text(json.loads(body))
+
+    # --- Batch API: /files + /batches ---
+
+    def batch_line(self, *, custom_id: str, system_prompt: str, user_text: str) -> dict:
+        """Одна строка входного JSONL для batch-задачи /v1/responses."""
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": self._payload(system_prompt=system_prompt, user_text=user_text),
+        }
+
+    def upload_file(self, *, filename: str, data: bytes, purpose: str = "batch") -> dict:
+        """POST /files (multipart/form-data). Возвращает объект файла ({"id": ...})."""
+        if not self.api_key:
+            raise OpenAIProviderError("OPENAI_API_KEY is not set")
+        boundary = uuid.uuid4().hex
+        body = (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="purpose"\r\n\r\n'
+            f"{purpose}\r\n"
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            "Content-Type: application/jsonl\r\n\r\n"
+        ).encode("utf-8") + data + f"\r\n--{boundary}--\r\n".encode("utf-8")
+        return json.loads(self._request("POST", "/files", body, f"multipart/form-data; boundary={boundary}"))
+
+    def create_batch(self, *, input_file_id: str, endpoint: str = "/v1/responses", completion_window: str = "24h") -> dict:
+        return json.loads(self._post_json("/batches", {
+            "input_file_id": input_file_id,
+            "endpoint": endpoint,
+            "completion_window": completion_window,
+        }))
+
+    def retrieve_batch(self, batch_id: str) -> dict:
+        return self._get_json(f"/batches/{batch_id}")
+
+    def cancel_batch(self, batch_id: str) -> dict:
+        return json.loads(self._request("POST", f"/batches/{batch_id}/cancel"))
+
+    def file_content(self, file_id: str) -> str:
+        return self._request("GET", f"/files/{file_id}/content")
+
+
+def response_text(obj: dict) -> str:
+    """Текст ответа /responses: output_text или склеенные output[].content[].text."""
+    text = obj.get("output_text")
+    if isinstance(text, str) and text.strip():
+        return text.strip()
+
+    out = obj.get("output", [])
+    chunks: list[str] = []
+    for item in out:
+        for c in item.get("content", []):
+            t = c.get("text")
+            if isinstance(t, str):
+                chunks.append(t)
+
+    result = "\n".join(chunks).strip()
+    if not result:
+        raise OpenAIProviderError("Empty response text")
+    return result
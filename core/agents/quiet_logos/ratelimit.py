@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+from email.utils import parsedate_to_datetime
+from typing import Callable, Mapping
+import os
+import re
+import threading
+import time
+
+# Клиентский ограничитель запросов к /responses: два token bucket — запросы в минуту (RPM)
+# и токены в минуту (TPM). Один на процесс для пары (хост, модель), поэтому потоки
+# --agent-concurrency, journal_server и batch-сборка делят общий бюджет.
+#
+# Лимиты берутся из ответов сервера:
+#   x-ratelimit-limit-{requests,tokens}     — ёмкость (за минуту)
+#   x-ratelimit-remaining-{requests,tokens} — сколько осталось сейчас
+#   Retry-After / retry-after-ms у 429      — пауза для всех вызывающих
+#   (без них — x-ratelimit-reset-requests: "1s", "6m0s", "20ms")
+# Между ответами баланс пополняется равномерно (ёмкость за минуту), так что запросы
+# идут с максимальным устойчивым темпом, а не пачкой до первого 429.
+# До первого ответа лимиты неизвестны (или заданы QUIET_LOGOS_RPM / QUIET_LOGOS_TPM),
+# и запросы не задерживаются.
+#
+# clock / sleep подменяются в тестах (tests/test_ratelimit.py).
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+UNIT_S = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class RateLimitTimeout(Exception):
+    """Ждать бюджета пришлось бы дольше max_wait_s; wait_s — сколько именно."""
+
+    def __init__(self, wait_s: float) -> None:
+        super().__init__(f"rate limited for {wait_s:.1f}s")
+        self.wait_s = wait_s
+
+
+def parse_duration(value: str | None) -> float | None:
+    """"6m0s" / "1.5s" / "20ms" -> секунды."""
+    if not value:
+        return None
+    parts = DURATION_RE.findall(value.strip())
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(n) * UNIT_S[unit] for n, unit in parts)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float | None:
+    """retry-after-ms, Retry-After в секундах или HTTP-датой -> секунды."""
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> int | None:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    Ёмкость capacity, пополнение capacity/минуту. capacity None — без ограничения.
+    Баланс может уйти в минус: резерв делается сразу, а вызывающий ждёт, пока долг
+    пополнится, — так одновременные вызовы выстраиваются в очередь, а не в толпу.
+    """
+
+    def __init__(self, capacity: float | None = None, now: float | None = None) -> None:
+        self.capacity = capacity
+        self.tokens = capacity or 0.0
+        self.stamp = time.monotonic() if now is None else now
+
+    @property
+    def rate(self) -> float:
+        return (self.capacity or 0.0) / 60.0
+
+    def _refill(self, now: float) -> None:
+        if self.capacity is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_for(self, n: float, now: float) -> float:
+        """Сколько ждать, чтобы взять n (без резерва)."""
+        self._refill(now)
+        if self.capacity is None or self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+    def take(self, n: float) -> None:
+        if self.capacity is not None:
+            self.tokens -= n
+
+    def observe(self, limit: int | None, remaining: int | None, now: float) -> None:
+        """Сервер знает точнее: ёмкость — из limit, баланс — не больше remaining."""
+        self._refill(now)
+        if limit is not None and limit > 0:
+            if self.capacity is None:
+                self.tokens = float(limit)
+            self.capacity = float(limit)
+        if remaining is not None and self.capacity is not None:
+            self.tokens = min(self.tokens, float(remaining))
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rpm: int | None = None,
+        tpm: int | None = None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.clock = clock
+        self.sleep = sleep
+        now = clock()
+        self.requests = TokenBucket(float(rpm) if rpm else None, now)
+        self.tokens = TokenBucket(float(tpm) if tpm else None, now)
+        self.blocked_until = 0.0
+        self.waited_s = 0.0
+        self.throttled = 0  # сколько 429 получено
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int, *, max_wait_s: float | None = None) -> float:
+        """
+        Резервирует 1 запрос и tokens токенов, при необходимости ждёт.
+        Возвращает время ожидания; RateLimitTimeout — если ждать пришлось бы дольше max_wait_s
+        (резерв тогда не делается).
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                blocked = self.blocked_until - now
+                if blocked <= 0:
+                    wait = max(self.requests.wait_for(1, now), self.tokens.wait_for(tokens, now))
+                    if max_wait_s is not None and waited + wait > max_wait_s:
+                        raise RateLimitTimeout(waited + wait)
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    self.waited_s += wait
+                    break
+                if max_wait_s is not None and waited + blocked > max_wait_s:
+                    raise RateLimitTimeout(waited + blocked)
+                self.waited_s += blocked
+            # Retry-After: ждём паузу и проверяем снова (её могли продлить)
+            self.sleep(blocked)
+            waited += blocked
+        if wait > 0:
+            self.sleep(wait)
+        return waited + wait
+
+    def observe(self, status: int, headers: Mapping[str, str]) -> None:
+        """Заголовки любого ответа /responses; у 429 — пауза для всех вызывающих."""
+        h = {k.lower(): v for k, v in headers.items()}
+        with self._lock:
+            now = self.clock()
+            self.requests.observe(
+                _int_header(h, "x-ratelimit-limit-requests"),
+                _int_header(h, "x-ratelimit-remaining-requests"),
+                now,
+            )
+            self.tokens.observe(
+                _int_header(h, "x-ratelimit-limit-tokens"),
+                _int_header(h, "x-ratelimit-remaining-tokens"),
+                now,
+            )
+            if status == 429:
+                self.throttled += 1
+                retry_after = parse_retry_after(h)
+                if retry_after is None:
+                    retry_after = parse_duration(h.get("x-ratelimit-reset-requests")) or 1.0
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "rpm": self.requests.capacity or 0,
+                "tpm": self.tokens.capacity or 0,
+                "waited_s": round(self.waited_s, 2),
+                "throttled": self.throttled,
+            }
+
+
+_LIMITERS: dict[tuple[str, str], RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(host: str, model: str) -> RateLimiter:
+    """Общий на процесс ограничитель для (хост, модель)."""
+    key = (host, model)
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if limiter is None:
+            rpm = int(os.environ.get("QUIET_LOGOS_RPM", "0")) or None
+            tpm = int(os.environ.get("QUIET_LOGOS_TPM", "0")) or None
+            limiter = RateLimiter(rpm=rpm, tpm=tpm)
+            _LIMITERS[key] = limiter
+        return limiter
+
+
+def limiter_stats() -> dict[str, float]:
+    """Сумма по всем ограничителям процесса: ожидание и число 429."""
+    total = {"waited_s": 0.0, "throttled": 0}
+    with _LIMITERS_LOCK:
+        limiters = list(_LIMITERS.values())
+    for limiter in limiters:
+        s = limiter.stats()
+        total["waited_s"] += s["waited_s"]
+        total["throttled"] += s["throttled"]
+    return total
@@ -3,21 +3,17 @@ from __future__ import annotations
 
 import re
 from collections import Counter
+from typing import TYPE_CHECKING, Iterator
 
+if TYPE_CHECKING:
+    from scripts.corpus_terms import Corpus
 
-def _extract_sections(md_text: str) -> dict[str, str]:
-    """
-    Выделяет разделы вида:
-    ## quiet
-    ## tech
 
-    Если таких блоков несколько (несколько записей за день),
-    будет взят ПОСЛЕДНИЙ — это соответствует режиму "последнее состояние".
-    """
+def _iter_sections(md_text: str) -> Iterator[tuple[str, str]]:
+    """(имя раздела в нижнем регистре, текст) для каждого блока '## имя' по порядку."""
     text = md_text.replace("\r\n", "\n").replace("\r", "\n")
     parts = re.split(r"\n##\s+", "\n" + text)
 
-    sections: dict[str, str] = {}
     for part in parts:
         part = part.strip()
         if not part:
@@ -26,16 +22,63 @@ def _extract_sections(md_text: str) -> dict[str, str]:
         lines = part.split("\n", 1)
         name = lines[0].strip().lower()
         body = lines[1].strip() if len(lines) > 1 else ""
+        yield name, body
+
+
+def _extract_sections(md_text: str) -> dict[str, str]:
+    """
+    Выделяет разделы вида:
+    ## quiet
+    ## tech
 
+    Если таких блоков несколько (несколько записей за день),
+    будет взят ПОСЛЕДНИЙ — это соответствует режиму "последнее состояние".
+    """
+    sections: dict[str, str] = {}
+    for name, body in _iter_sections(md_text):
         if name in ("quiet", "tech"):
             sections[name] = body
 
     return sections
 
 
+WORD_RE = re.compile(r"[A-Za-zА-Яа-яЁё]{4,}")
+
+
+def _tokens(text: str) -> list[str]:
+    """Слова из 4+ латинских/кириллических букв в нижнем регистре (общие правила для нитей и поиска)."""
+    return WORD_RE.findall(text.lower())
+
+
+# Служебные слова 4+ букв: без них нити — слова о содержании, а не «есть, теперь, просто».
+STOPWORDS = frozenset("""
+    quiet tech date
+    это этот эта эти этого этой этом этих этому тот того той тому тех теми
+    есть быть было были будет будут буду была себя себе собой свой своя своё свое свои своей своих свою своим много
+    меня мной тебя тебе него нему неё нее ними нами вами ваш наш наши ваши
+    теперь сейчас тогда потом когда если чтобы чтоб потому почему поэтому тоже также
+    просто словно будто очень может можно нужно надо только даже ещё уже всегда никогда
+    который которая которое которые которых котором которую которой которым
+    весь всего всех всем всеми всей всё какой какая какое какие каких такой такая такое такие таких
+    здесь туда сюда отсюда через после перед между более менее почти нибудь либо сама само сами самый
+    один одна одно одни хотя пока если разве лишь именно вообще вроде кажется
+    that this these those with from have has had will would what when then than them they their there
+    were been being just like also into about some more most only very your yours over such which while
+""".split())
+
+
+def _content_terms(md_text: str) -> list[str]:
+    """
+    Слова для нитей: только тексты разделов quiet/tech (всех записей дня, без заголовков
+    '## quiet' и шапок), без STOPWORDS. Запись без таких разделов — весь текст без строк-заголовков.
+    """
+    bodies = [body for name, body in _iter_sections(md_text) if name in ("quiet", "tech")]
+    text = "\n".join(bodies) if bodies else re.sub(r"(?m)^#.*$", "", md_text)
+    return [t for t in _tokens(text) if t not in STOPWORDS]
+
+
 def _keywords(md_text: str, limit: int = 5) -> list[str]:
-    words = re.findall(r"[A-Za-zА-Яа-яЁё]{4,}", md_text.lower())
-    counter = Counter(words)
+    counter = Counter(_content_terms(md_text))
     return [w for w, _ in counter.most_common(limit)]
 
 
@@ -45,6 +88,8 @@ def render_agent_comment(
     post_date: str,
     post_md: str,
     comment_href: str | None = None,
+    sections: dict[str, str] | None = None,
+    corpus: Corpus | None = None,
 ) -> str:
     """
     quiet_logos v1: агент-наблюдатель.
@@ -53,9 +98,13 @@ def render_agent_comment(
     - без "вопросов, требующих ответа"
     - без навязывания действий
     - только наблюдение формы + фиксация нитей
+
+    corpus — TF-IDF по дневнику (scripts/corpus_terms.py): тогда нити —
+    отличительные слова записи и слова, повторяющиеся в последние дни.
+    Без корпуса — самые частые слова самой записи.
     """
-    sections = _extract_sections(post_md)
-    keys = _keywords(post_md)
+    if sections is None:
+        sections = _extract_sections(post_md)
 
     quiet_len = len(sections.get("quiet", "").strip())
     tech_len = len(sections.get("tech", "").strip())
@@ -75,8 +124,17 @@ def render_agent_comment(
     else:
         observations.append("Форма записи минимальна.")
 
-    if keys:
-        observations.append("Повторяющиеся нити: " + ", ".join(keys) + ".")
+    if corpus is not None and post_date in corpus.row:
+        distinct = corpus.distinctive(post_date)
+        threads = corpus.threads(post_date)
+        if distinct:
+            observations.append("Отличительные слова: " + ", ".join(distinct) + ".")
+        if threads:
+            observations.append("Нити последних дней: " + ", ".join(threads) + ".")
+    else:
+        keys = _keywords(post_md)
+        if keys:
+            observations.append("Повторяющиеся нити: " + ", ".join(keys) + ".")
 
     obs_html = "".join(f"<p>{o}</p>" for o in observations)
 
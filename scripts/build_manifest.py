@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+import hashlib
+import json
+
+# Версия формата манифеста. При несовпадении манифест считается пустым
+# (=> полная пересборка), а не ошибкой.
+MANIFEST_VERSION = 2
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _stat(path: Path) -> list[int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+@dataclass(frozen=True)
+class PostRecord:
+    """
+    Входы, от которых зависит HTML одной записи.
+    Если все совпадают с прошлой сборкой — страницу можно не трогать.
+    """
+    md_hash: str
+    template_hash: str
+    css_href: str
+    agent_hash: str
+    # входы комментария (md_to_html._agent_keys) или KEPT / STUB_FALLBACK
+    agent_key: str
+    title: str
+
+
+class BuildManifest:
+    """
+    Персистентный манифест сборки (JSON).
+
+    posts: { "YYYY-MM-DD": PostRecord }
+    outputs: { "YYYY-MM-DD": {имя файла: [mtime_ns, size]} } — файлы, записанные сборкой;
+        если их переписал кто-то другой (например, tools/build_log.py), запись не свежая
+    index_hash: хэш содержимого ленты (даты + заголовки + css)
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.posts: dict[str, PostRecord] = {}
+        self.outputs: dict[str, dict[str, list[int]]] = {}
+        self.index_hash: str = ""
+
+    @classmethod
+    def load(cls, path: Path) -> "BuildManifest":
+        manifest = cls(path)
+        if not path.exists():
+            return manifest
+        try:
+            raw = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            # битый манифест — просто соберём всё заново
+            return manifest
+        if raw.get("version") != MANIFEST_VERSION:
+            return manifest
+
+        for post_date, rec in raw.get("posts", {}).items():
+            try:
+                manifest.posts[post_date] = PostRecord(**rec)
+            except TypeError:
+                continue
+        outputs = raw.get("outputs", {})
+        if isinstance(outputs, dict):
+            manifest.outputs = {d: o for d, o in outputs.items() if isinstance(o, dict)}
+        manifest.index_hash = str(raw.get("index_hash", ""))
+        return manifest
+
+    def get(self, post_date: str) -> PostRecord | None:
+        return self.posts.get(post_date)
+
+    def outputs_intact(self, post_date: str, outputs: list[Path]) -> bool:
+        """
+        Файлы в том же виде, в каком их оставила сборка (сверка по stat, без чтения).
+        Файл, которого не было (например, комментарий ещё не написан), должен и отсутствовать.
+        """
+        seen = self.outputs.get(post_date, {})
+        return all(path.name in seen and seen[path.name] == _stat(path) for path in outputs)
+
+    def is_fresh(self, post_date: str, record: PostRecord, outputs: list[Path]) -> bool:
+        return self.posts.get(post_date) == record and self.outputs_intact(post_date, outputs)
+
+    def is_fresh_before_agent(self, post_date: str, record: PostRecord, outputs: list[Path]) -> bool:
+        """
+        is_fresh до вызова агента: agent_hash (его результат) ещё неизвестен,
+        поэтому сверяются только входы, включая agent_key.
+        """
+        old = self.posts.get(post_date)
+        if old is None or replace(record, agent_hash=old.agent_hash) != old:
+            return False
+        return self.outputs_intact(post_date, outputs)
+
+    def update(self, post_date: str, record: PostRecord, outputs: list[Path]) -> None:
+        """Вызывается после записи outputs: запоминает их stat."""
+        self.posts[post_date] = record
+        self.outputs[post_date] = {path.name: _stat(path) for path in outputs}
+
+    def prune(self, keep: set[str]) -> None:
+        """Удаляет записи о постах, которых больше нет в docs/log."""
+        for post_date in list(self.posts):
+            if post_date not in keep:
+                del self.posts[post_date]
+                self.outputs.pop(post_date, None)
+
+    def save(self) -> None:
+        data = {
+            "version": MANIFEST_VERSION,
+            "index_hash": self.index_hash,
+            "posts": {d: asdict(r) for d, r in sorted(self.posts.items())},
+            "outputs": dict(sorted(self.outputs.items())),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        tmp.replace(self.path)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from collections import Counter
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable
+import json
+import math
+import os
+
+from scripts.agent_stub import _content_terms
+
+# Корпус дневника для нитей Аристарха.
+#
+# .cache/quiet_logos/term_counts.json — {"version", "posts": {date: {"mtime_ns", "size", "counts"}}}
+#     счётчики слов разделов quiet/tech каждой записи (agent_stub._content_terms);
+#     файл перечитывается, только если изменились mtime/размер.
+#
+# Матрица «запись × слово» хранится как CSR (indptr / indices / data), строки — записи
+# по возрастанию даты. Веса TF-IDF для всего архива считаются векторно, без цикла по записям.
+# idf записи считается только по записям до её даты включительно: новый день не меняет
+# веса (и комментарии-заглушки) уже опубликованных дней.
+
+TERM_COUNTS_VERSION = 2
+RECENT_DAYS = 14
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """
+    numpy — необязательная зависимость (без неё те же формулы считаются словарями);
+    импортируется при первом построении корпуса, а не при загрузке модуля.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, obj: object) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def refresh_term_counts(
+    md_paths: dict[str, Path],
+    cache_path: Path,
+    read: Callable[[str], str] | None = None,
+) -> dict[str, dict[str, int]]:
+    """
+    md_paths: {date: путь к .md}. Возвращает {date: {term: count}} для всех записей;
+    читаются только новые и изменённые файлы, удалённые записи выпадают из кэша.
+    read(date) — текст записи, если он уже прочитан (иначе читается файл).
+    """
+    state = _read_json(cache_path)
+    if state.get("version") != TERM_COUNTS_VERSION:
+        state = {"version": TERM_COUNTS_VERSION, "posts": {}}
+    cached: dict[str, dict] = state["posts"]
+
+    posts: dict[str, dict] = {}
+    dirty = set(cached) != set(md_paths)
+    for d, path in md_paths.items():
+        st = os.stat(path)
+        old = cached.get(d)
+        if old is not None and old["mtime_ns"] == st.st_mtime_ns and old["size"] == st.st_size:
+            posts[d] = old
+            continue
+        text = read(d) if read is not None else path.read_text(encoding="utf-8")
+        posts[d] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "counts": dict(Counter(_content_terms(text)))}
+        dirty = True
+
+    if dirty:
+        _write_json(cache_path, {"version": TERM_COUNTS_VERSION, "posts": posts})
+    return {d: rec["counts"] for d, rec in posts.items()}
+
+
+class Corpus:
+    """
+    TF-IDF по дневнику (idf — по записям до даты строки включительно).
+    distinctive(date) — слова, которыми запись отличается от более ранних записей;
+    threads(date) — слова записи, которые встречались и в предыдущие RECENT_DAYS дней.
+    """
+
+    def __init__(self, counts: dict[str, dict[str, int]]) -> None:
+        self.dates = sorted(counts)
+        self.row = {d: i for i, d in enumerate(self.dates)}
+        self.vocab = sorted({t for c in counts.values() for t in c})
+        term_id = {t: i for i, t in enumerate(self.vocab)}
+
+        indptr = [0]
+        indices: list[int] = []
+        data: list[int] = []
+        for d in self.dates:
+            for t, n in sorted(counts[d].items()):
+                indices.append(term_id[t])
+                data.append(n)
+            indptr.append(len(indices))
+
+        self.n_docs = len(self.dates)
+        self.np = np = _numpy()
+        if np is not None:
+            self.indptr = np.asarray(indptr, dtype=np.int64)
+            self.indices = np.asarray(indices, dtype=np.int64)
+            self.data = np.asarray(data, dtype=np.float64)
+            self.weights = self._tfidf_np()
+        else:
+            self.indptr, self.indices, self.data = indptr, indices, data
+            self.weights = self._tfidf_py()
+
+    # Для строки i: idf = ln((1 + N_i) / (1 + df_i)) + 1, где N_i = i + 1 записей до неё включительно,
+    # df_i — сколько из них содержат слово; tf — доля слова в записи; строки нормируются по L2
+
+    def _tfidf_np(self):
+        np = self.np
+        rows = np.repeat(np.arange(self.n_docs), np.diff(self.indptr))
+        # df_i ненулевого элемента — его номер среди элементов того же слова по возрастанию строки
+        order = np.lexsort((rows, self.indices))
+        by_term = self.indices[order]
+        starts = np.flatnonzero(np.r_[True, by_term[1:] != by_term[:-1]]) if len(order) else np.zeros(0, dtype=np.int64)
+        group_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        df = np.empty(len(order), dtype=np.float64)
+        df[order] = np.arange(len(order)) - group_start + 1
+        idf = np.log((2.0 + rows) / (1.0 + df)) + 1.0
+        lengths = np.bincount(rows, weights=self.data, minlength=self.n_docs)
+        w = self.data / np.maximum(lengths[rows], 1.0) * idf
+        norms = np.sqrt(np.bincount(rows, weights=w * w, minlength=self.n_docs))
+        return w / np.maximum(norms[rows], 1e-12)
+
+    def _tfidf_py(self) -> list[float]:
+        df: Counter[int] = Counter()
+        weights: list[float] = []
+        for i in range(self.n_docs):
+            lo, hi = self.indptr[i], self.indptr[i + 1]
+            df.update(self.indices[lo:hi])
+            length = sum(self.data[lo:hi]) or 1
+            w = [self.data[k] / length * (math.log((2.0 + i) / (1.0 + df[self.indices[k]])) + 1.0) for k in range(lo, hi)]
+            norm = math.sqrt(sum(x * x for x in w)) or 1e-12
+            weights += [x / norm for x in w]
+        return weights
+
+    def _row(self, post_date: str) -> tuple[int, int] | None:
+        i = self.row.get(post_date)
+        if i is None:
+            return None
+        return int(self.indptr[i]), int(self.indptr[i + 1])
+
+    def _top(self, terms, scores, limit: int) -> list[str]:
+        # по убыванию веса, при равенстве — по алфавиту (вывод детерминирован)
+        ranked = sorted(zip(terms, scores), key=lambda ts: (-float(ts[1]), self.vocab[int(ts[0])]))
+        return [self.vocab[int(t)] for t, _ in ranked[:limit]]
+
+    def distinctive(self, post_date: str, limit: int = 5) -> list[str]:
+        span = self._row(post_date)
+        if span is None:
+            return []
+        lo, hi = span
+        return self._top(self.indices[lo:hi], self.weights[lo:hi], limit)
+
+    def threads(self, post_date: str, *, days: int = RECENT_DAYS, limit: int = 5) -> list[str]:
+        """
+        Нити: слова записи, встречавшиеся в записях за предыдущие days дней.
+        Вес — среднее TF-IDF слова по записям окна, где оно есть, и его вес в самой записи:
+        сумма по окну тянула наверх просто частые слова. Учитываются только более ранние
+        записи, поэтому новые дни не меняют нити уже прокомментированных.
+        """
+        i = self.row.get(post_date)
+        if i is None:
+            return []
+        start = (date.fromisoformat(post_date) - timedelta(days=days)).isoformat()
+        first = i
+        while first > 0 and self.dates[first - 1] >= start:
+            first -= 1
+        if first == i:
+            return []
+
+        lo, hi = int(self.indptr[i]), int(self.indptr[i + 1])
+        wlo, whi = int(self.indptr[first]), int(self.indptr[i])
+        own = self.indices[lo:hi]
+
+        np = self.np
+        if np is not None:
+            window = np.bincount(self.indices[wlo:whi], weights=self.weights[wlo:whi], minlength=len(self.vocab))
+            hits = np.bincount(self.indices[wlo:whi], minlength=len(self.vocab))
+            seen = hits[own] > 0
+            terms = own[seen]
+            scores = (window[terms] / hits[terms] + self.weights[lo:hi][seen]) / 2
+            return self._top(terms, scores, limit)
+
+        window: dict[int, float] = {}
+        hits: Counter[int] = Counter()
+        for k in range(wlo, whi):
+            window[self.indices[k]] = window.get(self.indices[k], 0.0) + self.weights[k]
+            hits[self.indices[k]] += 1
+        pairs = [(t, (window[t] / hits[t] + self.weights[lo + j]) / 2) for j, t in enumerate(own) if t in window]
+        return self._top([t for t, _ in pairs], [s for _, s in pairs], limit)
+
+
+def load_corpus(md_paths: dict[str, Path], cache_path: Path, read: Callable[[str], str] | None = None) -> Corpus:
+    return Corpus(refresh_term_counts(md_paths, cache_path, read))
@@ -1,16 +1,34 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import json
 import os
-import subprocess
+import re
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
 from datetime import date, datetime
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
 from urllib.parse import parse_qs, urlparse
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DOCS = os.path.join(ROOT, "docs")
 LOG_DIR = os.path.join(DOCS, "log")
-MD_TO_HTML = os.path.join(ROOT, "scripts", "md_to_html.py")
+COMMENTS_DIR = os.path.join(LOG_DIR, "comments")
+
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from scripts.search_index import SearchIndex  # noqa: E402
+from scripts.static_files import StaticFileCache, serve as serve_static, write_body  # noqa: E402
+
+SEARCH = SearchIndex(Path(DOCS) / "search")
+STATIC = StaticFileCache(DOCS, max_bytes=int(os.environ.get("QUIET_LOGOS_STATIC_CACHE_MB", "32")) * 1024 * 1024)
 
 HTML_FORM = """<!doctype html>
 <html lang="ru">
@@ -33,7 +51,7 @@ HTML_FORM = """<!doctype html>
 </head>
 <body>
   <h1>quiet_logos — __TODAY__</h1>
-  <p><small>Локальная форма. Сохраняет <code>docs/log/YYYY-MM-DD.md</code>, затем запускает конвертацию и обновляет ленту.</small></p>
+  <p><small>Локальная форма. Сохраняет <code>docs/log/YYYY-MM-DD.md</code>, затем ставит пересборку сайта в фоновую очередь.</small></p>
 
   <div class="card">
     <form method="post" action="/submit">
@@ -60,7 +78,7 @@ HTML_FORM = """<!doctype html>
   </div>
 
   <p style="margin-top:16px;">
-    <small>После сохранения откроешь: <code>docs/log/index.html</code> и новую страницу записи.</small>
+    <small>Сайт целиком: <a href="/index.html">/index.html</a> · лента: <a href="/log/index.html">/log/index.html</a></small>
   </p>
 </body>
 </html>
@@ -104,8 +122,212 @@ def write_md(d: str, title: str, quiet: str, tech: str) -> str:
         f.write("\n" + _entry_block(title=title, quiet=quiet, tech=tech))
     return md_path
 
+def _comment_page_parts(post_date: str) -> tuple[str, str]:
+    """Страница комментария из md_to_html, разрезанная на «до карточки» и «после»."""
+    from scripts import md_to_html
+
+    marker = "\x00AGENT\x00"
+    page = md_to_html._wrap_comment_page(inner_html=marker, post_date=post_date)
+    head, tail = page.split(marker, 1)
+    return head, tail
+
+def persist_comment(post_date: str, fragment: str, md_hash: str | None = None, md_len: int | None = None) -> str:
+    """
+    Сохраняет готовый фрагмент в docs/log/comments/YYYY-MM-DD_aristarkh.html.
+    md_hash / md_len — версия записи, к которой написан комментарий (отмечается в каталоге).
+    """
+    from scripts import md_to_html
+
+    comment_path = os.path.join(COMMENTS_DIR, f"{post_date}_aristarkh.html")
+    page = md_to_html._wrap_comment_page(inner_html=fragment.strip(), post_date=post_date)
+    md_to_html._write_text(Path(comment_path), page)
+    if md_hash is not None:
+        md_to_html._catalog().mark_comment(post_date, md_hash, md_len)
+    return comment_path
+
+# --- Комментарии, которые пишет поток /log/comments/stream ---
+
+class StreamClaims:
+    """
+    Даты, комментарий к которым пишет поток. Форма отмечает дату сразу при сохранении:
+    фоновая сборка берёт для неё готовый комментарий (--agent-skip) и не пишет его сама,
+    иначе один и тот же комментарий оплачивался бы дважды. Поток, закончив, снимает отметку
+    и ставит пересборку; если поток так и не открыли, отметка истекает через window_s
+    и пересборка пишет комментарий сама.
+    """
+
+    def __init__(self, window_s: float) -> None:
+        self.window_s = window_s
+        self._claims: dict[str, int] = {}
+        self._next_token = 1
+        self._lock = threading.Lock()
+
+    def claim(self, post_date: str) -> None:
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+            self._claims[post_date] = token
+        timer = threading.Timer(self.window_s, self._expire, (post_date, token))
+        timer.daemon = True
+        timer.start()
+
+    def release(self, post_date: str) -> None:
+        with self._lock:
+            self._claims.pop(post_date, None)
+
+    def dates(self) -> list[str]:
+        with self._lock:
+            return sorted(self._claims)
+
+    def _expire(self, post_date: str, token: int) -> None:
+        with self._lock:
+            if self._claims.get(post_date) != token:
+                return
+            del self._claims[post_date]
+        build_queue().submit()
+
+STREAM_CLAIMS = StreamClaims(float(os.environ.get("QUIET_LOGOS_STREAM_WINDOW_S", "600")))
+
 def run_md_to_html() -> None:
-    subprocess.check_call([os.environ.get("PYTHON", "python"), MD_TO_HTML], cwd=ROOT)
+    """
+    Сборка в этом же процессе: интерпретатор и модуль markdown уже прогреты,
+    а манифест сборки пропускает неизменённые записи.
+    Комментарии дат, которые пишет поток, сборка не генерирует (StreamClaims).
+    """
+    from scripts import md_to_html
+
+    rc = md_to_html.main([arg for d in STREAM_CLAIMS.dates() for arg in ("--agent-skip", d)])
+    if rc:
+        raise RuntimeError(f"md_to_html exited with code {rc}")
+
+
+def warm_up() -> None:
+    """
+    Фоновый прогрев: md_to_html и markdown импортируются до первой отправки формы,
+    так что первая сборка не платит за холодные импорты.
+    """
+    from scripts import md_to_html
+
+    md_to_html._markdown_renderer()
+
+# --- Фоновая очередь сборок ---
+
+@dataclass
+class Build:
+    id: int
+    state: str                      # queued | running | done | failed
+    submitted_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    run_id: int | None = None       # номер фактического прогона (общий у слитых заявок)
+    coalesced: int = 1              # сколько заявок обслужил этот прогон
+    error: str = ""
+
+    def to_json(self) -> dict:
+        data = asdict(self)
+        if self.started_at is not None:
+            data["wait_s"] = round(self.started_at - self.submitted_at, 3)
+        if self.finished_at is not None and self.started_at is not None:
+            data["build_s"] = round(self.finished_at - self.started_at, 3)
+        return data
+
+class BuildQueue:
+    """
+    Заявки на пересборку копятся и после паузы debounce_s сливаются в один прогон.
+    Заявки, пришедшие во время прогона, попадают в следующий.
+    """
+
+    def __init__(self, runner: Callable[[], None], *, debounce_s: float = 1.0, history: int = 200) -> None:
+        self.runner = runner
+        self.debounce_s = debounce_s
+        self.history = history
+        self._builds: dict[int, Build] = {}
+        self._pending: list[int] = []
+        self._next_id = 1
+        self._next_run = 1
+        self._last_submit = 0.0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._worker, name="build-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self) -> int:
+        with self._cond:
+            build_id = self._next_id
+            self._next_id += 1
+            now = time.time()
+            self._builds[build_id] = Build(id=build_id, state="queued", submitted_at=now)
+            self._pending.append(build_id)
+            self._last_submit = now
+            while len(self._builds) > self.history:
+                del self._builds[min(self._builds)]
+            self._cond.notify()
+            return build_id
+
+    def status(self, build_id: int) -> dict | None:
+        with self._cond:
+            b = self._builds.get(build_id)
+            return b.to_json() if b else None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # debounce: ждём тишины после последней заявки
+                while True:
+                    left = self._last_submit + self.debounce_s - time.time()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch, self._pending = self._pending, []
+                run_id = self._next_run
+                self._next_run += 1
+                started = time.time()
+                for build_id in batch:
+                    b = self._builds.get(build_id)
+                    if b:
+                        b.state, b.started_at, b.run_id, b.coalesced = "running", started, run_id, len(batch)
+
+            state, error = "done", ""
+            try:
+                self.runner()
+            except Exception as e:
+                state, error = "failed", str(e)
+            finished = time.time()
+
+            with self._cond:
+                for build_id in batch:
+                    b = self._builds.get(build_id)
+                    if b:
+                        b.state, b.finished_at, b.error = state, finished, error
+            print(f"build run {run_id}: {state} in {finished - started:.2f}s ({len(batch)} request(s))")
+
+BUILD_QUEUE: BuildQueue | None = None
+
+def build_queue() -> BuildQueue:
+    global BUILD_QUEUE
+    if BUILD_QUEUE is None:
+        BUILD_QUEUE = BuildQueue(run_md_to_html, debounce_s=float(os.environ.get("QUIET_LOGOS_BUILD_DEBOUNCE_S", "1.0")))
+    return BUILD_QUEUE
+
+BUILD_STATUS_JS = """
+<script>
+(function () {
+  var el = document.getElementById("build-status");
+  var id = el.getAttribute("data-build");
+  function poll() {
+    fetch("/build/status?id=" + id).then(function (r) { return r.json(); }).then(function (b) {
+      var t = b.state;
+      if (b.build_s !== undefined) { t += " · " + b.build_s + " s"; }
+      if (b.error) { t += " · " + b.error; }
+      el.textContent = t;
+      if (b.state === "queued" || b.state === "running") { setTimeout(poll, 700); }
+    });
+  }
+  poll();
+})();
+</script>
+"""
 
 class Handler(BaseHTTPRequestHandler):
     def _send(self, code: int, content: str, ctype: str = "text/html; charset=utf-8") -> None:
@@ -121,8 +343,123 @@ class Handler(BaseHTTPRequestHandler):
         if parsed.path in ("/", "/write"):
             self._send(200, HTML_FORM.replace("__TODAY__", str(date.today())))
             return
+        if parsed.path == "/search":
+            q = (parse_qs(parsed.query).get("q", [""])[0]).strip()
+            t0 = time.perf_counter()
+            results = SEARCH.search(q)
+            for r in results:
+                r["url"] = f"/log/{r['date']}.html"
+            took_ms = round((time.perf_counter() - t0) * 1000, 2)
+            self._send(200, json.dumps({"q": q, "took_ms": took_ms, "results": results}, ensure_ascii=False), "application/json; charset=utf-8")
+            return
+        if parsed.path == "/build/status":
+            raw_id = (parse_qs(parsed.query).get("id", [""])[0]).strip()
+            st = build_queue().status(int(raw_id)) if raw_id.isdigit() else None
+            if st is None:
+                self._send(404, json.dumps({"error": "unknown build"}), "application/json")
+                return
+            self._send(200, json.dumps(st), "application/json")
+            return
+        # Страница лежит «внутри» log/comments/, чтобы относительные ссылки
+        # (../YYYY-MM-DD.html, ../../css/style.css) вели на реальный сайт.
+        if parsed.path == "/log/comments/stream":
+            d = (parse_qs(parsed.query).get("d", [""])[0]).strip()
+            self._stream_comment(d)
+            return
+        if self._send_static(parsed.path):
+            return
         self._send(404, "<h1>404</h1>")
 
+    def do_HEAD(self):
+        if not self._send_static(urlparse(self.path).path, head_only=True):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def _send_static(self, url_path: str, head_only: bool = False) -> bool:
+        """Файлы из docs/ (весь сайт) с ETag/Last-Modified, gzip-вариантами и Range."""
+        resp = serve_static(STATIC, url_path, self.headers, head_only=head_only)
+        if resp is None:
+            return False
+        self.send_response(resp.status)
+        for k, v in resp.headers:
+            self.send_header(k, v)
+        self.end_headers()
+        write_body(resp, self.wfile)
+        return True
+
+    def _stream_comment(self, d: str) -> None:
+        """
+        Отдаёт страницу комментария Аристарха по мере генерации (куски пишутся
+        в сокет сразу), затем сохраняет итоговый фрагмент в docs/log/comments/
+        и ставит пересборку, чтобы страница записи получила тот же комментарий.
+        Если браузер закрыл вкладку — дочитываем поток, чтобы комментарий всё равно сохранился.
+        """
+        if not DATE_RE.match(d):
+            self._send(400, "<h1>Нужна дата YYYY-MM-DD</h1>")
+            return
+        # пока поток пишет комментарий, сборки его не генерируют
+        STREAM_CLAIMS.claim(d)
+        try:
+            self._stream_comment_claimed(d)
+        finally:
+            STREAM_CLAIMS.release(d)
+            build_queue().submit()
+
+    def _stream_comment_claimed(self, d: str) -> None:
+        from scripts import md_to_html
+        from core.agents.quiet_logos.engine import AgentInput, stream_comment_html
+
+        catalog = md_to_html._catalog()
+        fresh = catalog.refresh()
+        entry = catalog.get(d)
+        if entry is None:
+            self._send(404, f"<h1>Нет записи {d}</h1>")
+            return
+
+        post_md = fresh.get(d) or catalog.md_path(d).read_text(encoding="utf-8")
+        title = entry.title
+        corpus = md_to_html.load_corpus(
+            {e.date: catalog.md_path(e.date) for e in catalog.entries()},
+            md_to_html.TERM_COUNTS_PATH,
+            read=lambda date: fresh.get(date) or catalog.md_path(date).read_text(encoding="utf-8"),
+        )
+        head, tail = _comment_page_parts(d)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        client_alive = True
+
+        def emit(text: str) -> None:
+            nonlocal client_alive
+            if not client_alive:
+                return
+            try:
+                self.wfile.write(text.encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                client_alive = False
+
+        emit(head)
+        chunks: list[str] = []
+        try:
+            inp = AgentInput(title=title, date=d, post_md=post_md, corpus=corpus, commented_len=entry.comment_md_len)
+            for delta in stream_comment_html(inp):
+                chunks.append(delta)
+                emit(delta)
+        except Exception as e:
+            emit(f"<p><em>(агент недоступен: {e})</em></p>")
+            emit(tail)
+            return
+        emit(tail)
+
+        fragment = "".join(chunks)
+        if fragment.strip():
+            persist_comment(d, fragment, md_hash=entry.md_hash, md_len=len(post_md))
+
     def do_POST(self):
         parsed = urlparse(self.path)
         if parsed.path != "/submit":
@@ -139,28 +476,37 @@ class Handler(BaseHTTPRequestHandler):
         tech = (form.get("tech", [""])[0])
 
         md_path = write_md(d, title, quiet, tech)
-        try:
-            run_md_to_html()
-        except Exception as e:
-            self._send(500, f"<h1>Ошибка конвертации</h1><pre>{e}</pre>")
-            return
+        # комментарий пишет поток по ссылке ниже, а не фоновая сборка
+        STREAM_CLAIMS.claim(d)
+        build_id = build_queue().submit()
 
         msg = f"""
-        <h1>Готово</h1>
+        <h1>Сохранено</h1>
         <p>Обновлено: <code>{md_path}</code></p>
+        <p>Сборка #{build_id}: <strong id="build-status" data-build="{build_id}">queued</strong>
+           (<a href="/build/status?id={build_id}">статус</a>)</p>
         <ul>
-          <li>Открой ленту: <code>{LOG_DIR}/index.html</code></li>
-          <li>Открой запись: <code>{LOG_DIR}/{d}.html</code></li>
+          <li>Лента: <a href="/log/index.html">/log/index.html</a></li>
+          <li>Запись: <a href="/log/{d}.html">/log/{d}.html</a> (после сборки)</li>
+          <li><a href="/log/comments/stream?d={d}">Комментарий Аристарха</a> (появляется по мере генерации)</li>
         </ul>
         <p><a href="/write">написать ещё</a></p>
+        {BUILD_STATUS_JS}
         """
         self._send(200, msg)
 
 def main() -> None:
+    from scripts import md_to_html
+
+    # .env нужен и потоковым комментариям до первой сборки
+    md_to_html._load_dotenv()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
     host = "127.0.0.1"
     port = 8008
-    httpd = HTTPServer((host, port), Handler)
+    httpd = ThreadingHTTPServer((host, port), Handler)
     print(f"quiet_logos form: http://{host}:{port}/write")
+    print(f"quiet_logos site: http://{host}:{port}/index.html")
     httpd.serve_forever()
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator, TextIO
+import filecmp
+import os
+import re
+import threading
+
+# Страницы ленты (все лежат рядом с записями в docs/log/, ссылки относительные):
+#   index.html              — самые новые записи (от 1 до page_size)
+#   page-0001.html, ...     — архивные страницы; нумерация от САМЫХ СТАРЫХ,
+#                             поэтому заполненная страница больше не меняется
+#   archive.html            — список лет
+#   archive-YYYY.html       — месяцы года
+#   archive-YYYY-MM.html    — записи месяца
+DEFAULT_PAGE_SIZE = 30
+GENERATED_RE = re.compile(r"^(page-\d{4}|archive|archive-\d{4}|archive-\d{4}-\d{2})\.html$")
+
+MONTHS_RU = (
+    "январь", "февраль", "март", "апрель", "май", "июнь",
+    "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь",
+)
+
+
+def page_size_from_env() -> int:
+    return max(1, int(os.environ.get("QUIET_LOGOS_INDEX_PAGE_SIZE", str(DEFAULT_PAGE_SIZE))))
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    date: str    # YYYY-MM-DD
+    title: str
+
+
+@dataclass
+class IndexPage:
+    filename: str
+    heading: str
+    entries: list[IndexEntry] = field(default_factory=list)        # newest first
+    links: list[tuple[str, str]] = field(default_factory=list)     # (href, label): навигация
+    sublinks: list[tuple[str, str]] = field(default_factory=list)  # (href, label): месяцы/годы
+
+
+def month_label(ym: str) -> str:
+    year, month = ym.split("-")
+    return f"{MONTHS_RU[int(month) - 1]} {year}"
+
+
+def plan_pages(entries: list[IndexEntry], page_size: int) -> list[IndexPage]:
+    """
+    entries — newest first. Возвращает все страницы ленты и архива.
+    Новая запись меняет только index.html и страницу своего месяца
+    (плюс страницу года/архива, если месяц/год новый, и одну архивную
+    страницу в момент, когда первая страница переполняется).
+    """
+    chrono = list(reversed(entries))
+    n_archived = max(0, (len(chrono) - 1) // page_size)
+
+    pages: list[IndexPage] = []
+
+    front_links = [("archive.html", "Архив по месяцам"), ("search.html", "Поиск")]
+    if n_archived:
+        front_links.insert(0, (f"page-{n_archived:04d}.html", "← более ранние записи"))
+    pages.append(IndexPage(
+        filename="index.html",
+        heading="Лента",
+        entries=list(reversed(chrono[n_archived * page_size:])),
+        links=front_links,
+    ))
+
+    for k in range(1, n_archived + 1):
+        chunk = chrono[(k - 1) * page_size:k * page_size]
+        links = [("index.html", "К свежим записям")]
+        if k > 1:
+            links.insert(0, (f"page-{k - 1:04d}.html", "← более ранние записи"))
+        pages.append(IndexPage(
+            filename=f"page-{k:04d}.html",
+            heading=f"Лента: {chunk[0].date} — {chunk[-1].date}",
+            entries=list(reversed(chunk)),
+            links=links,
+        ))
+
+    by_month: dict[str, list[IndexEntry]] = {}
+    for e in entries:
+        by_month.setdefault(e.date[:7], []).append(e)
+    by_year: dict[str, list[str]] = {}
+    for ym in sorted(by_month, reverse=True):
+        by_year.setdefault(ym[:4], []).append(ym)
+
+    pages.append(IndexPage(
+        filename="archive.html",
+        heading="Архив",
+        links=[("index.html", "Лента")],
+        sublinks=[(f"archive-{y}.html", y) for y in by_year],
+    ))
+    for year, months in by_year.items():
+        pages.append(IndexPage(
+            filename=f"archive-{year}.html",
+            heading=f"Архив: {year}",
+            links=[("archive.html", "Все годы"), ("index.html", "Лента")],
+            sublinks=[(f"archive-{ym}.html", month_label(ym)) for ym in months],
+        ))
+    for ym, month_entries in by_month.items():
+        pages.append(IndexPage(
+            filename=f"archive-{ym}.html",
+            heading=f"Архив: {month_label(ym)}",
+            entries=month_entries,
+            links=[(f"archive-{ym[:4]}.html", ym[:4]), ("index.html", "Лента")],
+        ))
+
+    return pages
+
+
+def _tmp_path(path: Path) -> Path:
+    # pid + поток: параллельные сборки/потоки не пишут в один временный файл
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def write_if_changed(path: Path, text: str) -> bool:
+    """
+    Пишет файл только если содержимое другое — неизменённые страницы сохраняют байты и mtime.
+    Запись атомарная (временный файл + rename): читатель не увидит недописанную страницу.
+    """
+    data = text.encode("utf-8")
+    try:
+        if path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(path)
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    finally:
+        # после os.replace файла уже нет; после ошибки записи — не оставляем мусор
+        tmp.unlink(missing_ok=True)
+    return True
+
+
+@dataclass
+class PendingFile:
+    file: TextIO
+    changed: bool = False
+
+
+@contextmanager
+def open_if_changed(path: Path) -> Iterator[PendingFile]:
+    """
+    Для потоковой записи:
+        with open_if_changed(path) as out:
+            out.file.write(...)
+        out.changed  # True — path заменён, False — байты те же, path не тронут
+    Пишется временный файл; исключение внутри with удаляет его, path не трогается.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(path)
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            out = PendingFile(f)
+            yield out
+        try:
+            same = path.exists() and filecmp.cmp(tmp, path, shallow=False)
+        except OSError:
+            same = False
+        if not same:
+            os.replace(tmp, path)
+            out.changed = True
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def write_pages(log_dir: Path, pages: list[IndexPage], render: Callable[[IndexPage], str]) -> list[str]:
+    """
+    Пишет страницы (только изменившиеся) и удаляет устаревшие архивные страницы
+    (например, после смены page_size). Возвращает имена записанных файлов.
+    """
+    written = [p.filename for p in pages if write_if_changed(log_dir / p.filename, render(p))]
+
+    planned = {p.filename for p in pages}
+    for path in log_dir.glob("*.html"):
+        if GENERATED_RE.match(path.name) and path.name not in planned:
+            path.unlink()
+    return written
@@ -2,13 +2,25 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import cached_property, lru_cache, partial
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable
 import argparse
 import re
 import sys
 import os
+import time
 
-import markdown as mdlib
+# Тяжёлые импорты отложены до места использования, чтобы --help, --diag,
+# --import-report и journal_server не платили за них при старте:
+#   markdown            — _markdown_renderer(), при первом рендере
+#   dotenv              — _load_dotenv(), из main() после разбора аргументов
+#   concurrent.futures  — в _build / _submit_render (тянет logging и multiprocessing)
+#   numpy               — scripts/corpus_terms.py, при построении корпуса
+if TYPE_CHECKING:
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+    from core.agents.quiet_logos.guard import AgentGuard
 
 # --- Paths (repo-root relative) ---
 REPO_ROOT = Path(__file__).resolve().parents[1]
@@ -16,67 +28,129 @@ LOG_DIR = REPO_ROOT / "docs" / "log"
 COMMENTS_DIR = LOG_DIR / "comments"
 TEMPLATE_PATH = LOG_DIR / "_template.html"
 INDEX_PATH = LOG_DIR / "index.html"
+CACHE_DIR = REPO_ROOT / ".cache" / "quiet_logos"
+MANIFEST_PATH = CACHE_DIR / "build_manifest.json"
+SEARCH_DIR = REPO_ROOT / "docs" / "search"
+SEARCH_STATE_PATH = CACHE_DIR / "search_state.json"
+TERM_COUNTS_PATH = CACHE_DIR / "term_counts.json"
+CATALOG_PATH = CACHE_DIR / "catalog.sqlite3"
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.agent_stub import _extract_sections  # noqa: E402
+from scripts.build_manifest import BuildManifest, PostRecord, sha256_text  # noqa: E402
+from scripts import profiling, search_index  # noqa: E402
+from scripts.corpus_terms import Corpus, load_corpus  # noqa: E402
+from scripts.post_catalog import PostCatalog, extract_title as _extract_title  # noqa: E402
+from scripts.log_index import IndexEntry, IndexPage, page_size_from_env, plan_pages, write_if_changed, write_pages  # noqa: E402
+from scripts.templating import Markup, Template, escape  # noqa: E402
+
 
 # --- dotenv (local secrets) ---
-# Load .env from repo root, and OVERRIDE any pre-existing environment variables.
-# This is intentional: local build should be driven by repo-local .env.
-try:
-    from dotenv import load_dotenv  # type: ignore
-    load_dotenv(dotenv_path=REPO_ROOT / ".env", override=True)
-except Exception:
-    # OK: build can run without python-dotenv or without .env
-    pass
+_DOTENV_LOADED = False
+
+
+def _load_dotenv() -> None:
+    """
+    Load .env from repo root, and OVERRIDE any pre-existing environment variables.
+    This is intentional: local build should be driven by repo-local .env.
+    Загружается один раз за процесс.
+    """
+    global _DOTENV_LOADED
+    if _DOTENV_LOADED:
+        return
+    _DOTENV_LOADED = True
+    try:
+        from dotenv import load_dotenv  # type: ignore
+        load_dotenv(dotenv_path=REPO_ROOT / ".env", override=True)
+    except Exception:
+        # OK: build can run without python-dotenv or without .env
+        pass
 
 
-# Template placeholders:
+# Template placeholders (scripts/templating.py):
 # {{TITLE}}, {{CSS_HREF}}, {{CONTENT}}
 # Agent placeholder:
 # <!--AGENT_COMMENT-->
 
 DATE_MD_RE = re.compile(r"^\d{4}-\d{2}-\d{2}\.md$")
-AGENT_BLOCK_RE = re.compile(r'(<div class="card agent">.*?</div>)', re.DOTALL)
+
+# Карточка агента на странице комментария обрамлена маркерами,
+# чтобы её можно было достать без разбора HTML.
+AGENT_BEGIN = "<!--AGENT_BEGIN-->"
+AGENT_END = "<!--AGENT_END-->"
+AGENT_CARD_START = '<div class="card agent">'
+DIV_TAG_RE = re.compile(r"<(/?)div\b", re.IGNORECASE)
+
+# agent_key в манифесте для карточек, взятых не от агента этой сборки:
+# прежний комментарий (--agent-latest-only) и заглушка вместо упавшего вызова
+AGENT_KEY_KEPT = "kept"
+AGENT_KEY_STUB_FALLBACK = "stub-fallback"
 
 
 @dataclass
 class Post:
+    """
+    Запись, разобранная один раз за сборку: файл читается при первом обращении
+    к text, заголовок, разделы quiet/tech и HTML вычисляются лениво и запоминаются.
+    Все этапы (лента, агент, рендер, поиск) берут данные отсюда.
+    """
     md_path: Path
     html_path: Path
     post_date: str   # YYYY-MM-DD
-    title: str
 
+    @cached_property
+    def text(self) -> str:
+        return _read_text(self.md_path)
 
-def _read_text(path: Path) -> str:
-    return path.read_text(encoding="utf-8")
+    @cached_property
+    def md_hash(self) -> str:
+        return sha256_text(self.text)
 
+    @cached_property
+    def title(self) -> str:
+        return _extract_title(self.text, fallback=f"quiet_logos — {self.post_date}")
 
-def _write_text(path: Path, text: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(text, encoding="utf-8")
+    @cached_property
+    def sections(self) -> dict[str, str]:
+        return _extract_sections(self.text)
 
+    @cached_property
+    def content_html(self) -> str:
+        return _render_markdown(self.text)
 
-def _extract_title(markdown_text: str, fallback: str) -> str:
-    """
-    If the first non-empty line is '# Title', use it. Otherwise fallback.
-    """
-    for line in markdown_text.splitlines():
-        s = line.strip()
-        if not s:
-            continue
-        if s.startswith("# "):
-            return s[2:].strip() or fallback
-        return fallback
-    return fallback
+
+def _read_text(path: Path) -> str:
+    return path.read_text(encoding="utf-8")
+
+
+def _write_text(path: Path, text: str) -> bool:
+    """Атомарно и только если содержимое изменилось; True — файл записан."""
+    return write_if_changed(path, text)
 
 
-def _load_template() -> str:
+def _load_template() -> Template:
     if not TEMPLATE_PATH.exists():
         raise FileNotFoundError(f"Template not found: {TEMPLATE_PATH}")
-    return _read_text(TEMPLATE_PATH)
+    return Template(_read_text(TEMPLATE_PATH))
 
 
-def _render_markdown(markdown_text: str) -> str:
-    return mdlib.markdown(
-        markdown_text,
+@lru_cache(maxsize=None)
+def _markdown_renderer() -> tuple[str, Callable[[str], str]]:
+    """
+    (имя, функция) рендера markdown. python-markdown импортируется при первом
+    вызове; если пакета нет — потоковый stdlib-рендер из tools/build_log.py.
+    """
+    try:
+        import markdown as mdlib
+    except ImportError:
+        from tools import build_log
+        print("WARN: python-markdown is not installed, using tools/build_log.py renderer", file=sys.stderr)
+        # fragment: <h1> заголовка дня и <h2> без обёрток-карточек — карточку даёт шаблон
+        return "build_log-fragment", lambda text: "".join(build_log.render_md(text.splitlines(keepends=True), fragment=True))
+    return "markdown", partial(
+        mdlib.markdown,
         extensions=[
             "fenced_code",
             "tables",
@@ -86,72 +160,204 @@ def _render_markdown(markdown_text: str) -> str:
     )
 
 
-def _wrap_comment_page(*, inner_html: str, post_date: str) -> str:
-    """
-    Делает из HTML-фрагмента (карточка агента) полноценную страницу комментария.
-    Из docs/log/comments/*.html CSS путь: ../../css/style.css
-    """
-    css_href = "../../css/style.css"
-    title = f"Aristarkh — comment — {post_date}"
+def _render_markdown(markdown_text: str) -> str:
+    return _markdown_renderer()[1](markdown_text)
 
-    return f"""<!doctype html>
+
+COMMENT_PAGE = Template(f"""<!doctype html>
 <html lang="ru">
 <head>
   <meta charset="utf-8" />
   <meta name="viewport" content="width=device-width, initial-scale=1" />
-  <title>{title}</title>
-  <link rel="stylesheet" href="{css_href}" />
+  <title>{{{{TITLE}}}}</title>
+  <link rel="stylesheet" href="{{{{CSS_HREF}}}}" />
 </head>
 <body>
   <main class="container">
     <div class="card">
       <h1>Комментарий Аристарха</h1>
       <p>
-        <a href="../{post_date}.html">К записи</a>
+        <a href="../{{{{POST_DATE}}}}.html">К записи</a>
         &nbsp;·&nbsp;
         <a href="../index.html">Лента</a>
       </p>
     </div>
 
-    {inner_html}
+    {AGENT_BEGIN}
+{{{{AGENT}}}}
+{AGENT_END}
 
   </main>
 </body>
 </html>
-"""
+""")
 
 
-def _render_agent_block(*, post_title: str, post_date: str, post_md: str) -> str:
+def _wrap_comment_page(*, inner_html: str, post_date: str) -> str:
     """
-    Вызывает scripts/agent_stub.py -> render_agent_comment().
-    Работает даже если scripts не пакет.
+    Делает из HTML-фрагмента (карточка агента) полноценную страницу комментария.
+    Из docs/log/comments/*.html CSS путь: ../../css/style.css
     """
-    root_str = str(REPO_ROOT)
-    if root_str not in sys.path:
-        sys.path.insert(0, root_str)
+    return COMMENT_PAGE.render(
+        TITLE=f"Aristarkh — comment — {post_date}",
+        CSS_HREF="../../css/style.css",
+        POST_DATE=post_date,
+        AGENT=Markup(inner_html),
+    )
 
-    try:
-        from scripts.agent_stub import render_agent_comment  # type: ignore
-        return render_agent_comment(
-            post_title=post_title,
-            post_date=post_date,
-            post_md=post_md,
-        )
-    except Exception as e:
-        return (
-            '<div class="card agent">'
-            "<p><strong>Аристарх</strong></p>"
-            f"<p><em>(агент недоступен: {e})</em></p>"
-            "</div>"
-        )
+
+def _agent_input(agent_input_cls, post: Post, corpus: Corpus | None, commented_len: int | None = None):
+    """AgentInput из уже разобранной записи: текст и разделы не читаются/не делятся повторно."""
+    return agent_input_cls(
+        title=post.title,
+        date=post.post_date,
+        post_md=post.text,
+        sections=post.sections,
+        corpus=corpus,
+        commented_len=commented_len,
+    )
+
+
+def _render_agent_block(
+    post: Post,
+    *,
+    corpus: Corpus | None = None,
+    commented_len: int | None = None,
+    guard: AgentGuard | None = None,
+) -> str:
+    """
+    Вызывает core/agents/quiet_logos/engine.py -> render_comment_html().
+    Режим (stub/real) задаётся QUIET_LOGOS_MODE (по умолчанию stub); ответы real-режима берутся
+    из content-addressed кэша, если запись, промпт и модель не менялись.
+    commented_len — длина текста, к которой уже написан комментарий: к дописанному дню
+    real-режим пишет дополнение, а не новый комментарий.
+    guard — дедлайн, повторы и предохранитель сборки (core/agents/quiet_logos/guard.py).
+    Если агент упал (сеть, таймаут, пустой ответ, предохранитель) — возвращаем stub
+    с меткой STUB_FALLBACK_MARK, чтобы одна запись не срывала всю сборку,
+    а следующий запуск заменил заглушку настоящим комментарием.
+    """
+    with profiling.current().span("agent", post=post.post_date):
+        try:
+            from core.agents.quiet_logos.engine import AgentInput, render_comment_html, render_comment_html_fallback  # type: ignore
+            from core.agents.quiet_logos.guard import AgentUnavailable  # type: ignore
+            inp = _agent_input(AgentInput, post, corpus, commented_len)
+        except Exception as e:
+            return _agent_unavailable_block(e)
+
+        try:
+            return render_comment_html(inp, guard=guard)
+        except AgentUnavailable:
+            pass  # предохранитель/дедлайн: итог печатает сборка
+        except Exception as e:
+            print(f"WARN: agent failed for {post.post_date}, using stub: {e}", file=sys.stderr)
+
+        try:
+            return render_comment_html_fallback(inp)
+        except Exception as e:
+            return _agent_unavailable_block(e)
+
+
+def _agent_unavailable_block(e: Exception) -> str:
+    return (
+        '<div class="card agent">'
+        "<p><strong>Аристарх</strong></p>"
+        f"<p><em>(агент недоступен: {e})</em></p>"
+        "</div>"
+    )
 
 
 def _extract_agent_block_from_comment_page(comment_page_html: str) -> str | None:
     """
     Достаём из полной HTML-страницы комментария только карточку агента.
+    Новые страницы содержат маркеры AGENT_BEGIN/AGENT_END; для старых
+    ищем карточку с учётом вложенных <div>.
+    """
+    begin = comment_page_html.find(AGENT_BEGIN)
+    if begin != -1:
+        end = comment_page_html.find(AGENT_END, begin)
+        if end != -1:
+            return comment_page_html[begin + len(AGENT_BEGIN):end].strip() or None
+
+    start = comment_page_html.find(AGENT_CARD_START)
+    if start == -1:
+        return None
+    depth = 0
+    for m in DIV_TAG_RE.finditer(comment_page_html, start):
+        depth += -1 if m.group(1) else 1
+        if depth == 0:
+            close = comment_page_html.find(">", m.end())
+            if close == -1:
+                return None
+            return comment_page_html[start:close + 1]
+    return None
+
+
+def _agent_block_from_cache(post: Post) -> str | None:
+    """
+    Фрагмент из кэша агента (real-режим), если запись/промпт/модель не менялись.
+    API при этом не вызывается.
+    """
+    try:
+        from core.agents.quiet_logos.engine import AgentInput, lookup_cached_comment_html  # type: ignore
+        return lookup_cached_comment_html(_agent_input(AgentInput, post, None))
+    except Exception:
+        return None
+
+
+def _run_agent_batch(posts: list[Post], wait_s: float) -> bool:
+    """
+    --agent-batch: отправляет записи без готового комментария одной batch-задачей
+    (или продолжает уже отправленную) и ждёт её не дольше wait_s. Собранные ответы
+    попадают в кэш агента, откуда сборка берёт их как обычно; остальные записи
+    сохраняют прежний комментарий до следующего запуска.
+    False — batch недоступен (stub-режим или нет ключа), сборка идёт как --agent-all.
+    """
+    from core.agents.quiet_logos.engine import real_mode_configured  # type: ignore
+
+    if not real_mode_configured():
+        print("WARN: --agent-batch needs QUIET_LOGOS_MODE=real and OPENAI_API_KEY; building as --agent-all", file=sys.stderr)
+        return False
+
+    try:
+        from core.agents.quiet_logos.batch import run_batch  # type: ignore
+        from core.agents.quiet_logos.engine import AgentInput  # type: ignore
+        report = run_batch([_agent_input(AgentInput, p, None) for p in posts], wait_s=wait_s)
+    except Exception as e:
+        print(f"WARN: agent batch failed, keeping existing comments: {e}", file=sys.stderr)
+        return True
+
+    if report.batch_id is None:
+        print("Agent batch: nothing to submit (all comments cached)")
+    elif report.pending:
+        print(f"Agent batch {report.batch_id}: {report.status}, {report.submitted} request(s); rerun with --agent-batch to collect")
+    else:
+        print(f"Agent batch {report.batch_id}: {report.status}, collected {report.collected}/{report.submitted}")
+        for post_date, err in sorted(report.failed.items()):
+            print(f"WARN: agent batch: {post_date}: {err} (will be resubmitted next run)", file=sys.stderr)
+    return True
+
+
+def _comment_path(post_date: str) -> Path:
+    return COMMENTS_DIR / f"{post_date}_aristarkh.html"
+
+
+def _agent_keys(posts: list[Post]) -> dict[str, str]:
     """
-    m = AGENT_BLOCK_RE.search(comment_page_html)
-    return m.group(1) if m else None
+    date -> ключ входов комментария; .md не читаются, хэши записей — из каталога.
+    Ключ совпал с манифестом, а страница и комментарий не тронуты — агент для записи не зовётся.
+    real: настройки агента и сама запись; stub: idf и нити заглушки считаются
+    по всем записям до даты включительно, поэтому в ключ входит цепочка их хэшей.
+    """
+    from core.agents.quiet_logos.engine import config_fingerprint, real_mode_configured  # type: ignore
+
+    fingerprint = config_fingerprint()
+    real = real_mode_configured()
+    keys: dict[str, str] = {}
+    chain = ""
+    for p in sorted(posts, key=lambda p: p.post_date):
+        chain = sha256_text(f"{chain}\t{p.post_date}\t{p.md_hash}")
+        keys[p.post_date] = sha256_text(f"{fingerprint}\t{p.post_date}\t{p.md_hash if real else chain}")
+    return keys
 
 
 def _agent_block_from_existing_comment(post_date: str) -> str | None:
@@ -159,49 +365,109 @@ def _agent_block_from_existing_comment(post_date: str) -> str | None:
     Если комментарий уже существует (docs/log/comments/YYYY-MM-DD_aristarkh.html),
     возвращаем карточку агента, чтобы не дергать API заново.
     """
-    comment_path = COMMENTS_DIR / f"{post_date}_aristarkh.html"
+    comment_path = _comment_path(post_date)
     if not comment_path.exists():
         return None
     html = _read_text(comment_path)
     return _extract_agent_block_from_comment_page(html)
 
 
+def _make_post(md_path: Path) -> Post:
+    post_date = md_path.stem
+    return Post(md_path=md_path, html_path=LOG_DIR / f"{post_date}.html", post_date=post_date)
+
+
+def _catalog() -> PostCatalog:
+    return PostCatalog(CATALOG_PATH, LOG_DIR)
+
+
 def _build_posts() -> list[Post]:
+    """
+    Записи из каталога (newest first). Каталог сверяется с docs/log по stat,
+    читаются только новые/изменённые файлы; заголовок и хэш остальных берутся из базы.
+    """
+    catalog = _catalog()
+    texts = catalog.refresh()
+
     posts: list[Post] = []
+    for e in catalog.entries():
+        p = _make_post(catalog.md_path(e.date))
+        # заполняем cached_property заранее — файл ради них не читается
+        p.__dict__.update(title=e.title, md_hash=e.md_hash)
+        if e.date in texts:
+            p.__dict__["text"] = texts[e.date]
+        posts.append(p)
+    return posts
 
-    for md_path in sorted(LOG_DIR.glob("*.md")):
-        if not DATE_MD_RE.match(md_path.name):
-            continue
 
-        post_date = md_path.stem
-        html_path = LOG_DIR / f"{post_date}.html"
+def _render_post_html(*, template: Template, post: Post, css_href: str, agent_html_inline: str) -> str:
+    prof = profiling.current()
+    with prof.span("markdown", post=post.post_date):
+        content_html = post.content_html
+    with prof.span("template", post=post.post_date):
+        return template.render(
+            TITLE=post.title,
+            CSS_HREF=css_href,
+            CONTENT=Markup(content_html),
+            AGENT_COMMENT=Markup(agent_html_inline),
+        )
 
-        md_text = _read_text(md_path)
-        title = _extract_title(md_text, fallback=f"quiet_logos — {post_date}")
-        posts.append(Post(md_path=md_path, html_path=html_path, post_date=post_date, title=title))
 
-    posts.sort(key=lambda p: p.post_date, reverse=True)  # newest first
-    return posts
+# --- Параллельный рендер (process pool) ---
+# Шаблон и css передаются в воркер один раз через initializer,
+# а не пиклятся заново с каждой задачей. При --profile воркер ведёт свой
+# профилировщик (общий origin) и возвращает события вместе с HTML.
+_POOL_TEMPLATE = Template("")
+_POOL_CSS_HREF = ""
+
+
+def _pool_init(template: Template, css_href: str, profile_origin_ns: int | None = None) -> None:
+    global _POOL_TEMPLATE, _POOL_CSS_HREF
+    _POOL_TEMPLATE = template
+    _POOL_CSS_HREF = css_href
+    if profile_origin_ns is not None:
+        profiling.enable(profile_origin_ns)
 
 
-def _render_post_html(*, template: str, post: Post, css_href: str, agent_html_inline: str) -> str:
-    md_text = _read_text(post.md_path)
-    content_html = _render_markdown(md_text)
+def _pool_render(task: tuple[Post, str]) -> tuple[str, list[dict]]:
+    post, agent_html_inline = task
+    html = _render_post_html(
+        template=_POOL_TEMPLATE,
+        post=post,
+        css_href=_POOL_CSS_HREF,
+        agent_html_inline=agent_html_inline,
+    )
+    prof = profiling.current()
+    return html, (prof.drain() if prof.enabled else [])
+
+
+def _pool_initargs(template: Template, css_href: str) -> tuple:
+    prof = profiling.current()
+    return (template, css_href, prof.origin_ns if prof.enabled else None)
 
-    page_html = template
-    page_html = page_html.replace("{{TITLE}}", post.title)
-    page_html = page_html.replace("{{CSS_HREF}}", css_href)
-    page_html = page_html.replace("{{CONTENT}}", content_html)
-    page_html = page_html.replace("<!--AGENT_COMMENT-->", agent_html_inline)
 
-    return page_html
+def _submit_render(pool: ProcessPoolExecutor | None, *, template: Template, post: Post, css_href: str, agent_html_inline: str) -> Future:
+    """
+    Без пула рендерит сразу (в текущем потоке), с пулом — ставит задачу в процесс-воркер.
+    Результат future — (html, события профилировщика воркера).
+    """
+    from concurrent.futures import Future
 
+    if pool is not None:
+        return pool.submit(_pool_render, (post, agent_html_inline))
+    fut: Future = Future()
+    fut.set_result((_render_post_html(template=template, post=post, css_href=css_href, agent_html_inline=agent_html_inline), []))
+    return fut
 
-def _render_log_index(posts: list[Post], css_href: str) -> str:
-    items = []
-    for p in posts:
-        items.append(f'<li><a href="{p.post_date}.html">{p.post_date} — {p.title}</a></li>')
+
+def _render_index_page(page: IndexPage, css_href: str) -> str:
+    items = [
+        f'<li><a href="{e.date}.html">{e.date} — {escape(e.title)}</a></li>'
+        for e in page.entries
+    ]
+    items += [f'<li><a href="{href}">{escape(label)}</a></li>' for href, label in page.sublinks]
     items_html = "\n      ".join(items) if items else "<li><em>Пока нет записей.</em></li>"
+    nav_html = " · ".join(f'<a href="{href}">{escape(label)}</a>' for href, label in page.links)
 
     return f"""<!doctype html>
 <html lang="ru">
@@ -219,10 +485,11 @@ def _render_log_index(posts: list[Post], css_href: str) -> str:
     </div>
 
     <div class="card">
-      <h2>Лента</h2>
+      <h2>{escape(page.heading)}</h2>
       <ul>
       {items_html}
       </ul>
+      <p>{nav_html}</p>
     </div>
   </main>
 </body>
@@ -230,13 +497,81 @@ def _render_log_index(posts: list[Post], css_href: str) -> str:
 """
 
 
-def main() -> int:
+def _write_log_index(posts: list[Post], css_href: str) -> list[str]:
+    """Лента по страницам + архив по годам/месяцам; пишутся только изменившиеся файлы."""
+    entries = [IndexEntry(date=p.post_date, title=p.title) for p in posts]
+    pages = plan_pages(entries, page_size_from_env())
+    return write_pages(LOG_DIR, pages, lambda page: _render_index_page(page, css_href))
+
+
+def _index_hash(posts: list[Post], css_href: str) -> str:
+    lines = [css_href, str(page_size_from_env())] + [f"{p.post_date}\t{p.title}" for p in posts]
+    return sha256_text("\n".join(lines))
+
+
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Build quiet_logos site from markdown.")
     mode = parser.add_mutually_exclusive_group()
     mode.add_argument("--agent-latest-only", action="store_true", help="Regenerate agent comment only for the newest post.")
-    mode.add_argument("--agent-all", action="store_true", help="Regenerate agent comments for ALL posts.")
+    mode.add_argument(
+        "--agent-all",
+        action="store_true",
+        help="Regenerate agent comments for ALL posts (posts unchanged since the last build are skipped; real-mode answers come from the comment cache).",
+    )
+    mode.add_argument(
+        "--agent-batch",
+        action="store_true",
+        help="Regenerate agent comments for ALL posts through one Batch API job (resumable; results land on a later run).",
+    )
+    parser.add_argument(
+        "--agent-skip",
+        action="append",
+        default=[],
+        metavar="DATE",
+        help="Keep the current comment for DATE: it is being written elsewhere (journal_server's stream). Repeatable.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignore the build manifest and rebuild every page (real-mode agent answers still come from the comment cache).",
+    )
+    parser.add_argument("--jobs", type=int, default=1, metavar="N", help="Render posts in N processes (0 = all CPU cores).")
+    parser.add_argument(
+        "--agent-concurrency",
+        type=int,
+        default=int(os.environ.get("QUIET_LOGOS_AGENT_CONCURRENCY", "4")),
+        metavar="N",
+        help="Max agent requests in flight at once (default: QUIET_LOGOS_AGENT_CONCURRENCY or 4).",
+    )
+    parser.add_argument(
+        "--batch-wait",
+        type=float,
+        default=0.0,
+        metavar="SEC",
+        help="With --agent-batch: poll the job for up to SEC seconds before building (default: check once).",
+    )
+    parser.add_argument("--watch", action="store_true", help="Keep running and rebuild posts as docs/log changes.")
+    parser.add_argument("--interval", type=float, default=0.3, metavar="SEC", help="Polling interval for --watch.")
     parser.add_argument("--diag", action="store_true", help="Print diagnostic environment info (mode/key).")
-    args = parser.parse_args()
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=str(CACHE_DIR / "build_trace.json"),
+        default=None,
+        metavar="TRACE_JSON",
+        help="Time stages and posts; write a Chrome trace (default: .cache/quiet_logos/build_trace.json).",
+    )
+    parser.add_argument("--profile-top", type=int, default=10, metavar="N", help="Slowest posts to list with --profile.")
+    parser.add_argument("--import-report", action="store_true", help="Print an import-time summary (-X importtime) and exit.")
+    args = parser.parse_args(argv)
+
+    if args.import_report:
+        print(profiling.import_time_report("scripts.md_to_html", cwd=REPO_ROOT))
+        return 0
+
+    _load_dotenv()
+    if args.profile:
+        profiling.enable()
 
     if args.diag:
         print("DIAG: QUIET_LOGOS_MODE =", os.getenv("QUIET_LOGOS_MODE"))
@@ -246,52 +581,314 @@ def main() -> int:
         print(f"ERROR: log dir not found: {LOG_DIR}")
         return 2
 
+    if args.watch:
+        return _watch(args)
+    return _build(args)
+
+
+def _stat_snapshot() -> dict[Path, tuple[int, int]]:
+    """(mtime_ns, size) для записей и шаблона — дёшево, без чтения файлов."""
+    snap: dict[Path, tuple[int, int]] = {}
+    with os.scandir(LOG_DIR) as it:
+        for entry in it:
+            if DATE_MD_RE.match(entry.name) or entry.name == TEMPLATE_PATH.name:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                snap[Path(entry.path)] = (st.st_mtime_ns, st.st_size)
+    return snap
+
+
+def _watch(args: argparse.Namespace) -> int:
+    """
+    Опрос docs/log по stat-кэшу. Изменённая запись -> пересборка только её и ленты;
+    изменённый _template.html -> полная пересборка. Интерпретатор и markdown остаются прогретыми.
+    """
+    rc = _build(args)
+    if rc:
+        return rc
+    args.force = False
+
+    snap = _stat_snapshot()
+    print(f"Watching {LOG_DIR.relative_to(REPO_ROOT)} (Ctrl+C to stop)")
+
+    try:
+        while True:
+            time.sleep(args.interval)
+            current = _stat_snapshot()
+            if current == snap:
+                continue
+            changed = {path for path in current.keys() | snap.keys() if current.get(path) != snap.get(path)}
+            snap = current
+
+            t0 = time.perf_counter()
+            # каталог сам дочитает изменённые записи; остальные берутся из базы без чтения файлов
+            if TEMPLATE_PATH in changed:
+                print("Watch: template changed -> full rebuild")
+                _build(args)
+            else:
+                _build(args, posts=_build_posts(), only={path.stem for path in changed})
+            print(f"Watch: done in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    except KeyboardInterrupt:
+        return 0
+
+
+def _build(args: argparse.Namespace, *, posts: list[Post] | None = None, only: set[str] | None = None) -> int:
+    """
+    Одна сборка. posts — готовый список записей (newest first), иначе читаем docs/log.
+    only — даты, которые нужно пересобрать; остальные записи нужны только для ленты.
+    """
+    from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+    prof = profiling.current()
     template = _load_template()
-    posts = _build_posts()
+    if posts is None:
+        with prof.span("discovery"):
+            posts = _build_posts()
     if not posts:
         print("No posts found in docs/log/*.md")
-        _write_text(INDEX_PATH, _render_log_index(posts=[], css_href="../css/style.css"))
+        _write_log_index(posts=[], css_href="../css/style.css")
         return 0
 
+    # комментарий этих дат пишет кто-то другой — сборка берёт готовый и не зовёт агента
+    agent_skip = set(args.agent_skip)
+
     # default: in GitHub Actions => latest only; locally => all (меньше сюрпризов)
+    agent_batch = False
     if args.agent_latest_only:
         agent_latest_only = True
     elif args.agent_all:
         agent_latest_only = False
+    elif args.agent_batch:
+        # batch недоступен -> как --agent-all
+        agent_batch = _run_agent_batch([p for p in posts if p.post_date not in agent_skip], args.batch_wait)
+        agent_latest_only = agent_batch
     else:
         agent_latest_only = (("GITHUB_ACTIONS" in os.environ) and (os.environ.get("GITHUB_ACTIONS") == "true"))
 
     COMMENTS_DIR.mkdir(parents=True, exist_ok=True)
 
+    # --force: начинаем с пустого манифеста, но в конце всё равно сохраняем его
+    manifest = BuildManifest(MANIFEST_PATH) if args.force else BuildManifest.load(MANIFEST_PATH)
+    template_hash = sha256_text(template.source)
+    if _markdown_renderer()[0] != "markdown":
+        # запасной рендер даёт другой HTML — страницы из манифеста не считаются свежими
+        template_hash = sha256_text(template.source + "\0" + _markdown_renderer()[0])
+
     css_href_posts = "../css/style.css"
     newest_date = posts[0].post_date
 
-    for p in posts:
-        md_text = _read_text(p.md_path)
+    catalog = _catalog()
+    commented_len = {e.date: e.comment_md_len for e in catalog.entries()}
+
+    from core.agents.quiet_logos.engine import is_stub_fallback, real_mode_configured  # type: ignore
+    from core.agents.quiet_logos.guard import AgentGuard  # type: ignore
+
+    guard = AgentGuard.from_env()
+    # заглушки, поставленные вместо упавших вызовов, пересобираются при следующем real-запуске
+    upgrade_stubs = real_mode_configured() and not agent_batch
+    stub_fallbacks = 0
+
+    # счётчики слов всех записей (читаются только изменённые файлы) — для нитей заглушки
+    by_date = {p.post_date: p for p in posts}
+    with prof.span("corpus"):
+        corpus = load_corpus({d: p.md_path for d, p in by_date.items()}, TERM_COUNTS_PATH, read=lambda d: by_date[d].text)
+
+    agent_keys = _agent_keys(posts)
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    agent_concurrency = max(1, args.agent_concurrency)
+
+    skipped = 0
+    comments_regenerated = 0
+    pages_written = 0
+    index_written: list[str] = []
+    # date -> (post, record, future с HTML) — что реально перерендеривается
+    renders: dict[str, tuple[Post, PostRecord, Future]] = {}
 
-        regen_this = (not agent_latest_only) or (p.post_date == newest_date)
+    render_pool = None
+    if jobs > 1:
+        render_pool = ProcessPoolExecutor(max_workers=jobs, initializer=_pool_init, initargs=_pool_initargs(template, css_href_posts))
 
-        if regen_this:
-            agent_block = _render_agent_block(post_title=p.title, post_date=p.post_date, post_md=md_text)
+    def write_comment(p: Post, agent_block: str) -> None:
+        nonlocal comments_regenerated
+        comment_path = _comment_path(p.post_date)
+        with prof.span("comment", post=p.post_date):
             comment_page = _wrap_comment_page(inner_html=agent_block, post_date=p.post_date)
-            comment_path = COMMENTS_DIR / f"{p.post_date}_aristarkh.html"
-            _write_text(comment_path, comment_page)
-            print(f"OK: comment regenerated: {comment_path.relative_to(REPO_ROOT)}")
-        else:
-            agent_block = _agent_block_from_existing_comment(p.post_date) or (
-                '<div class="card agent">'
-                "<p><strong>Аристарх</strong></p>"
-                "<p><em>(Комментарий сохранён ранее; пересборка только для последней записи.)</em></p>"
-                "</div>"
-            )
+            if _write_text(comment_path, comment_page):
+                comments_regenerated += 1
+                print(f"OK: comment regenerated: {comment_path.relative_to(REPO_ROOT)}")
+            catalog.mark_comment(p.post_date, p.md_hash, len(p.text))
+
+    def record_for(p: Post, agent_key: str, agent_block: str = "") -> PostRecord:
+        return PostRecord(
+            md_hash=p.md_hash,
+            template_hash=template_hash,
+            css_href=css_href_posts,
+            agent_hash=sha256_text(agent_block),
+            agent_key=agent_key,
+            title=p.title,
+        )
 
-        html = _render_post_html(template=template, post=p, css_href=css_href_posts, agent_html_inline=agent_block)
-        _write_text(p.html_path, html)
-        print(f"OK: {p.md_path.name} -> {p.html_path.name}")
+    def fresh_before_agent(p: Post, regen: bool) -> bool:
+        """
+        Входы записи и агента те же, страница и комментарий не тронуты — агент не нужен.
+        Прежний комментарий (не regen) годится любой, кроме заглушки, которую пора заменить.
+        """
+        if regen:
+            key = agent_keys[p.post_date]
+        else:
+            old = manifest.get(p.post_date)
+            key = old.agent_key if old is not None else AGENT_KEY_KEPT
+            if upgrade_stubs and key == AGENT_KEY_STUB_FALLBACK:
+                return False
+        return manifest.is_fresh_before_agent(p.post_date, record_for(p, key), [p.html_path, _comment_path(p.post_date)])
+
+    def schedule(p: Post, agent_block: str, agent_key: str) -> None:
+        nonlocal skipped
+        if is_stub_fallback(agent_block):
+            agent_key = AGENT_KEY_STUB_FALLBACK
+        record = record_for(p, agent_key, agent_block)
+        if manifest.is_fresh(p.post_date, record, [p.html_path, _comment_path(p.post_date)]):
+            skipped += 1
+            return
+        fut = _submit_render(render_pool, template=template, post=p, css_href=css_href_posts, agent_html_inline=agent_block)
+        renders[p.post_date] = (p, record, fut)
 
-    _write_text(INDEX_PATH, _render_log_index(posts=posts, css_href=css_href_posts))
-    print("Updated: docs/log/index.html")
+    try:
+        # Запросы к агенту идут в потоках (I/O-bound, не более agent_concurrency одновременно),
+        # а записи с готовой карточкой рендерятся, пока запросы ещё в полёте.
+        with prof.span("agents+render"), ThreadPoolExecutor(max_workers=agent_concurrency, thread_name_prefix="agent") as agent_pool:
+            agent_futures: dict[Future, Post] = {}
+
+            for p in posts:
+                if only is not None and p.post_date not in only:
+                    continue
+
+                regen_this = ((not agent_latest_only) or (p.post_date == newest_date and not agent_batch)) and p.post_date not in agent_skip
+                # ответ batch-задачи — тот же комментарий агента, что и при regen
+                if fresh_before_agent(p, regen_this or (agent_batch and p.post_date not in agent_skip)):
+                    skipped += 1
+                    continue
+
+                if regen_this:
+                    # Неизменённая запись не уходит в API повторно: engine отдаёт фрагмент из кэша.
+                    fut = agent_pool.submit(_render_agent_block, p, corpus=corpus, commented_len=commented_len.get(p.post_date), guard=guard)
+                    agent_futures[fut] = p
+                    continue
+
+                cached = _agent_block_from_cache(p)
+                if agent_batch and cached:
+                    # ответ batch-задачи (в т.ч. собранный до падения прошлой сборки)
+                    agent_block = cached.strip()
+                    write_comment(p, agent_block)
+                    schedule(p, agent_block, agent_keys[p.post_date])
+                    continue
+                note = (
+                    "Комментарий пишется; страница обновится, когда он будет готов."
+                    if p.post_date in agent_skip
+                    else "Комментарий сохранён ранее; пересборка только для последней записи."
+                )
+                agent_block = (cached.strip() if cached else None) or _agent_block_from_existing_comment(p.post_date) or (
+                    '<div class="card agent">'
+                    "<p><strong>Аристарх</strong></p>"
+                    f"<p><em>({note})</em></p>"
+                    "</div>"
+                )
+                if upgrade_stubs and is_stub_fallback(agent_block) and p.post_date not in agent_skip:
+                    fut = agent_pool.submit(_render_agent_block, p, corpus=corpus, commented_len=commented_len.get(p.post_date), guard=guard)
+                    agent_futures[fut] = p
+                    continue
+                schedule(p, agent_block, AGENT_KEY_KEPT)
+
+            for fut in as_completed(agent_futures):
+                p = agent_futures[fut]
+                # strip(): тот же вид, что и при извлечении из готовой страницы комментария,
+                # иначе хэш агент-блока «плавал» бы между сборками
+                agent_block = fut.result().strip()
+                stub_fallbacks += is_stub_fallback(agent_block)
+                write_comment(p, agent_block)
+                schedule(p, agent_block, agent_keys[p.post_date])
+
+        # Пишем в исходном порядке (newest first), независимо от порядка завершения.
+        with prof.span("write_posts"):
+            for p in posts:
+                if p.post_date not in renders:
+                    continue
+                _, record, fut = renders[p.post_date]
+                html, worker_events = fut.result()
+                prof.extend(worker_events)
+                with prof.span("write", post=p.post_date):
+                    changed = _write_text(p.html_path, html)
+                manifest.update(p.post_date, record, [p.html_path, _comment_path(p.post_date)])
+                if changed:
+                    pages_written += 1
+                    print(f"OK: {p.md_path.name} -> {p.html_path.name}")
+                else:
+                    print(f"Unchanged: {p.html_path.name}")
+    finally:
+        if render_pool is not None:
+            render_pool.shutdown()
+    rebuilt = len(renders)
+
+    with prof.span("index"):
+        index_hash = _index_hash(posts, css_href_posts)
+        if args.force or index_hash != manifest.index_hash or not INDEX_PATH.exists():
+            index_written = _write_log_index(posts=posts, css_href=css_href_posts)
+            manifest.index_hash = index_hash
+            print(f"Updated index pages: {', '.join(index_written) if index_written else 'none changed'}")
+        else:
+            print("Unchanged: docs/log/index.html")
+
+    with prof.span("search_index"):
+        # тексты только уже прочитанных записей (изменённые по каталогу и пересобранные);
+        # остальные индекс сверяет по хэшу из каталога и дочитывает, лишь если его копия устарела
+        shards = search_index.update_index(
+            out_dir=SEARCH_DIR,
+            state_path=SEARCH_STATE_PATH,
+            changed={p.post_date: (p.title, p.md_hash, p.text) for p in posts if "text" in p.__dict__},
+            current={p.post_date: (p.title, p.md_hash) for p in posts},
+            read=lambda d: (by_date[d].title, by_date[d].md_hash, by_date[d].text),
+        )
+    if shards:
+        print(f"Updated search index: {shards} file(s)")
+
+    with prof.span("manifest"):
+        manifest.prune({p.post_date for p in posts})
+        manifest.save()
+
+    print(f"Summary: rebuilt {rebuilt}, skipped {skipped}, comments regenerated {comments_regenerated}")
+    # search: шарды + docs.json
+    files_written = pages_written + comments_regenerated + len(index_written) + shards
+    print(f"Files written: {files_written}")
+    if stub_fallbacks or guard.retried:
+        reason = f"; {guard.open_reason}" if guard.open_reason else ""
+        print(f"Agent: {guard.retried} retried request(s), {stub_fallbacks} comment(s) fell back to the stub{reason}")
+        if stub_fallbacks:
+            print("Agent: stub fallbacks are marked and will be upgraded on the next real-mode build")
+    provider_mod = sys.modules.get("core.agents.quiet_logos.provider_openai")
+    if provider_mod is not None:
+        stats = provider_mod.pool_stats()
+        if stats["opened"]:
+            print(f"Agent HTTP: connections opened {stats['opened']}, reused {stats['reused']}")
+    ratelimit_mod = sys.modules.get("core.agents.quiet_logos.ratelimit")
+    if ratelimit_mod is not None:
+        rstats = ratelimit_mod.limiter_stats()
+        if rstats["waited_s"] or rstats["throttled"]:
+            print(f"Agent rate limit: waited {rstats['waited_s']:.1f}s, throttled (429) {rstats['throttled']} time(s)")
+    compact_mod = sys.modules.get("core.agents.quiet_logos.compact")
+    if compact_mod is not None:
+        cstats = compact_mod.compaction_stats()
+        if cstats["calls"]:
+            print(
+                f"Agent input: {cstats['calls']} request(s), ~{cstats['tokens_sent']} tokens sent, "
+                f"~{cstats['tokens_saved']} saved by compaction/delta comments ({cstats['compacted']} request(s))"
+            )
 
+    if prof.enabled:
+        profiling.report(prof, Path(args.profile), args.profile_top)
+        prof.drain()  # в --watch каждая сборка — свой trace
     return 0
 
 
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import os
+import re
+import sqlite3
+
+from scripts.agent_stub import _extract_sections, _keywords, _tokens
+from scripts.build_manifest import sha256_text
+
+# Каталог записей дневника: .cache/quiet_logos/catalog.sqlite3
+#
+# posts — одна строка на docs/log/YYYY-MM-DD.md:
+#     date, mtime_ns, size    — по ним refresh() понимает, что файл не менялся (без чтения)
+#     md_hash, title, words, quiet_chars, tech_chars, keywords (JSON-список)
+#     comment_status          — none | current | stale: есть ли комментарий Аристарха
+#                               и написан ли он к текущей версии записи (comment_md_hash)
+#     comment_md_len          — длина текста записи, к которой написан комментарий:
+#                               дописанные позже записи дня комментируются дополнением
+#
+# Сборка, лента, journal_server и engine берут список записей и заголовки отсюда,
+# а не сканируют и не читают docs/log целиком.
+
+CATALOG_VERSION = 2
+DATE_MD_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.md$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS posts (
+    date            TEXT PRIMARY KEY,
+    mtime_ns        INTEGER NOT NULL,
+    size            INTEGER NOT NULL,
+    md_hash         TEXT NOT NULL,
+    title           TEXT NOT NULL,
+    words           INTEGER NOT NULL,
+    quiet_chars     INTEGER NOT NULL,
+    tech_chars      INTEGER NOT NULL,
+    keywords        TEXT NOT NULL,
+    comment_status  TEXT NOT NULL DEFAULT 'none',
+    comment_md_hash TEXT,
+    comment_md_len  INTEGER
+);
+"""
+
+
+def extract_title(markdown_text: str, fallback: str) -> str:
+    """
+    If the first non-empty line is '# Title', use it. Otherwise fallback.
+    """
+    for line in markdown_text.splitlines():
+        s = line.strip()
+        if not s:
+            continue
+        if s.startswith("# "):
+            return s[2:].strip() or fallback
+        return fallback
+    return fallback
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    date: str
+    md_hash: str
+    title: str
+    words: int
+    quiet_chars: int
+    tech_chars: int
+    keywords: tuple[str, ...]
+    comment_status: str
+    comment_md_len: int | None = None
+
+
+class PostCatalog:
+    """
+    Соединение открывается на каждую операцию: объект можно держать в потоках
+    journal_server без общего sqlite3.Connection.
+    """
+
+    def __init__(self, db_path: Path, log_dir: Path) -> None:
+        self.db_path = db_path
+        self.log_dir = log_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.executescript(SCHEMA)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != str(CATALOG_VERSION):
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS posts")
+                conn.executescript(SCHEMA)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(CATALOG_VERSION),))
+        return conn
+
+    def md_path(self, date: str) -> Path:
+        return self.log_dir / f"{date}.md"
+
+    def refresh(self) -> dict[str, str]:
+        """
+        Сверяет каталог с docs/log по stat (mtime/размер): новые и изменённые файлы
+        читаются и разбираются, удалённые — убираются. Возвращает {date: текст}
+        прочитанных файлов, чтобы вызывающий не читал их второй раз.
+        """
+        on_disk: dict[str, os.stat_result] = {}
+        with os.scandir(self.log_dir) as it:
+            for entry in it:
+                m = DATE_MD_RE.match(entry.name)
+                if m and entry.is_file():
+                    on_disk[m.group(1)] = entry.stat()
+
+        texts: dict[str, str] = {}
+        with closing(self._connect()) as conn, conn:
+            known = {
+                d: (mtime_ns, size, md_hash, status, comment_hash, comment_len)
+                for d, mtime_ns, size, md_hash, status, comment_hash, comment_len in conn.execute(
+                    "SELECT date, mtime_ns, size, md_hash, comment_status, comment_md_hash, comment_md_len FROM posts"
+                )
+            }
+            gone = [(d,) for d in known if d not in on_disk]
+            if gone:
+                conn.executemany("DELETE FROM posts WHERE date = ?", gone)
+
+            for d, st in on_disk.items():
+                old = known.get(d)
+                if old is not None and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+                    continue
+                text = self.md_path(d).read_text(encoding="utf-8")
+                texts[d] = text
+                md_hash = sha256_text(text)
+                if old is not None and old[2] == md_hash:
+                    conn.execute("UPDATE posts SET mtime_ns = ?, size = ? WHERE date = ?", (st.st_mtime_ns, st.st_size, d))
+                    continue
+
+                if old is None:
+                    has_comment = (self.log_dir / "comments" / f"{d}_aristarkh.html").exists()
+                    status, comment_hash, comment_len = ("stale" if has_comment else "none"), None, None
+                else:
+                    comment_hash, comment_len = old[4], old[5]
+                    status = "none" if old[3] == "none" else ("current" if comment_hash == md_hash else "stale")
+
+                sections = _extract_sections(text)
+                conn.execute(
+                    "INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        d, st.st_mtime_ns, st.st_size, md_hash,
+                        extract_title(text, fallback=f"quiet_logos — {d}"),
+                        len(_tokens(text)),
+                        len(sections.get("quiet", "").strip()),
+                        len(sections.get("tech", "").strip()),
+                        json.dumps(_keywords(text), ensure_ascii=False),
+                        status, comment_hash, comment_len,
+                    ),
+                )
+        return texts
+
+    def entries(self) -> list[CatalogEntry]:
+        """Все записи, newest first."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT date, md_hash, title, words, quiet_chars, tech_chars, keywords, comment_status, comment_md_len "
+                "FROM posts ORDER BY date DESC"
+            ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def get(self, date: str) -> CatalogEntry | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT date, md_hash, title, words, quiet_chars, tech_chars, keywords, comment_status, comment_md_len "
+                "FROM posts WHERE date = ?",
+                (date,),
+            ).fetchone()
+        return _entry(row) if row else None
+
+    def mark_comment(self, date: str, md_hash: str, md_len: int | None = None) -> None:
+        """Комментарий Аристарха записан для версии записи md_hash (длиной md_len символов)."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE posts SET comment_md_hash = ?, comment_md_len = ?, "
+                "comment_status = CASE WHEN md_hash = ? THEN 'current' ELSE 'stale' END WHERE date = ?",
+                (md_hash, md_len, md_hash, date),
+            )
+
+
+def _entry(row: tuple) -> CatalogEntry:
+    d, md_hash, title, words, quiet_chars, tech_chars, keywords, status, comment_len = row
+    return CatalogEntry(
+        date=d,
+        md_hash=md_hash,
+        title=title,
+        words=words,
+        quiet_chars=quiet_chars,
+        tech_chars=tech_chars,
+        keywords=tuple(json.loads(keywords)),
+        comment_status=status,
+        comment_md_len=comment_len,
+    )
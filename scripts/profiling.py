@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from contextlib import nullcontext
+from pathlib import Path
+from typing import ContextManager
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Профилирование сборки (--profile): интервалы этапов и записей
+# в формате Chrome trace events ("ph": "X"), файл открывается в
+# chrome://tracing или https://ui.perfetto.dev.
+#
+# Без --profile активен NullProfiler: span() возвращает один и тот же
+# nullcontext, так что обёртки в коде сборки почти ничего не стоят.
+
+
+class NullProfiler:
+    enabled = False
+    _NULL = nullcontext()
+
+    def span(self, name: str, cat: str = "build", **args: object) -> ContextManager:
+        return self._NULL
+
+    def extend(self, events: list[dict]) -> None:
+        pass
+
+
+class _Span:
+    __slots__ = ("prof", "name", "cat", "args", "start")
+
+    def __init__(self, prof: "Profiler", name: str, cat: str, args: dict) -> None:
+        self.prof = prof
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        end = time.perf_counter_ns()
+        self.prof._add({
+            "name": self.name,
+            "cat": self.cat,
+            "ph": "X",
+            "ts": (self.start - self.prof.origin_ns) / 1000,
+            "dur": (end - self.start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.args,
+        })
+
+
+class Profiler:
+    """
+    Собирает интервалы из любых потоков. Воркеры process pool ведут свой Profiler
+    с тем же origin_ns и возвращают события, родитель добавляет их через extend().
+    """
+
+    enabled = True
+
+    def __init__(self, origin_ns: int | None = None) -> None:
+        # perf_counter на Linux монотонный и общий для процессов машины
+        self.origin_ns = time.perf_counter_ns() if origin_ns is None else origin_ns
+        self.events: list[dict] = []
+        self._lock = threading.Lock()
+
+    def _add(self, event: dict) -> None:
+        with self._lock:
+            self.events.append(event)
+
+    def span(self, name: str, cat: str = "build", **args: object) -> _Span:
+        return _Span(self, name, cat, args)
+
+    def extend(self, events: list[dict]) -> None:
+        with self._lock:
+            self.events.extend(events)
+
+    def drain(self) -> list[dict]:
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def write_trace(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False), encoding="utf-8")
+
+    def post_table(self, top: int = 10) -> str:
+        """Самые медленные записи: сумма интервалов с args.post по категориям."""
+        per_post: dict[str, dict[str, float]] = {}
+        with self._lock:
+            events = list(self.events)
+        for ev in events:
+            post = ev["args"].get("post")
+            if post is None:
+                continue
+            row = per_post.setdefault(post, {})
+            row[ev["name"]] = row.get(ev["name"], 0.0) + ev["dur"] / 1000
+
+        if not per_post:
+            return "profile: no per-post spans"
+        names = sorted({n for row in per_post.values() for n in row})
+        ranked = sorted(per_post.items(), key=lambda kv: -sum(kv[1].values()))[:top]
+
+        lines = [f"{'post':<12} " + " ".join(f"{n:>10}" for n in names) + f" {'total ms':>10}"]
+        for post, row in ranked:
+            cells = " ".join(f"{row.get(n, 0.0):>10.1f}" for n in names)
+            lines.append(f"{post:<12} {cells} {sum(row.values()):>10.1f}")
+        return "\n".join(lines)
+
+    def stage_table(self) -> str:
+        """Этапы сборки (интервалы без args.post) по убыванию длительности."""
+        with self._lock:
+            stages = [ev for ev in self.events if "post" not in ev["args"]]
+        stages.sort(key=lambda ev: -ev["dur"])
+        return "\n".join(f"{ev['name']:<16} {ev['dur'] / 1000:>10.1f} ms" for ev in stages)
+
+
+_current: NullProfiler | Profiler = NullProfiler()
+
+
+def current() -> NullProfiler | Profiler:
+    return _current
+
+
+def enable(origin_ns: int | None = None) -> Profiler:
+    global _current
+    _current = Profiler(origin_ns)
+    return _current
+
+
+def report(prof: Profiler, trace_path: Path, top: int) -> None:
+    """Пишет trace и печатает этапы и top-N медленных записей."""
+    prof.write_trace(trace_path)
+    print("Profile: stages")
+    print(prof.stage_table())
+    print(f"Profile: slowest posts (top {top})")
+    print(prof.post_table(top))
+    print(f"Profile: trace written to {trace_path}")
+
+
+def import_time_report(module: str, *, cwd: Path, top: int = 15) -> str:
+    """
+    Сводка `python -X importtime -c "import module"` в свежем интерпретаторе:
+    общее время и модули верхнего уровня с наибольшим накопленным временем.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    # строки идут в порядке завершения импорта: сначала вложенные (отступ +2 на уровень),
+    # потом сам модуль; прямые импорты module — строки уровня 1 перед его строкой
+    total_us: int | None = None
+    children: list[tuple[int, int, str]] = []  # (cumulative us, self us, name)
+    direct: list[tuple[int, int, str]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level == 1:
+            children.append((int(cumulative_us), int(self_us), name.strip()))
+        elif level == 0:
+            if name.strip() == module:
+                total_us, direct = int(cumulative_us), children
+                break
+            children = []
+    if proc.returncode != 0 or total_us is None:
+        return f"import report failed:\n{proc.stderr.strip()}"
+    direct.sort(reverse=True)
+
+    lines = [f"import {module}: {total_us / 1000:.1f} ms total"]
+    lines.append(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative_us, self_us, name in direct[:top]:
+        lines.append(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+    return "\n".join(lines)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from collections import Counter
+from pathlib import Path
+from typing import Callable
+import json
+import math
+import os
+import threading
+
+from scripts.agent_stub import _tokens
+from scripts.log_index import write_if_changed
+
+# Инвертированный индекс дневника для поиска.
+#
+# docs/search/docs.json        — {"version", "n_shards", "docs": {id: [date, title, length]}}
+# docs/search/shards/sNN.json  — {term: [gap, tf, gap, tf, ...]}
+#     постинг-листы: id документов по возрастанию, записаны разностями (delta)
+#     шард = shard_of(term) по первым двум буквам, статической странице
+#     нужно скачать только шарды слов из запроса
+#
+# .cache/quiet_logos/search_state.json — что уже проиндексировано:
+#     {date: {"id", "hash", "terms": {term: tf}}}; по нему обновление
+#     затрагивает только шарды слов изменённых записей.
+
+INDEX_VERSION = 1
+N_SHARDS = 64
+
+
+def shard_of(term: str) -> int:
+    """Номер шарда по префиксу из двух букв (та же формула в docs/log/search.html)."""
+    a = ord(term[0])
+    b = ord(term[1]) if len(term) > 1 else 0
+    return (a * 31 + b) % N_SHARDS
+
+
+def _shard_name(n: int) -> str:
+    return f"s{n:02d}.json"
+
+
+def encode_postings(postings: dict[int, int]) -> list[int]:
+    out: list[int] = []
+    prev = 0
+    for doc_id in sorted(postings):
+        out += [doc_id - prev, postings[doc_id]]
+        prev = doc_id
+    return out
+
+
+def decode_postings(flat: list[int]) -> dict[int, int]:
+    postings: dict[int, int] = {}
+    doc_id = 0
+    for i in range(0, len(flat), 2):
+        doc_id += flat[i]
+        postings[doc_id] = flat[i + 1]
+    return postings
+
+
+def _write_json(path: Path, obj: object) -> bool:
+    return write_if_changed(path, json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True))
+
+
+def _read_json(path: Path, default: dict) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return default
+
+
+def update_index(
+    *,
+    out_dir: Path,
+    state_path: Path,
+    changed: dict[str, tuple[str, str, str]],
+    current: dict[str, tuple[str, str]],
+    read: Callable[[str], tuple[str, str, str]] | None = None,
+) -> int:
+    """
+    changed: {date: (title, content_hash, text)} — записи, уже прочитанные в этой сборке
+    current: {date: (title, content_hash)} — все записи сейчас (например, из каталога);
+        остальные даты из индекса удаляются
+    read: date -> (title, content_hash, text) для записей вне changed, которых нет в индексе
+        или чей хэш/заголовок в индексе устарел (в т.ч. все записи при сбросе состояния)
+    Возвращает число перезаписанных файлов в out_dir (шарды и docs.json; одинаковые байты не пишутся).
+
+    Состояние сброшено (новая версия, нет/битый search_state.json, нет docs.json) —
+    id раздаются заново, поэтому старые шарды не читаются: индекс строится с нуля,
+    а шарды, в которые не попало ни одного слова, удаляются.
+    """
+    state = _read_json(state_path, {})
+    reset = state.get("version") != INDEX_VERSION or not isinstance(state.get("docs"), dict) or not (out_dir / "docs.json").exists()
+    if reset:
+        state = {"version": INDEX_VERSION, "next_id": 1, "docs": {}}
+    docs_state: dict[str, dict] = state["docs"]
+    if read is not None:
+        stale = [
+            d for d, (title, content_hash) in current.items()
+            if d not in changed and (d not in docs_state or docs_state[d]["hash"] != content_hash or docs_state[d].get("title") != title)
+        ]
+        changed = {**{d: read(d) for d in stale}, **changed}
+
+    # doc_id -> {term: tf | None}: None = удалить постинг
+    delta: dict[str, dict[int, int | None]] = {}
+    titles_changed = False
+
+    for date in [d for d in docs_state if d not in current]:
+        old = docs_state.pop(date)
+        for term in old["terms"]:
+            delta.setdefault(term, {})[old["id"]] = None
+        titles_changed = True
+
+    for date, (title, content_hash, text) in changed.items():
+        old = docs_state.get(date)
+        if old is not None and old["hash"] == content_hash and old.get("title") == title:
+            continue
+        terms = dict(Counter(_tokens(text)))
+        if old is None:
+            doc_id = state["next_id"]
+            state["next_id"] += 1
+        else:
+            doc_id = old["id"]
+            for term in old["terms"]:
+                if term not in terms:
+                    delta.setdefault(term, {})[doc_id] = None
+        for term, tf in terms.items():
+            delta.setdefault(term, {})[doc_id] = tf
+        docs_state[date] = {"id": doc_id, "hash": content_hash, "title": title, "terms": terms}
+        titles_changed = True
+
+    if not delta and not titles_changed and not reset:
+        return 0
+
+    by_shard: dict[int, list[str]] = {}
+    for term in delta:
+        by_shard.setdefault(shard_of(term), []).append(term)
+
+    shards_dir = out_dir / "shards"
+    written = 0
+    for n, terms in by_shard.items():
+        path = shards_dir / _shard_name(n)
+        shard = {} if reset else _read_json(path, {})
+        for term in terms:
+            postings = decode_postings(shard.get(term, []))
+            for doc_id, tf in delta[term].items():
+                if tf is None:
+                    postings.pop(doc_id, None)
+                else:
+                    postings[doc_id] = tf
+            if postings:
+                shard[term] = encode_postings(postings)
+            else:
+                shard.pop(term, None)
+        written += _write_json(path, shard)
+    if reset and shards_dir.is_dir():
+        keep = {_shard_name(n) for n in by_shard}
+        for stale in shards_dir.glob("s*.json"):
+            if stale.name not in keep:
+                stale.unlink()
+
+    written += _write_json(out_dir / "docs.json", {
+        "version": INDEX_VERSION,
+        "n_shards": N_SHARDS,
+        "docs": {
+            str(d["id"]): [date, d["title"], sum(d["terms"].values())]
+            for date, d in sorted(docs_state.items())
+        },
+    })
+    _write_json(state_path, state)
+    return written
+
+
+class SearchIndex:
+    """
+    Читатель индекса для journal_server: шарды читаются и разбираются один раз
+    (только шарды слов из запроса); кэш сбрасывается, если файл шарда поменялся (mtime).
+    Ранжирование — BM25 по найденным словам.
+    """
+
+    def __init__(self, out_dir: Path) -> None:
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._docs: tuple[int, dict] | None = None
+        self._shards: dict[int, tuple[int, dict]] = {}
+
+    def _load(self, path: Path) -> tuple[int, dict]:
+        """(mtime_ns, JSON); mtime берётся с открытого файла — он же и читается."""
+        with open(path, "rb") as f:
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+            data = f.read()
+        return mtime, (json.loads(data) if data else {})
+
+    def _cached(self, path: Path, slot: tuple[int, dict] | None) -> tuple[int, dict]:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return 0, {}
+        if slot is not None and slot[0] == mtime:
+            return slot
+        try:
+            return self._load(path)
+        except (OSError, ValueError):
+            return 0, {}
+
+    def _docs_table(self) -> dict:
+        with self._lock:
+            self._docs = self._cached(self.out_dir / "docs.json", self._docs)
+            return self._docs[1].get("docs", {})
+
+    def _shard(self, n: int) -> dict:
+        with self._lock:
+            slot = self._cached(self.out_dir / "shards" / _shard_name(n), self._shards.get(n))
+            self._shards[n] = slot
+            return slot[1]
+
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        docs = self._docs_table()
+        terms = list(dict.fromkeys(_tokens(query)))
+        if not docs or not terms:
+            return []
+
+        n_docs = len(docs)
+        avg_len = (sum(d[2] for d in docs.values()) / n_docs) or 1.0
+        k1, b = 1.2, 0.75
+
+        scores: dict[int, float] = {}
+        for term in terms:
+            flat = self._shard(shard_of(term)).get(term)
+            if not flat:
+                continue
+            postings = decode_postings(flat)
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                doc = docs.get(str(doc_id))
+                if doc is None:
+                    continue
+                norm = tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc[2] / avg_len))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], -kv[0]))[:limit]
+        return [
+            {"date": docs[str(i)][0], "title": docs[str(i)][1], "score": round(score, 4)}
+            for i, score in ranked
+        ]
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import BinaryIO
+from urllib.parse import unquote
+import mimetypes
+import os
+import re
+import threading
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_BYTES = 64 * 1024
+
+
+@dataclass(frozen=True)
+class StaticFile:
+    path: str
+    data: bytes | None  # None — файл больше max_file_bytes, отдаётся с диска потоком
+    size: int
+    mtime_ns: int
+    etag: str
+    last_modified: str
+    content_type: str
+
+
+@dataclass
+class StaticResponse:
+    status: int
+    headers: list[tuple[str, str]]
+    body: bytes
+    # (путь, смещение, длина) — тело читается с диска при отправке (write_body)
+    stream: tuple[str, int, int] | None = None
+
+
+class StaticFileCache:
+    """
+    LRU-кэш байтов файлов под root. Запись считается устаревшей,
+    если у файла изменились mtime или размер (проверяется stat на каждом запросе).
+    Файлы больше max_file_bytes не читаются в память: отдаются с диска кусками.
+    """
+
+    def __init__(self, root: str, *, max_bytes: int = 32 * 1024 * 1024, max_file_bytes: int = 4 * 1024 * 1024) -> None:
+        self.root = os.path.realpath(root)
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._items: OrderedDict[str, StaticFile] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, url_path: str) -> str | None:
+        """URL-путь (percent-encoded) -> файл внутри root (или None). Каталог -> его index.html."""
+        rel = unquote(url_path.split("?", 1)[0]).lstrip("/")
+        if "\0" in rel:
+            return None
+        full = os.path.realpath(os.path.join(self.root, rel))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            return None
+        if os.path.isdir(full):
+            full = os.path.join(full, "index.html")
+        return full if os.path.isfile(full) else None
+
+    def load(self, path: str) -> StaticFile | None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            item = self._items.get(path)
+            if item is not None and item.mtime_ns == st.st_mtime_ns and item.size == st.st_size:
+                self._items.move_to_end(path)
+                self.hits += 1
+                return item
+            self.misses += 1
+
+        data = None
+        if st.st_size <= self.max_file_bytes:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None
+
+        ctype = mimetypes.guess_type(path[:-3] if path.endswith(".gz") else path)[0] or "application/octet-stream"
+        if ctype.startswith("text/") or ctype in ("application/javascript", "application/json"):
+            ctype += "; charset=utf-8"
+        item = StaticFile(
+            path=path,
+            data=data,
+            size=st.st_size,
+            mtime_ns=st.st_mtime_ns,
+            etag=f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+            last_modified=formatdate(st.st_mtime, usegmt=True),
+            content_type=ctype,
+        )
+
+        if data is not None:
+            with self._lock:
+                old = self._items.pop(path, None)
+                if old is not None:
+                    self._size -= old.size
+                self._items[path] = item
+                self._size += item.size
+                while self._size > self.max_bytes and self._items:
+                    _, evicted = self._items.popitem(last=False)
+                    self._size -= evicted.size
+        return item
+
+
+def _gzip_etag(etag: str) -> str:
+    """Свой ETag у gzip-варианта: тело другое, чем у identity."""
+    return etag[:-1] + '-gz"'
+
+
+def _not_modified(item: StaticFile, etag: str, headers) -> bool:
+    inm = headers.get("If-None-Match")
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    ims = headers.get("If-Modified-Since")
+    if ims:
+        try:
+            return int(item.mtime_ns // 1_000_000_000) <= int(parsedate_to_datetime(ims).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(value: str, size: int) -> tuple[int, int] | None:
+    """
+    Один диапазон bytes=a-b / a- / -n -> (start, end включительно), end обрезан по size.
+    None — заголовок неразборчив (RFC 9110: игнорируется, ответ 200). Разборчивый, но
+    невыполнимый диапазон даёт start > end или start >= size (ответ 416).
+    """
+    m = RANGE_RE.match(value.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if not m.group(1):
+        n = int(m.group(2))
+        return (max(0, size - n), size - 1) if n else (size, size - 1)
+    start = int(m.group(1))
+    if m.group(2) and int(m.group(2)) < start:
+        return None
+    end = int(m.group(2)) if m.group(2) else size - 1
+    return start, min(end, size - 1)
+
+
+def _body(item: StaticFile, start: int, length: int, head_only: bool) -> tuple[bytes, tuple[str, int, int] | None]:
+    if head_only or length == 0:
+        return b"", None
+    if item.data is None:
+        return b"", (item.path, start, length)
+    return item.data[start:start + length], None
+
+
+def write_body(resp: StaticResponse, out: BinaryIO) -> None:
+    """Пишет тело ответа в out; большие файлы — с диска кусками по CHUNK_BYTES."""
+    if resp.body:
+        out.write(resp.body)
+    if resp.stream is None:
+        return
+    path, offset, length = resp.stream
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(CHUNK_BYTES, length))
+            if not chunk:
+                break
+            out.write(chunk)
+            length -= len(chunk)
+
+
+def serve(cache: StaticFileCache, url_path: str, headers, *, head_only: bool = False) -> StaticResponse | None:
+    """
+    Готовит ответ для файла из root: 200 / 206 / 304 / 416.
+    None — такого файла нет (решение о 404 за вызывающим).
+    Если рядом лежит file.gz и клиент принимает gzip — отдаётся он (со своим ETag).
+    Тело файлов больше max_file_bytes не читается здесь: его пишет write_body().
+    """
+    path = cache.resolve(url_path)
+    if path is None:
+        return None
+    item = cache.load(path)
+    if item is None:
+        return None
+
+    body_item = item
+    etag = item.etag
+    encoding = None
+    if "gzip" in headers.get("Accept-Encoding", "") and not headers.get("Range"):
+        gz = cache.load(path + ".gz") if os.path.isfile(path + ".gz") else None
+        if gz is not None and gz.mtime_ns >= item.mtime_ns:
+            body_item, etag, encoding = gz, _gzip_etag(item.etag), "gzip"
+
+    base_headers = [
+        ("ETag", etag),
+        ("Last-Modified", item.last_modified),
+        ("Cache-Control", "no-cache"),
+        ("Accept-Ranges", "bytes"),
+        ("Vary", "Accept-Encoding"),
+    ]
+
+    if _not_modified(item, etag, headers):
+        return StaticResponse(304, base_headers, b"")
+
+    out_headers = [("Content-Type", item.content_type)] + base_headers
+    if encoding:
+        out_headers.append(("Content-Encoding", encoding))
+
+    size = body_item.size
+    range_header = headers.get("Range")
+    if range_header and encoding is None:
+        if_range = headers.get("If-Range")
+        rng = _parse_range(range_header, size)
+        if rng is not None and (not if_range or if_range.strip() in (item.etag, item.last_modified)):
+            start, end = rng
+            if start >= size or end < start:
+                return StaticResponse(416, out_headers + [("Content-Range", f"bytes */{size}")], b"")
+            length = end - start + 1
+            out_headers += [("Content-Range", f"bytes {start}-{end}/{size}"), ("Content-Length", str(length))]
+            body, stream = _body(body_item, start, length, head_only)
+            return StaticResponse(206, out_headers, body, stream)
+
+    out_headers.append(("Content-Length", str(size)))
+    body, stream = _body(body_item, 0, size, head_only)
+    return StaticResponse(200, out_headers, body, stream)
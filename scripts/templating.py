@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable, Iterator
+import html
+import re
+
+# Слоты шаблона:
+#   {{NAME}} / {{ name }}   — значение экранируется, если это не Markup
+#   <!--AGENT_COMMENT-->    — «слот-комментарий» (только имена из COMMENT_SLOTS),
+#                             чтобы шаблон оставался валидным HTML без подстановки
+COMMENT_SLOTS = frozenset({"AGENT_COMMENT"})
+SLOT_RE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}|<!--([A-Z_]+)-->")
+
+
+class Markup(str):
+    """Готовый HTML: вставляется в слот как есть, без экранирования."""
+
+
+class MarkupStream:
+    """
+    Готовый HTML, который ещё генерируется: куски отдаются в render_iter
+    по мере готовности, страница целиком в памяти не собирается.
+    """
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self.chunks = chunks
+
+
+def escape(value: object) -> str:
+    if isinstance(value, Markup):
+        return value
+    return html.escape(str(value), quote=True)
+
+
+class Template:
+    """
+    Шаблон, разобранный один раз на литералы и слоты.
+    render() собирает страницу одним join, значения в шаблоне повторно не сканируются.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        # чётные индексы — литералы, нечётные — имена слотов
+        self.segments: list[str] = []
+        pos = 0
+        for m in SLOT_RE.finditer(source):
+            name = m.group(1) or m.group(2)
+            if m.group(2) and name not in COMMENT_SLOTS:
+                continue
+            self.segments.append(source[pos:m.start()])
+            self.segments.append(name)
+            pos = m.end()
+        self.segments.append(source[pos:])
+
+    @classmethod
+    def from_path(cls, path: Path) -> "Template":
+        return cls(path.read_text(encoding="utf-8"))
+
+    @property
+    def slots(self) -> set[str]:
+        return set(self.segments[1::2])
+
+    def render_iter(self, **values: object) -> Iterator[str]:
+        """Куски готовой страницы по порядку; удобно для записи в файл потоком."""
+        for i, seg in enumerate(self.segments):
+            if i % 2 == 0:
+                if seg:
+                    yield seg
+                continue
+            try:
+                value = values[seg]
+            except KeyError:
+                raise KeyError(f"Template slot not provided: {seg}") from None
+            if isinstance(value, MarkupStream):
+                yield from value.chunks
+                continue
+            yield escape(value)
+
+    def render(self, **values: object) -> str:
+        return "".join(self.render_iter(**values))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Общая обвязка тестов агента: локальный стенд tools/dev/fake_openai.py в этом же процессе
+# и окружение, которое направляет провайдер на него (real-режим, без прокси).
+
+from __future__ import annotations
+
+from pathlib import Path
+from unittest import mock
+import os
+import sys
+import threading
+import unittest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from tools.dev import fake_openai  # noqa: E402
+
+PROXY_VARS = ("http_proxy", "https_proxy", "all_proxy", "no_proxy")
+
+
+def without_proxies(env: dict[str, str]) -> dict[str, str]:
+    """Окружение без *_PROXY в любом регистре: urllib.request.getproxies() читает оба."""
+    return {k: v for k, v in env.items() if k.lower() not in PROXY_VARS}
+
+
+class FakeClock:
+    """
+    Часы для параметров clock/sleep (guard.AgentGuard, ratelimit.RateLimiter):
+    sleep не ждёт, а запоминает паузу и (advance_on_sleep) сдвигает время.
+    """
+
+    def __init__(self, start: float = 1000.0, *, advance_on_sleep: bool = True) -> None:
+        self.now = start
+        self.advance_on_sleep = advance_on_sleep
+        self.sleeps: list[float] = []
+        self._lock = threading.Lock()
+
+    def __call__(self) -> float:
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds: float) -> None:
+        with self._lock:
+            self.sleeps.append(seconds)
+            if self.advance_on_sleep:
+                self.now += seconds
+
+    def advance(self, seconds: float) -> None:
+        with self._lock:
+            self.now += seconds
+
+
+class StandTest(unittest.TestCase):
+    """
+    setUp поднимает стенд на свободном порту (параметры make_server — server_options)
+    и подменяет окружение: OPENAI_BASE_URL на стенд, ключ, QUIET_LOGOS_MODE=real.
+    Порт у каждого теста свой, поэтому и пул соединений, и ограничитель провайдера — свои.
+    """
+
+    server_options: dict = {}
+    env: dict[str, str] = {}
+
+    def setUp(self) -> None:
+        fake_openai.reset_state()
+        self.httpd = fake_openai.make_server(port=0, **self.server_options)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.addCleanup(self.httpd.server_close)
+        self.addCleanup(self.httpd.shutdown)
+        self.port = self.httpd.server_address[1]
+
+        env = mock.patch.dict(os.environ, clear=True, values={
+            **without_proxies(dict(os.environ)),
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{self.port}/v1",
+            "OPENAI_API_KEY": "test",
+            "QUIET_LOGOS_MODE": "real",
+            **self.env,
+        })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def stand_stats(self) -> dict:
+        with fake_openai._STATS_LOCK:
+            return dict(fake_openai.STATS)
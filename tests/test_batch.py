@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Пакетная пересборка комментариев (core/agents/quiet_logos/batch.py) против локального
+# стенда tools/dev/fake_openai.py, запущенного в том же процессе.
+#
+# Запуск:
+#   python -m unittest tests.test_batch      (или python -m pytest tests)
+
+from __future__ import annotations
+
+from pathlib import Path
+from unittest import mock
+import sys
+import tempfile
+import unittest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from core.agents.quiet_logos import batch  # noqa: E402
+from core.agents.quiet_logos.comment_cache import CommentCache  # noqa: E402
+from core.agents.quiet_logos.engine import AgentInput  # noqa: E402
+from core.agents.quiet_logos.provider_openai import OpenAIProvider  # noqa: E402
+from tests.stand import StandTest  # noqa: E402
+from tools.dev import fake_openai  # noqa: E402
+
+
+def _inputs(n: int) -> list[AgentInput]:
+    return [
+        AgentInput(
+            title=f"запись {i}",
+            date=f"2025-01-{i:02d}",
+            post_md=f"# запись {i}\n\n## quiet\n\nтишина номер {i}\n\n## tech\n\nсборка {i}\n",
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+class BatchTest(StandTest):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_path = Path(tmp.name) / "batch_state.json"
+        self.cache = CommentCache(Path(tmp.name) / "agent")
+
+    def run_batch(self, inputs: list[AgentInput], wait_s: float = 5.0) -> batch.BatchReport:
+        return batch.run_batch(inputs, wait_s=wait_s, poll_s=0.05, state_path=self.state_path, cache=self.cache)
+
+    def batch_object(self, batch_id: str) -> dict:
+        return fake_openai.BATCHES[batch_id]
+
+
+class SubmitTest(BatchTest):
+    def test_submit_collects_into_cache(self) -> None:
+        report = self.run_batch(_inputs(3))
+        self.assertEqual(report.status, "completed")
+        self.assertEqual((report.submitted, report.collected, report.failed), (3, 3, {}))
+        self.assertFalse(self.state_path.exists())
+
+        # всё в кэше — отправлять нечего
+        again = self.run_batch(_inputs(3))
+        self.assertEqual((again.status, again.batch_id, again.submitted), ("idle", None, 0))
+
+
+class PendingTest(BatchTest):
+    server_options = {"batch_delay_s": 0.3}
+
+    def test_pending_job_is_resumed_not_resubmitted(self) -> None:
+        first = self.run_batch(_inputs(2), wait_s=0)
+        self.assertTrue(first.pending)
+        self.assertTrue(self.state_path.exists())
+
+        # незавершённая задача продолжается, новые inputs не отправляются
+        second = self.run_batch(_inputs(5))
+        self.assertEqual(second.batch_id, first.batch_id)
+        self.assertEqual((second.status, second.submitted, second.collected), ("completed", 2, 2))
+
+    def test_resume_after_crash_between_upload_and_create(self) -> None:
+        files_before = len(fake_openai.FILES)
+        with mock.patch.object(OpenAIProvider, "create_batch", side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                self.run_batch(_inputs(2))
+        self.assertEqual(len(fake_openai.FILES), files_before + 1)
+        self.assertTrue(self.state_path.exists())
+
+        report = self.run_batch(_inputs(2))
+        # файл не загружается повторно, задача создаётся из уже загруженного
+        self.assertEqual((report.status, report.submitted, report.collected), ("completed", 2, 2))
+        uploaded = list(fake_openai.FILES)[files_before]
+        self.assertEqual(self.batch_object(report.batch_id)["input_file_id"], uploaded)
+
+
+class PartialFailureTest(BatchTest):
+    server_options = {"batch_fail_every": 2}
+
+    def test_failed_lines_are_resubmitted(self) -> None:
+        report = self.run_batch(_inputs(4))
+        self.assertEqual((report.status, report.collected), ("completed", 2))
+        self.assertEqual(sorted(report.failed), ["2025-01-02", "2025-01-04"])
+        self.assertIn("stand-in failure", report.failed["2025-01-02"])
+
+        # следующая задача — только неудавшиеся записи
+        retry = self.run_batch(_inputs(4))
+        self.assertEqual(retry.submitted, 2)
+
+
+class TerminalTest(BatchTest):
+    server_options = {"batch_delay_s": 60.0}
+
+    def test_cancelled_batch_keeps_finished_results(self) -> None:
+        pending = self.run_batch(_inputs(4), wait_s=0)
+        OpenAIProvider().cancel_batch(pending.batch_id)
+
+        report = self.run_batch([])
+        self.assertEqual((report.status, report.collected), ("cancelled", 2))
+        self.assertEqual(len(report.failed), 2)
+        self.assertFalse(self.state_path.exists())
+
+    def test_expired_batch_keeps_finished_results(self) -> None:
+        pending = self.run_batch(_inputs(3), wait_s=0)
+        obj = self.batch_object(pending.batch_id)
+        with fake_openai._STATS_LOCK:
+            fake_openai._run_batch(obj, fail_every=0, limit=1)
+            obj["status"] = "expired"
+
+        report = self.run_batch([])
+        self.assertEqual((report.status, report.collected), ("expired", 1))
+        self.assertEqual(sorted(report.failed), ["2025-01-02", "2025-01-03"])
+        self.assertIn("expired", report.failed["2025-01-02"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# Дедлайн, повторы и предохранитель сборки (core/agents/quiet_logos/guard.py) против
+# локального стенда tools/dev/fake_openai.py в режимах --fail-first / --fail-status.
+# Время — FakeClock: паузы между повторами не ждутся, а запоминаются.
+#
+# Запуск:
+#   python -m unittest tests.test_guard      (или python -m pytest tests)
+
+from __future__ import annotations
+
+from pathlib import Path
+from unittest import mock
+import sys
+import tempfile
+import unittest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from core.agents.quiet_logos import comment_cache  # noqa: E402
+from core.agents.quiet_logos.engine import STUB_FALLBACK_MARK, is_stub_fallback  # noqa: E402
+from core.agents.quiet_logos.guard import AgentGuard, AgentUnavailable  # noqa: E402
+from core.agents.quiet_logos.provider_openai import OpenAIProvider, OpenAIProviderError  # noqa: E402
+from scripts import md_to_html  # noqa: E402
+from tests.stand import FakeClock, StandTest  # noqa: E402
+
+POST_MD = "# quiet_logos — 2025-01-01\n\n## quiet\n\nтишина над рекой\n\n## tech\n\nсборка сайта\n"
+
+
+class GuardTest(StandTest):
+    guard_options: dict = {}
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.clock = FakeClock()
+        self.guard = AgentGuard(**{
+            "deadline_s": 600,
+            "retries": 2,
+            "backoff_s": 0.5,
+            "breaker_failures": 3,
+            "breaker_cooldown_s": 30,
+            **self.guard_options,
+            "clock": self.clock,
+            "sleep": self.clock.sleep,
+        })
+        self.provider = OpenAIProvider()
+
+    def call(self) -> str:
+        return self.guard.call(
+            lambda timeout_s: self.provider.generate_html_fragment(
+                system_prompt="prompt",
+                user_text="TITLE: запись\nDATE: 2025-01-01\nPOST_MD:\nтекст\n",
+                timeout_s=timeout_s,
+            ),
+            timeout_s=self.provider.timeout_s,
+        )
+
+    def responses(self) -> int:
+        return self.stand_stats().get("responses", 0)
+
+
+class RetryTest(GuardTest):
+    server_options = {"fail_first": 2, "fail_status": 503}
+
+    def test_transient_errors_are_retried_with_jittered_backoff(self) -> None:
+        self.assertIn("Аристарх", self.call())
+        self.assertEqual((self.responses(), self.guard.retried), (3, 2))
+        # equal jitter: половина задержки фиксирована — [base/2, base], base = 0.5 * 2**attempt
+        first, second = self.clock.sleeps
+        self.assertTrue(0.25 <= first <= 0.5, first)
+        self.assertTrue(0.5 <= second <= 1.0, second)
+        self.assertEqual((self.guard.state, self.guard.consecutive_failures), ("closed", 0))
+
+    def test_retries_are_bounded(self) -> None:
+        self.guard.retries = 1
+        with self.assertRaises(OpenAIProviderError) as ctx:
+            self.call()
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual((self.responses(), self.guard.consecutive_failures), (2, 1))
+
+
+class ThrottledTest(GuardTest):
+    server_options = {"fail_first": 1, "fail_status": 429}
+
+    def test_429_is_retried(self) -> None:
+        self.assertIn("Аристарх", self.call())
+        self.assertEqual((self.responses(), self.guard.retried), (2, 1))
+
+
+class PermanentErrorTest(GuardTest):
+    server_options = {"fail_first": 1, "fail_status": 400}
+
+    def test_non_transient_error_is_not_retried(self) -> None:
+        with self.assertRaises(OpenAIProviderError) as ctx:
+            self.call()
+        self.assertEqual(ctx.exception.status, 400)
+        self.assertEqual((self.responses(), self.guard.retried, self.clock.sleeps), (1, 0, []))
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_retry_waits_at_least_retry_after(self) -> None:
+        clock = FakeClock()
+        guard = AgentGuard(deadline_s=600, backoff_s=0.5, clock=clock, sleep=clock.sleep)
+        errors = [OpenAIProviderError("429", status=429, transient=True, retry_after=5.0)]
+
+        def fn(timeout_s: float) -> str:
+            if errors:
+                raise errors.pop()
+            return "ok"
+
+        self.assertEqual(guard.call(fn, timeout_s=45), "ok")
+        self.assertEqual(clock.sleeps, [5.0])
+
+
+class BreakerTest(GuardTest):
+    server_options = {"fail_first": 3, "fail_status": 503}
+    guard_options = {"retries": 0}
+
+    def trip(self) -> None:
+        for _ in range(3):
+            with self.assertRaises(OpenAIProviderError):
+                self.call()
+        self.assertEqual(self.guard.state, "open")
+        self.assertIn("3 consecutive failures", self.guard.open_reason)
+
+    def test_open_breaker_skips_the_network(self) -> None:
+        self.trip()
+        with self.assertRaises(AgentUnavailable):
+            self.call()
+        self.assertEqual(self.responses(), 3)
+
+    def test_half_open_probe_closes_the_breaker(self) -> None:
+        self.trip()
+        self.clock.advance(29)
+        with self.assertRaises(AgentUnavailable):
+            self.call()
+
+        self.clock.advance(1)
+        self.assertIn("Аристарх", self.call())
+        self.assertEqual((self.guard.state, self.guard.open_reason), ("closed", None))
+        self.call()
+        self.assertEqual(self.responses(), 5)
+
+    def test_only_one_probe_at_a_time(self) -> None:
+        self.trip()
+        self.clock.advance(30)
+        seen: list[str] = []
+
+        def probe(timeout_s: float) -> str:
+            seen.append(self.guard.state)
+            # пока идёт проба, остальные вызовы получают отказ
+            with self.assertRaises(AgentUnavailable):
+                self.guard.call(lambda t: "second", timeout_s=45)
+            return "probe"
+
+        self.assertEqual(self.guard.call(probe, timeout_s=45), "probe")
+        self.assertEqual((seen, self.guard.state), (["half-open"], "closed"))
+
+
+class FailedProbeTest(GuardTest):
+    server_options = {"fail_first": 4, "fail_status": 503}
+    guard_options = {"retries": 0}
+
+    def test_failed_probe_reopens_without_retries(self) -> None:
+        for _ in range(3):
+            with self.assertRaises(OpenAIProviderError):
+                self.call()
+        self.guard.retries = 2
+        self.clock.advance(30)
+
+        with self.assertRaises(OpenAIProviderError):
+            self.call()
+        # проба — одна попытка, несмотря на retries
+        self.assertEqual((self.responses(), self.guard.retried), (4, 0))
+        self.assertEqual(self.guard.state, "open")
+        self.assertIn("failed probe", self.guard.open_reason)
+
+        # новое окно отсчитывается от неудачной пробы
+        self.clock.advance(29)
+        with self.assertRaises(AgentUnavailable):
+            self.call()
+        self.clock.advance(1)
+        self.call()
+        self.assertEqual(self.guard.state, "closed")
+
+
+class DeadlineTest(GuardTest):
+    guard_options = {"deadline_s": 10}
+
+    def test_timeout_is_capped_by_the_deadline(self) -> None:
+        timeouts: list[float] = []
+        self.clock.advance(7)
+        self.guard.call(lambda t: timeouts.append(t), timeout_s=45)
+        self.assertEqual(timeouts, [3.0])
+
+    def test_no_calls_after_the_deadline(self) -> None:
+        self.clock.advance(10)
+        with self.assertRaises(AgentUnavailable) as ctx:
+            self.call()
+        self.assertEqual(str(ctx.exception), "build deadline exceeded")
+        self.assertEqual(self.responses(), 0)
+
+
+class DeadlineRetryTest(GuardTest):
+    server_options = {"fail_first": 1, "fail_status": 503}
+    guard_options = {"deadline_s": 0.3, "backoff_s": 1.0}
+
+    def test_no_retry_that_would_outlast_the_deadline(self) -> None:
+        with self.assertRaises(OpenAIProviderError):
+            self.call()
+        self.assertEqual((self.responses(), self.guard.retried, self.clock.sleeps), (1, 0, []))
+
+
+class StubFallbackTest(GuardTest):
+    server_options = {"fail_first": 1, "fail_status": 503}
+    guard_options = {"retries": 0, "breaker_failures": 1}
+
+    def setUp(self) -> None:
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cache = mock.patch.object(comment_cache, "_default_cache", comment_cache.CommentCache(Path(tmp.name)))
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def render(self) -> str:
+        # текст уже «прочитан»: файл записи не нужен
+        post = md_to_html.Post(md_path=Path("2025-01-01.md"), html_path=Path("2025-01-01.html"), post_date="2025-01-01")
+        post.__dict__["text"] = POST_MD
+        return md_to_html._render_agent_block(post, guard=self.guard)
+
+    def test_failed_call_and_open_breaker_fall_back_to_marked_stub(self) -> None:
+        failed = self.render()
+        self.assertTrue(failed.startswith(STUB_FALLBACK_MARK))
+        self.assertTrue(is_stub_fallback(failed))
+        self.assertEqual(self.guard.state, "open")
+
+        # предохранитель разомкнут: заглушка без запроса к стенду
+        skipped = self.render()
+        self.assertTrue(is_stub_fallback(skipped))
+        self.assertEqual(self.responses(), 1)
+
+        # после паузы проба проходит, и комментарий уже настоящий
+        self.clock.advance(30)
+        upgraded = self.render()
+        self.assertFalse(is_stub_fallback(upgraded))
+        self.assertIn("ответ локального стенда", upgraded)
+
+
+if __name__ == "__main__":
+    unittest.main()
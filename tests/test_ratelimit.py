@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Ограничитель RPM/TPM (core/agents/quiet_logos/ratelimit.py): пополнение бюджета,
+# учёт по заголовкам x-ratelimit-*, пауза по 429 и очередь из нескольких потоков.
+# Время — FakeClock: ничего не спит, паузы запоминаются.
+#
+# Запуск:
+#   python -m unittest tests.test_ratelimit      (или python -m pytest tests)
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import sys
+import threading
+import unittest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from core.agents.quiet_logos.provider_openai import OpenAIProvider, OpenAIProviderError  # noqa: E402
+from core.agents.quiet_logos.ratelimit import RateLimiter, RateLimitTimeout, parse_duration, parse_retry_after  # noqa: E402
+from tests.stand import FakeClock, StandTest  # noqa: E402
+
+
+def _limiter(clock: FakeClock, **kwargs) -> RateLimiter:
+    return RateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+class RefillTest(unittest.TestCase):
+    def test_full_bucket_then_steady_rate(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, rpm=60)
+        for _ in range(60):
+            self.assertEqual(limiter.acquire(0), 0.0)
+        # бюджет исчерпан: дальше ровно 60 в минуту, по запросу в секунду
+        for _ in range(3):
+            self.assertAlmostEqual(limiter.acquire(0), 1.0)
+        self.assertEqual(len(clock.sleeps), 3)
+        self.assertAlmostEqual(limiter.stats()["waited_s"], 3.0)
+
+    def test_partial_refill(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, rpm=60)
+        for _ in range(60):
+            limiter.acquire(0)
+        clock.advance(10)
+        for _ in range(10):
+            self.assertEqual(limiter.acquire(0), 0.0)
+        self.assertAlmostEqual(limiter.acquire(0), 1.0)
+
+    def test_refill_is_capped_at_capacity(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, rpm=60)
+        clock.advance(600)
+        for _ in range(60):
+            self.assertEqual(limiter.acquire(0), 0.0)
+        self.assertAlmostEqual(limiter.acquire(0), 1.0)
+
+    def test_tokens_per_minute(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, tpm=1000)
+        self.assertEqual(limiter.acquire(600), 0.0)
+        # не хватает 200 токенов при пополнении 1000/60 в секунду
+        self.assertAlmostEqual(limiter.acquire(600), 12.0)
+
+    def test_unknown_limits_do_not_wait(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock)
+        for _ in range(1000):
+            self.assertEqual(limiter.acquire(10_000), 0.0)
+        self.assertEqual(clock.sleeps, [])
+
+
+class ObserveTest(unittest.TestCase):
+    def test_limits_learned_from_headers(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock)
+        limiter.observe(200, {"x-ratelimit-limit-requests": "2", "x-ratelimit-remaining-requests": "0"})
+        self.assertEqual(limiter.stats()["rpm"], 2)
+        # остатка нет, пополнение — 2 запроса в минуту
+        self.assertAlmostEqual(limiter.acquire(0), 30.0)
+
+    def test_remaining_tokens_override_local_estimate(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, tpm=1000)
+        limiter.acquire(100)
+        # сервер насчитал больше (реальный вход/выход): верим ему
+        limiter.observe(200, {"X-RateLimit-Limit-Tokens": "1000", "X-RateLimit-Remaining-Tokens": "100"})
+        self.assertAlmostEqual(limiter.acquire(400), 18.0)
+
+    def test_remaining_never_raises_the_balance(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, tpm=1000)
+        limiter.acquire(900)
+        limiter.observe(200, {"x-ratelimit-limit-tokens": "1000", "x-ratelimit-remaining-tokens": "1000"})
+        self.assertAlmostEqual(limiter.acquire(400), 18.0)
+
+    def test_429_pauses_all_callers(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock)
+        limiter.observe(429, {"Retry-After": "3"})
+        self.assertAlmostEqual(limiter.acquire(0), 3.0)
+        self.assertEqual(limiter.stats()["throttled"], 1)
+        self.assertEqual(limiter.acquire(0), 0.0)
+
+    def test_429_without_retry_after_uses_reset(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock)
+        limiter.observe(429, {"x-ratelimit-reset-requests": "1m30s"})
+        self.assertAlmostEqual(limiter.acquire(0), 90.0)
+
+    def test_timeout_does_not_reserve(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, rpm=60)
+        for _ in range(60):
+            limiter.acquire(0)
+        with self.assertRaises(RateLimitTimeout) as ctx:
+            limiter.acquire(0, max_wait_s=0.5)
+        self.assertAlmostEqual(ctx.exception.wait_s, 1.0)
+        self.assertEqual(clock.sleeps, [])
+        # отказ не занял место в очереди
+        self.assertAlmostEqual(limiter.acquire(0), 1.0)
+
+    def test_header_parsing(self) -> None:
+        self.assertEqual(parse_retry_after({"retry-after-ms": "250", "retry-after": "9"}), 0.25)
+        self.assertEqual(parse_retry_after({"retry-after": "2"}), 2.0)
+        self.assertIsNone(parse_retry_after({}))
+        self.assertEqual(parse_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_duration("20ms"), 0.02)
+
+
+class ConcurrencyTest(unittest.TestCase):
+    def test_waiting_threads_form_a_queue(self) -> None:
+        # часы стоят, пока потоки «спят»: видно, какой долг резервирует каждый
+        clock = FakeClock(advance_on_sleep=False)
+        limiter = _limiter(clock, rpm=60)
+        for _ in range(60):
+            limiter.acquire(0)
+
+        start = threading.Barrier(8)
+
+        def worker(_: int) -> float:
+            start.wait()
+            return limiter.acquire(0)
+
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            waits = list(ex.map(worker, range(8)))
+        # каждый следующий ждёт на один интервал пополнения дольше — никто не проскочил
+        self.assertEqual(sorted(round(w, 6) for w in waits), [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0])
+        self.assertAlmostEqual(limiter.stats()["waited_s"], 36.0)
+
+    def test_threads_share_one_429_pause(self) -> None:
+        clock = FakeClock(advance_on_sleep=False)
+        limiter = _limiter(clock)
+        limiter.observe(429, {"retry-after": "5"})
+
+        def worker(_: int) -> float:
+            try:
+                return limiter.acquire(0, max_wait_s=4)
+            except RateLimitTimeout as e:
+                return -e.wait_s
+
+        with ThreadPoolExecutor(max_workers=4) as ex:
+            results = list(ex.map(worker, range(4)))
+        self.assertEqual(results, [-5.0] * 4)
+        self.assertEqual(clock.sleeps, [])
+
+
+class StandRateLimitTest(StandTest):
+    server_options = {"rpm": 2}
+
+    def test_provider_follows_the_stand_headers(self) -> None:
+        clock = FakeClock()
+        provider = OpenAIProvider()
+        provider.limiter = _limiter(clock)
+
+        def generate() -> str:
+            return provider.generate_html_fragment(system_prompt="prompt", user_text="TITLE: t\nDATE: 2025-01-01\n")
+
+        generate()
+        self.assertEqual(provider.limiter.stats()["rpm"], 2)
+        generate()
+        self.assertEqual(clock.sleeps, [])
+
+        # окно стенда исчерпано: ограничитель сам выжидает интервал пополнения (2/мин -> 30 с)
+        with self.assertRaises(OpenAIProviderError) as ctx:
+            generate()  # часы стенда настоящие, поэтому он всё равно отвечает 429
+        self.assertEqual(ctx.exception.status, 429)
+        self.assertEqual(len(clock.sleeps), 1)
+        self.assertAlmostEqual(clock.sleeps[0], 30.0)
+        self.assertEqual(provider.limiter.stats()["throttled"], 1)
+        self.assertEqual(self.stand_stats().get("throttled"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
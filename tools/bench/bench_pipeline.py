@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# bench_pipeline.py — замеры всего конвейера сборки на синтетических дневниках.
+#
+# Для каждого размера (по умолчанию 100, 1k, 10k, 50k записей) в отдельном процессе:
+# генерируется дневник в формате quiet/tech (несколько записей за день, кириллица),
+# затем по этапам меряется время и пиковый RSS:
+#   discovery   — каталог записей (md_to_html._build_posts, холодный)
+#   agent_stub  — корпус TF-IDF + render_agent_comment для каждой записи
+#   render      — markdown -> HTML страниц записей (md_to_html)
+#   index       — лента и архив (план + HTML в памяти)
+#   write       — запись страниц и ленты на диск
+#   build_log   — tools/build_log.py: потоковый рендер всех записей + лента
+#
+# Запуск:
+#   python tools/bench/bench_pipeline.py --sizes 100,1000 --out bench.json
+#   python tools/bench/bench_pipeline.py --sizes 100,1000 --repeat 3 --baseline bench.json
+# С --baseline: код выхода 1, если какой-то этап медленнее базового больше чем на --tolerance.
+
+from __future__ import annotations
+
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from pathlib import Path
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+DEFAULT_SIZES = "100,1000,10000,50000"
+STAGES = ("generate", "discovery", "agent_stub", "render", "index", "write", "build_log")
+
+
+def _peak_rss_kb() -> int:
+    # Linux: ru_maxrss в КБ, macOS — в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _run_child(n_posts: int, seed: int) -> dict:
+    """Один размер дневника; печатает JSON с таймингами этапов."""
+    from scripts import md_to_html
+    from scripts.agent_stub import render_agent_comment
+    from scripts.corpus_terms import load_corpus
+    from scripts.log_index import IndexEntry, plan_pages, page_size_from_env, write_if_changed
+    from tools import build_log
+    from tools.bench.bench_render_jobs import make_post_md
+
+    stages: dict[str, float] = {}
+    rss: dict[str, int] = {}
+
+    def mark(stage: str, t0: float) -> None:
+        stages[stage] = round(time.perf_counter() - t0, 4)
+        rss[stage] = _peak_rss_kb()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = Path(tmp) / "log"
+        cache_dir = Path(tmp) / "cache"
+        out_dir = Path(tmp) / "out"
+        log_dir.mkdir()
+        out_dir.mkdir()
+
+        t0 = time.perf_counter()
+        rng = random.Random(seed)
+        start = date(2020, 1, 1)
+        for i in range(n_posts):
+            d = (start + timedelta(days=i)).isoformat()
+            (log_dir / f"{d}.md").write_text(make_post_md(rng, d), encoding="utf-8")
+        mark("generate", t0)
+
+        # md_to_html читает пути из констант модуля — направляем их во временный каталог
+        md_to_html.LOG_DIR = log_dir
+        md_to_html.CATALOG_PATH = cache_dir / "catalog.sqlite3"
+
+        t0 = time.perf_counter()
+        posts = md_to_html._build_posts()
+        mark("discovery", t0)
+
+        t0 = time.perf_counter()
+        by_date = {p.post_date: p for p in posts}
+        corpus = load_corpus(
+            {d: p.md_path for d, p in by_date.items()},
+            cache_dir / "term_counts.json",
+            read=lambda d: by_date[d].text,
+        )
+        agent_blocks = {
+            p.post_date: render_agent_comment(
+                post_title=p.title, post_date=p.post_date, post_md=p.text, sections=p.sections, corpus=corpus,
+            ).strip()
+            for p in posts
+        }
+        mark("agent_stub", t0)
+
+        t0 = time.perf_counter()
+        template = md_to_html._load_template()
+        css_href = "../css/style.css"
+        pages_html = [
+            (p, md_to_html._render_post_html(template=template, post=p, css_href=css_href, agent_html_inline=agent_blocks[p.post_date]))
+            for p in posts
+        ]
+        mark("render", t0)
+
+        t0 = time.perf_counter()
+        entries = [IndexEntry(date=p.post_date, title=p.title) for p in posts]
+        index_pages = [
+            (page.filename, md_to_html._render_index_page(page, css_href))
+            for page in plan_pages(entries, page_size_from_env())
+        ]
+        mark("index", t0)
+
+        t0 = time.perf_counter()
+        for p, html_text in pages_html:
+            (out_dir / p.html_path.name).write_text(html_text, encoding="utf-8")
+        for name, html_text in index_pages:
+            write_if_changed(out_dir / name, html_text)
+        mark("write", t0)
+        del pages_html, index_pages
+
+        t0 = time.perf_counter()
+        bl_dir = Path(tmp) / "build_log"
+        bl_dir.mkdir()
+        bl_entries = [
+            IndexEntry(date=p.post_date, title=build_log.write_md_file_html(p.md_path, bl_dir / f"{p.post_date}.html")[0])
+            for p in posts
+        ]
+        for page in plan_pages(sorted(bl_entries, key=lambda e: e.date, reverse=True), page_size_from_env()):
+            write_if_changed(bl_dir / page.filename, build_log.render_index_page(page, "bench"))
+        mark("build_log", t0)
+
+    return {
+        "posts": n_posts,
+        "stages": stages,
+        "total_s": round(sum(v for k, v in stages.items() if k != "generate"), 4),
+        "peak_rss_kb": _peak_rss_kb(),
+        "rss_after_stage_kb": rss,
+    }
+
+
+def _run_size(n_posts: int, seed: int, repeat: int = 1) -> dict:
+    """
+    Каждый прогон — в своём процессе, чтобы пиковый RSS не наследовался от предыдущего.
+    При repeat > 1 по каждому этапу берётся минимум (меньше шума диска и планировщика).
+    """
+    runs = []
+    for _ in range(max(1, repeat)):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", str(n_posts), "--seed", str(seed)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        runs.append(json.loads(proc.stdout))
+    if len(runs) == 1:
+        return runs[0]
+
+    best = dict(runs[0])
+    best["stages"] = {s: min(r["stages"][s] for r in runs) for s in runs[0]["stages"]}
+    best["total_s"] = round(sum(v for k, v in best["stages"].items() if k != "generate"), 4)
+    best["peak_rss_kb"] = min(r["peak_rss_kb"] for r in runs)
+    best["repeat"] = len(runs)
+    return best
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float, min_abs_s: float) -> list[str]:
+    """Этапы, ставшие медленнее базовых больше чем на tolerance (и на min_abs_s секунд)."""
+    base_by_size = {r["posts"]: r for r in baseline.get("results", [])}
+    regressions: list[str] = []
+    for r in results:
+        base = base_by_size.get(r["posts"])
+        if base is None:
+            continue
+        for stage, secs in r["stages"].items():
+            if stage == "generate" or stage not in base["stages"]:
+                continue
+            old = base["stages"][stage]
+            if secs > old * (1 + tolerance) and secs - old > min_abs_s:
+                regressions.append(f"{r['posts']} posts / {stage}: {old:.3f}s -> {secs:.3f}s (+{(secs / old - 1) * 100 if old else 0:.0f}%)")
+        old_rss = base.get("peak_rss_kb")
+        if old_rss and r["peak_rss_kb"] > old_rss * (1 + tolerance):
+            regressions.append(f"{r['posts']} posts / peak RSS: {old_rss} KB -> {r['peak_rss_kb']} KB")
+    return regressions
+
+
+def _print_table(results: list[dict]) -> None:
+    header = f"{'posts':>7} " + " ".join(f"{s:>10}" for s in STAGES) + f" {'total':>8} {'rss MB':>7}"
+    print(header)
+    for r in results:
+        cells = " ".join(f"{r['stages'].get(s, 0):>10.3f}" for s in STAGES)
+        print(f"{r['posts']:>7} {cells} {r['total_s']:>8.2f} {r['peak_rss_kb'] / 1024:>7.1f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the whole build pipeline on synthetic journals.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated post counts (default: {DEFAULT_SIZES}).")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per size; the fastest time per stage is kept.")
+    parser.add_argument("--out", type=Path, default=None, help="Write JSON results here.")
+    parser.add_argument("--baseline", type=Path, default=None, help="Compare against a previous --out file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%).")
+    parser.add_argument("--min-abs", type=float, default=0.05, help="Ignore slowdowns smaller than this many seconds.")
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        with redirect_stdout(io.StringIO()):
+            result = _run_child(args.child, args.seed)
+        print(json.dumps(result))
+        return 0
+
+    results = []
+    for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"bench: {n} posts ...", file=sys.stderr)
+        results.append(_run_size(n, args.seed, args.repeat))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    _print_table(results)
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"results: {args.out}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance, args.min_abs)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"no regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
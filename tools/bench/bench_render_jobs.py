@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# bench_render_jobs.py — сравнение последовательного и параллельного рендера
+# на синтетическом дневнике — тем же путём, что и _build: пул процессов
+# с _pool_init и задачи через md_to_html._submit_render.
+#
+# Запуск:
+#   python tools/bench/bench_render_jobs.py --posts 3000 --jobs 0
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from pathlib import Path
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from scripts import md_to_html  # noqa: E402
+
+WORDS = (
+    "тишина ночь прохлада кошки мысль логика память язык практика форма "
+    "сборка шаблон агент лента запись python prolog clojure smalltalk "
+    "parser template markdown интерпретатор канон наблюдение ритм"
+).split()
+
+
+def _paragraph(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def make_post_md(rng: random.Random, post_date: str) -> str:
+    parts = [f"# quiet_logos — {post_date}\n"]
+    for i in range(rng.randint(1, 3)):
+        if i:
+            parts.append(f"---\n\n**{rng.randint(8, 23):02d}:00** — ещё одна запись\n")
+        parts.append("## quiet\n\n" + _paragraph(rng, rng.randint(40, 160)) + "\n")
+        parts.append("## tech\n\n" + "\n".join(f"- {_paragraph(rng, 8)}" for _ in range(rng.randint(2, 6))) + "\n")
+    return "\n".join(parts)
+
+
+def make_posts(log_dir: Path, n: int, seed: int = 1) -> list[md_to_html.Post]:
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    posts: list[md_to_html.Post] = []
+    for i in range(n):
+        d = (start + timedelta(days=i)).isoformat()
+        md_path = log_dir / f"{d}.md"
+        md_path.write_text(make_post_md(rng, d), encoding="utf-8")
+        posts.append(md_to_html.Post(md_path=md_path, html_path=log_dir / f"{d}.html", post_date=d))
+    return posts
+
+
+def _time_render(template: md_to_html.Template, tasks: list, jobs: int) -> tuple[float, list[str]]:
+    from concurrent.futures import ProcessPoolExecutor
+
+    css_href = "../css/style.css"
+    t0 = time.perf_counter()
+    pool = None
+    if jobs > 1:
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=md_to_html._pool_init, initargs=md_to_html._pool_initargs(template, css_href))
+    try:
+        futures = [
+            md_to_html._submit_render(pool, template=template, post=post, css_href=css_href, agent_html_inline=agent)
+            for post, agent in tasks
+        ]
+        out = [fut.result()[0] for fut in futures]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return time.perf_counter() - t0, out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark serial vs --jobs rendering.")
+    parser.add_argument("--posts", type=int, default=3000)
+    parser.add_argument("--jobs", type=int, default=0, help="0 = all CPU cores")
+    args = parser.parse_args()
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    template = md_to_html._load_template()
+    agent = '<div class="card agent"><p><strong>Аристарх</strong></p></div>'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        posts = make_posts(Path(tmp), args.posts)
+
+        # Post запоминает прочитанный текст и HTML — каждому прогону свежие объекты
+        def fresh_tasks() -> list:
+            return [(md_to_html.Post(md_path=p.md_path, html_path=p.html_path, post_date=p.post_date), agent) for p in posts]
+
+        serial_s, serial_out = _time_render(template, fresh_tasks(), jobs=1)
+        parallel_s, parallel_out = _time_render(template, fresh_tasks(), jobs=jobs)
+
+    if serial_out != parallel_out:
+        print("ERROR: parallel output differs from serial output")
+        return 1
+
+    print(f"posts:    {args.posts}")
+    print(f"serial:   {serial_s:.2f}s")
+    print(f"jobs={jobs}: {parallel_s:.2f}s")
+    print(f"speedup:  {serial_s / parallel_s:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,40 +4,54 @@
 
 from __future__ import annotations
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Iterable, Iterator
+import argparse
+import itertools
+import os
 import re
 import html
+import sys
+import unicodedata
 
 ROOT = Path(__file__).resolve().parents[1]          # ~/relearning
 DOCS = ROOT / "docs"
 LOG = DOCS / "log"
 CSS_REL = "../css/style.css"                        # из log/*.html до css
 
-TEMPLATE = """<!doctype html>
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from scripts import profiling  # noqa: E402
+from scripts.log_index import IndexEntry, IndexPage, open_if_changed, page_size_from_env, plan_pages, write_pages  # noqa: E402
+from scripts.templating import MarkupStream, Template    # noqa: E402  (stdlib-only)
+
+# Разбирается один раз; значения слотов экранируются, готовый HTML идёт потоком (MarkupStream).
+TEMPLATE = Template("""<!doctype html>
 <html lang="ru">
 <head>
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width, initial-scale=1">
-  <title>{title}</title>
-  <link rel="stylesheet" href="{css}">
+  <title>{{title}}</title>
+  <link rel="stylesheet" href="{{css}}">
 </head>
 <body>
   <main class="wrap">
     <header class="card">
-      <h1>{h1}</h1>
-      <p class="muted">{subtitle}</p>
+      <h1>{{title}}</h1>
+      <p class="muted">{{subtitle}}</p>
       <p><a href="index.html">← к дневнику</a> · <a href="../index.html">← на главную</a></p>
     </header>
 
-    {content}
+    {{content}}
 
     <footer class="footer muted">
-      <p>quiet_logos · generated {generated}</p>
+      <p>quiet_logos · generated {{generated}}</p>
     </footer>
   </main>
 </body>
 </html>
-"""
+""")
 
 def slug_date(p: Path) -> str:
     # 2025-12-23.md -> 2025-12-23
@@ -46,114 +60,315 @@ def slug_date(p: Path) -> str:
 def esc(s: str) -> str:
     return html.escape(s, quote=True)
 
-def md_to_blocks(md: str) -> list[tuple[str, str]]:
+# --- Однопроходный потоковый рендер ---
+# Строки читаются из файла по одной, HTML отдаётся кусками и сразу пишется
+# в выходной файл: память не растёт с размером дневника за день.
+
+FENCE_RE = re.compile(r"^(```|~~~)\s*([\w+-]*)\s*$")
+HR_RE = re.compile(r"^(-{3,}|\*{3,}|_{3,})$")
+OL_RE = re.compile(r"^\d+[.)]\s+")
+TABLE_SEP_RE = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$")
+CELL_SPLIT_RE = re.compile(r"(?<!\\)\|")
+CODE_SPAN_RE = re.compile(r"`([^`]+)`")
+LINK_RE = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+# '_' / '__' не работают внутри слов (snake_case) и не трогают dunder-имена (__init__)
+STRONG_RE = re.compile(r"\*\*(.+?)\*\*|(?<![\w_])__(?![\s_])(?!\w+__(?![\w_]))(.+?)(?<![\s_])__(?![\w_])")
+EM_RE = re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])|(?<![\w_])_(?![\s_])(.+?)(?<![\s_])_(?![\w_])")
+SAFE_URL_RE = re.compile(r"^(https?://|mailto:|/|\.|#|[\w-]+(\.html?|/|$))", re.IGNORECASE)
+# готовый HTML (код, ссылки) прячется за \0N\0, чтобы выделение не лезло внутрь href и <code>
+PLACEHOLDER_RE = re.compile("\0(\\d+)\0")
+
+
+def _emphasis(s: str) -> str:
+    s = STRONG_RE.sub(lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>", s)
+    return EM_RE.sub(lambda m: f"<em>{m.group(1) or m.group(2)}</em>", s)
+
+
+def inline(text: str) -> str:
+    """Экранирование + `код`, [ссылки](url), **жирный**, *курсив*."""
+    saved: list[str] = []
+
+    def keep(fragment: str) -> str:
+        saved.append(fragment)
+        return f"\0{len(saved) - 1}\0"
+
+    def link(m: re.Match) -> str:
+        if not SAFE_URL_RE.match(html.unescape(m.group(2))):
+            return m.group(0)
+        return keep(f'<a href="{m.group(2)}">{_emphasis(m.group(1))}</a>')
+
+    def restore(s: str) -> str:
+        return PLACEHOLDER_RE.sub(lambda m: restore(saved[int(m.group(1))]), s)
+
+    text = CODE_SPAN_RE.sub(lambda m: keep(f"<code>{esc(m.group(1))}</code>"), text.replace("\0", ""))
+    out = LINK_RE.sub(link, esc(text))
+    return restore(_emphasis(out))
+
+
+def heading_id(text: str, seen: set[str]) -> str:
+    """id заголовка как у расширения toc python-markdown (slugify + уникальность через _N)."""
+    plain = html.unescape(re.sub(r"<[^>]+>", "", text))
+    slug = unicodedata.normalize("NFKD", plain).encode("ascii", "ignore").decode("ascii")
+    slug = re.sub(r"[-\s]+", "-", re.sub(r"[^\w\s-]", "", slug).strip().lower())
+    while slug in seen or not slug:
+        m = re.match(r"^(.*)_([0-9]+)$", slug)
+        slug = f"{m.group(1)}_{int(m.group(2)) + 1}" if m else f"{slug}_1"
+    seen.add(slug)
+    return slug
+
+
+def _table_cells(row: str) -> list[str]:
+    row = row.strip()
+    if row.startswith("|"):
+        row = row[1:]
+    if row.endswith("|") and not row.endswith("\\|"):
+        row = row[:-1]
+    return [c.strip().replace("\\|", "|") for c in CELL_SPLIT_RE.split(row)]
+
+
+def _render_table(rows: list[str]) -> Iterator[str]:
+    """Таблица '| a | b |' с разделителем '|---|:--:|'; без разделителя — обычный абзац."""
+    if len(rows) < 2 or not TABLE_SEP_RE.match(rows[1]):
+        yield f"  <p>{inline(' '.join(rows))}</p>\n"
+        return
+    aligns = []
+    for cell in _table_cells(rows[1]):
+        left, right = cell.startswith(":"), cell.endswith(":")
+        aligns.append("center" if left and right else "right" if right else "left" if left else None)
+
+    def cells(row: str, tag: str) -> str:
+        values = _table_cells(row)
+        out = []
+        for i, align in enumerate(aligns):
+            style = f' style="text-align: {align};"' if align else ""
+            out.append(f"<{tag}{style}>{inline(values[i]) if i < len(values) else ''}</{tag}>")
+        return "".join(out)
+
+    yield "  <table>\n"
+    yield f"    <thead><tr>{cells(rows[0], 'th')}</tr></thead>\n"
+    if rows[2:]:
+        yield "    <tbody>\n"
+        for row in rows[2:]:
+            yield f"      <tr>{cells(row, 'td')}</tr>\n"
+        yield "    </tbody>\n"
+    yield "  </table>\n"
+
+
+def split_title(lines: Iterator[str], fallback: str) -> tuple[str, Iterator[str]]:
     """
-    Очень простой парсер:
-    - # title
-    - ## section_title
-    - далее абзацы, списки "- "
+    Заголовок — первая непустая строка вида '# ...'. Остальные строки
+    возвращаются тем же ленивым итератором (без чтения файла целиком).
     """
-    lines = md.splitlines()
-    title = ""
-    sections: list[tuple[str, list[str]]] = []
-    current_h2 = ""
-    buf: list[str] = []
-
-    def flush():
-        nonlocal buf, current_h2
-        if current_h2 and buf:
-            sections.append((current_h2, buf))
-        buf = []
-
     for raw in lines:
-        line = raw.rstrip()
-
-        if line.startswith("# "):
-            title = line[2:].strip()
+        line = raw.rstrip("\n")
+        if not line.strip():
             continue
+        if line.startswith("# "):
+            return (line[2:].strip() or fallback), lines
+        return fallback, itertools.chain([raw], lines)
+    return fallback, iter(())
 
-        if line.startswith("## "):
-            flush()
-            current_h2 = line[3:].strip()
-            continue
-
-        # пропускаем пустые строки как разделители абзацев, но сохраняем структуру
-        buf.append(line)
-
-    flush()
-
-    blocks: list[tuple[str, str]] = []
-    blocks.append(("__title__", title))
-    for h2, body_lines in sections:
-        blocks.append((h2, "\n".join(body_lines).strip()))
-    return blocks
 
-def body_to_html(text: str) -> str:
+def render_md(lines: Iterable[str], *, fragment: bool = False) -> Iterator[str]:
     """
     Поддержка:
-    - абзацы
-    - списки '- item'
-    - пустые строки
+    - ## секции (каждая — <section class="card">), ### подзаголовки
+    - абзацы, списки '- item' / '* item' / '1. item', цитаты '> ...', таблицы '| a | b |'
+    - ```fenced code```
+    - **жирный**, *курсив*, `код`, [ссылки](url)
+    - '---' — разделитель записей (journal_server.write_md), закрывает секцию
+
+    fragment=True — разметка как у python-markdown (запасной рендер md_to_html, где
+    шаблон сам даёт карточку): '# ' -> <h1>, '## ' -> <h2> без <section class="card">,
+    у заголовков id как у toc, '---' -> <hr>, пустой текст -> пустой вывод.
     """
-    if not text:
-        return ""
-
-    out: list[str] = []
-    lines = text.splitlines()
-
-    in_ul = False
+    section_open = False
+    pending_h2: str | None = None
+    list_tag: str | None = None
     para: list[str] = []
-
-    def flush_para():
-        nonlocal para
+    quote: list[list[str]] | None = None
+    table: list[str] = []
+    fence: str | None = None
+    emitted = False
+    ids: set[str] = set()
+
+    def heading(level: int, text: str) -> str:
+        body = inline(text)
+        attr = f' id="{heading_id(body, ids)}"' if fragment else ""
+        return f"  <h{level}{attr}>{body}</h{level}>\n"
+
+    def open_section() -> Iterator[str]:
+        nonlocal section_open, pending_h2
+        if section_open or fragment:
+            return
+        section_open = True
+        yield '<section class="card">\n'
+        if pending_h2:
+            yield f"  <h2>{esc(pending_h2)}</h2>\n"
+        pending_h2 = None
+
+    def close_blocks() -> Iterator[str]:
+        nonlocal list_tag, para, quote, table
         if para:
-            out.append(f"<p>{esc(' '.join(para).strip())}</p>")
+            yield f"  <p>{inline(' '.join(para))}</p>\n"
             para = []
+        if list_tag:
+            yield f"  </{list_tag}>\n"
+            list_tag = None
+        if quote is not None:
+            yield "  <blockquote>\n"
+            for lines_ in quote:
+                if lines_:
+                    yield f"    <p>{inline(' '.join(lines_))}</p>\n"
+            yield "  </blockquote>\n"
+            quote = None
+        if table:
+            yield from _render_table(table)
+            table = []
+
+    def close_section() -> Iterator[str]:
+        nonlocal section_open
+        yield from close_blocks()
+        if section_open:
+            yield "</section>\n"
+            section_open = False
 
-    def ul_open():
-        nonlocal in_ul
-        if not in_ul:
-            flush_para()
-            out.append("<ul>")
-            in_ul = True
+    for raw in lines:
+        line = raw.rstrip("\n").rstrip()
+
+        if fence is not None:
+            if line.strip() == fence:
+                yield "</code></pre>\n"
+                fence = None
+            else:
+                yield esc(raw.rstrip("\n")) + "\n"
+            continue
 
-    def ul_close():
-        nonlocal in_ul
-        if in_ul:
-            out.append("</ul>")
-            in_ul = False
+        stripped = line.strip()
+        m = FENCE_RE.match(stripped)
+        if m:
+            yield from close_blocks()
+            yield from open_section()
+            fence = m.group(1)
+            lang = f' class="language-{esc(m.group(2))}"' if m.group(2) else ""
+            yield f"  <pre><code{lang}>"
+            emitted = True
+            continue
 
-    for raw in lines:
-        line = raw.strip()
+        if not stripped:
+            yield from close_blocks()
+            continue
+
+        if line.startswith("## "):
+            yield from close_section()
+            if fragment:
+                yield heading(2, line[3:].strip())
+                emitted = True
+            else:
+                pending_h2 = line[3:].strip()
+            continue
+
+        if line.startswith("# "):
+            # без fragment заголовок дня уже в шапке страницы (split_title);
+            # повторный (например, в склеенном файле) не дублируем
+            if fragment:
+                yield from close_blocks()
+                yield heading(1, line[2:].strip())
+                emitted = True
+            continue
+
+        if HR_RE.match(stripped):
+            yield from close_section()
+            yield "<hr>\n" if fragment else '<hr class="entry-sep">\n'
+            emitted = True
+            continue
 
-        if not line:
-            ul_close()
-            flush_para()
+        if line.startswith("### "):
+            yield from close_blocks()
+            yield from open_section()
+            yield heading(3, line[4:].strip())
+            emitted = True
             continue
 
-        if line.startswith("- "):
-            ul_open()
-            out.append(f"<li>{esc(line[2:].strip())}</li>")
+        if stripped.startswith("|"):
+            if not table:
+                yield from close_blocks()
+            yield from open_section()
+            table.append(stripped)
+            emitted = True
             continue
 
-        # обычная строка -> часть абзаца
-        ul_close()
-        para.append(line)
+        if stripped.startswith(">"):
+            if quote is None:
+                yield from close_blocks()
+                quote = [[]]
+            yield from open_section()
+            content = stripped[1:].strip()
+            if content:
+                quote[-1].append(content)
+            elif quote[-1]:
+                quote.append([])
+            emitted = True
+            continue
 
-    ul_close()
-    flush_para()
-    return "\n".join(out)
+        ol = OL_RE.match(stripped)
+        if ol or stripped.startswith(("- ", "* ")):
+            tag = "ol" if ol else "ul"
+            if para or quote is not None or table or (list_tag and list_tag != tag):
+                yield from close_blocks()
+            yield from open_section()
+            if not list_tag:
+                yield f"  <{tag}>\n"
+                list_tag = tag
+            item = stripped[ol.end():] if ol else stripped[2:]
+            yield f"    <li>{inline(item.strip())}</li>\n"
+            emitted = True
+            continue
 
-def md_file_to_html(md_path: Path) -> tuple[str, str]:
-    md = md_path.read_text(encoding="utf-8")
-    blocks = md_to_blocks(md)
+        # обычная строка -> часть абзаца (или ленивое продолжение цитаты)
+        if quote is not None:
+            quote[-1].append(stripped)
+            continue
+        if list_tag or table:
+            yield from close_blocks()
+        yield from open_section()
+        para.append(stripped)
+        emitted = True
 
-    title = next((v for k, v in blocks if k == "__title__"), "").strip()
-    if not title:
-        title = f"quiet_logos — {slug_date(md_path)}"
+    if fence is not None:
+        yield "</code></pre>\n"
+    yield from close_section()
 
-    # пытаемся вытащить дату из имени файла
+    if not emitted and not fragment:
+        yield '<section class="card"><p class="muted">Пусто.</p></section>\n'
+
+
+STAMP_FORMAT = "%Y-%m-%d %H:%M UTC"
+
+
+def build_stamp(post_date: str, *, now: bool = False) -> str:
+    """
+    Штамп «generated» без недетерминизма: дата записи (для ленты — самой новой записи).
+    mtime исходника не годится — git checkout ставит время checkout'а, и свежий клон
+    или CI перезаписывали бы все страницы. SOURCE_DATE_EPOCH — для воспроизводимых
+    сборок, now=True (--stamp-now) — текущее время; оба в UTC.
+    """
+    sde = os.environ.get("SOURCE_DATE_EPOCH")
+    if sde:
+        return datetime.fromtimestamp(int(sde), tz=timezone.utc).strftime(STAMP_FORMAT)
+    if now:
+        return datetime.now(timezone.utc).strftime(STAMP_FORMAT)
+    return post_date
+
+
+def write_md_file_html(md_path: Path, out_path: Path, *, stamp_now: bool = False) -> tuple[str, bool]:
+    """
+    md -> html за один проход: читаем строки, рендерим и пишем потоком во временный файл,
+    который заменяет out_path, только если байты изменились.
+    Возвращает (заголовок записи для ленты, был ли out_path перезаписан).
+    """
     date_str = slug_date(md_path)
+    # пытаемся вытащить дату из имени файла
     subtitle = date_str
     try:
         dt = datetime.strptime(date_str, "%Y-%m-%d")
@@ -161,45 +376,37 @@ def md_file_to_html(md_path: Path) -> tuple[str, str]:
     except Exception:
         pass
 
-    content_parts: list[str] = []
-    for h2, body in blocks:
-        if h2 == "__title__":
-            continue
-        section_html = body_to_html(body)
-        if not section_html:
-            continue
-        content_parts.append(
-            f"""<section class="card">
-  <h2>{esc(h2)}</h2>
-  {section_html}
-</section>"""
-        )
-
-    if not content_parts:
-        content_parts.append('<section class="card"><p class="muted">Пусто.</p></section>')
-
-    html_out = TEMPLATE.format(
-        title=esc(title),
-        css=CSS_REL,
-        h1=esc(title),
-        subtitle=esc(subtitle),
-        content="\n\n".join(content_parts),
-        generated=datetime.now().strftime("%Y-%m-%d %H:%M"),
-    )
-    return title, html_out
-
-def update_index(entries: list[tuple[str, str]]):
-    """
-    entries: [(date, title), ...] — по убыванию даты
-    Пишем docs/log/index.html (простая лента).
-    """
-    items = []
-    for date, title in entries:
-        items.append(
-            f'<li><a href="{esc(date)}.html">{esc(date)} — {esc(title)}</a></li>'
-        )
+    with md_path.open(encoding="utf-8") as src, open_if_changed(out_path) as dst:
+        title, rest = split_title(iter(src), fallback=f"quiet_logos — {date_str}")
+        for chunk in TEMPLATE.render_iter(
+            title=title,
+            css=CSS_REL,
+            subtitle=subtitle,
+            content=MarkupStream(render_md(rest)),
+            generated=build_stamp(date_str, now=stamp_now),
+        ):
+            dst.file.write(chunk)
+    return title, dst.changed
+
+def render_index_page(page: IndexPage, generated: str) -> str:
+    items = [
+        f'<li><a href="{esc(e.date)}.html">{esc(e.date)} — {esc(e.title)}</a></li>'
+        for e in page.entries
+    ]
+    items += [f'<li><a href="{esc(href)}">{esc(label)}</a></li>' for href, label in page.sublinks]
+    nav = " · ".join(f'<a href="{esc(href)}">{esc(label)}</a>' for href, label in page.links)
+
+    # штамп времени только на первой странице: архивные страницы должны
+    # оставаться байт-в-байт одинаковыми между сборками
+    footer = ""
+    if page.filename == "index.html":
+        footer = f"""
+    <footer class="footer muted">
+      <p>generated {esc(generated)}</p>
+    </footer>
+"""
 
-    page = f"""<!doctype html>
+    return f"""<!doctype html>
 <html lang="ru">
 <head>
   <meta charset="utf-8">
@@ -216,49 +423,83 @@ def update_index(entries: list[tuple[str, str]]):
     </header>
 
     <section class="card">
-      <h2>Записи</h2>
+      <h2>{esc(page.heading)}</h2>
       <ul>
         {''.join(items)}
       </ul>
+      <p>{nav}</p>
     </section>
-
-    <footer class="footer muted">
-      <p>generated {datetime.now().strftime("%Y-%m-%d %H:%M")}</p>
-    </footer>
+{footer}
   </main>
 </body>
 </html>
 """
-    (LOG / "index.html").write_text(page, encoding="utf-8")
 
-def main():
+def update_index(entries: list[tuple[str, str]], generated: str) -> list[str]:
+    """
+    entries: [(date, title), ...] — по убыванию даты
+    generated — штамп для index.html (см. build_stamp)
+    Пишем ленту docs/log/index.html + архивные страницы (page-NNNN, archive-YYYY[-MM]).
+    Возвращает имена реально изменившихся файлов.
+    """
+    pages = plan_pages([IndexEntry(date=d, title=t) for d, t in entries], page_size_from_env())
+    return write_pages(LOG, pages, lambda page: render_index_page(page, generated))
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Zero-dependency quiet_logos log builder.")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=str(ROOT / ".cache" / "quiet_logos" / "build_log_trace.json"),
+        default=None,
+        metavar="TRACE_JSON",
+        help="Time stages and posts; write a Chrome trace (default: .cache/quiet_logos/build_log_trace.json).",
+    )
+    parser.add_argument("--profile-top", type=int, default=10, metavar="N", help="Slowest posts to list with --profile.")
+    parser.add_argument(
+        "--stamp-now",
+        action="store_true",
+        help="Stamp pages with the current UTC time instead of the post date (pages then change on every build).",
+    )
+    args = parser.parse_args(argv)
+    prof = profiling.enable() if args.profile else profiling.current()
+
     if not DOCS.exists():
         raise SystemExit("Нет папки docs/. Запусти из репозитория ~/relearning.")
 
     LOG.mkdir(parents=True, exist_ok=True)
 
-    md_files = sorted(LOG.glob("*.md"))
+    with prof.span("discovery"):
+        md_files = sorted(LOG.glob("*.md"))
     if not md_files:
         print("Нет .md файлов в docs/log/")
         return
 
     entries: list[tuple[str, str]] = []
-    for md_path in md_files:
-        # пропускаем служебные файлы
-        if md_path.name.startswith("_"):
-            continue
-
-        date = slug_date(md_path)
-        title, html_out = md_file_to_html(md_path)
-        out_path = LOG / f"{date}.html"
-        out_path.write_text(html_out, encoding="utf-8")
-        entries.append((date, title))
+    pages_written = 0
+    with prof.span("posts"):
+        for md_path in md_files:
+            # пропускаем служебные файлы
+            if md_path.name.startswith("_"):
+                continue
+
+            date = slug_date(md_path)
+            out_path = LOG / f"{date}.html"
+            # рендер и запись идут одним потоком — один интервал на запись
+            with prof.span("render+write", post=date):
+                title, changed = write_md_file_html(md_path, out_path, stamp_now=args.stamp_now)
+            pages_written += changed
+            entries.append((date, title))
 
     # сортировка по дате (строка YYYY-MM-DD сортируется корректно)
     entries.sort(key=lambda x: x[0], reverse=True)
-    update_index(entries)
+    with prof.span("index"):
+        written = update_index(entries, build_stamp(entries[0][0] if entries else "", now=args.stamp_now))
 
-    print(f"OK: built {len(entries)} pages + index.html")
+    print(f"OK: built {len(entries)} pages + index ({len(written)} index pages changed)")
+    print(f"Files written: {pages_written + len(written)}")
+    if prof.enabled:
+        profiling.report(prof, Path(args.profile), args.profile_top)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# fake_openai.py — локальный OpenAI-совместимый стенд для проверки провайдера без сети.
+#
+# Запуск:
+#   python tools/dev/fake_openai.py --port 8911
+#   OPENAI_BASE_URL=http://127.0.0.1:8911/v1 OPENAI_API_KEY=x QUIET_LOGOS_MODE=real \
+#     python scripts/md_to_html.py
+#
+# Отвечает на POST /v1/responses детерминированной карточкой агента
+# (с "stream": true — потоком SSE-событий response.output_text.delta).
+# Соединения keep-alive (HTTP/1.1); --idle-timeout закрывает простаивающие
+# сокеты, чтобы проверить переподключение клиента.
+#
+# Batch API: POST /v1/files (multipart), POST /v1/batches, GET /v1/batches/{id},
+# POST /v1/batches/{id}/cancel, GET /v1/files/{id}/content. Задача переходит в completed
+# через --batch-delay секунд; --batch-fail-every N делает каждую N-ю строку ошибкой
+# (частичный результат), отменённая задача отдаёт то, что «успело» выполниться.
+#
+# --fail-first N: первые N запросов /v1/responses получают --fail-status (по умолчанию 503) —
+# для проверки повторов и предохранителя.
+#
+# --rpm / --tpm: лимиты запросов и токенов в минуту (окно 60 с). Ответы /v1/responses
+# несут x-ratelimit-{limit,remaining,reset}-{requests,tokens}; сверх лимита — 429 с Retry-After.
+
+from __future__ import annotations
+
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import itertools
+import json
+import threading
+import time
+
+STATS = {"connections": 0, "requests": 0, "batches": 0}
+_STATS_LOCK = threading.Lock()
+
+# file_id -> bytes, batch_id -> объект задачи
+FILES: dict[str, bytes] = {}
+BATCHES: dict[str, dict] = {}
+_IDS = itertools.count(1)
+
+# окно лимитов: начало, запросов и токенов в нём
+WINDOW = {"start": 0.0, "requests": 0, "tokens": 0}
+
+
+def _fragment(user_text: str) -> str:
+    title = ""
+    date = ""
+    for line in user_text.splitlines():
+        if line.startswith("TITLE: "):
+            title = line[len("TITLE: "):]
+        elif line.startswith("DATE: "):
+            date = line[len("DATE: "):]
+    if "\nNEW_ENTRY_MD:\n" in user_text:
+        # режим дополнения (prompt_delta.md): только абзацы
+        new_chars = len(user_text.split("\nNEW_ENTRY_MD:\n", 1)[1])
+        return f"<p>Дополнение к записи от {date}: {new_chars} знаков новой части.</p>"
+    return (
+        '<div class="card agent">\n'
+        "  <p><strong>Аристарх</strong></p>\n"
+        f"  <p>Я прочитал запись «{title}» от {date}.</p>\n"
+        "  <p><em>(ответ локального стенда)</em></p>\n"
+        "</div>"
+    )
+
+
+def _user_text(payload: dict) -> str:
+    for item in payload.get("input", []):
+        if item.get("role") == "user":
+            return "".join(c.get("text", "") for c in item.get("content", []))
+    return ""
+
+
+def _multipart_file(content_type: str, body: bytes) -> bytes:
+    msg = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    for part in msg.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True) or b""
+    return b""
+
+
+def _run_batch(batch: dict, *, fail_every: int, limit: int | None = None) -> None:
+    """Выполняет строки входного файла; limit — сколько успело до отмены."""
+    out: list[str] = []
+    errors: list[str] = []
+    lines = [json.loads(raw) for raw in FILES[batch["input_file_id"]].decode("utf-8").splitlines() if raw.strip()]
+    for i, line in enumerate(lines[:limit] if limit is not None else lines, start=1):
+        if fail_every and i % fail_every == 0:
+            errors.append(json.dumps({
+                "id": f"req_{i}",
+                "custom_id": line["custom_id"],
+                "response": {"status_code": 500, "body": {"error": {"message": "stand-in failure"}}},
+                "error": None,
+            }, ensure_ascii=False))
+            continue
+        text = _fragment(_user_text(line["body"]))
+        out.append(json.dumps({
+            "id": f"req_{i}",
+            "custom_id": line["custom_id"],
+            "response": {"status_code": 200, "body": {"output_text": text}},
+            "error": None,
+        }, ensure_ascii=False))
+    for key, rows in (("output_file_id", out), ("error_file_id", errors)):
+        if rows:
+            file_id = f"file-{next(_IDS)}"
+            FILES[file_id] = ("\n".join(rows) + "\n").encode("utf-8")
+            batch[key] = file_id
+    batch["request_counts"] = {"total": len(lines), "completed": len(out), "failed": len(errors)}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay_s = 0.0
+    batch_delay_s = 0.0
+    batch_fail_every = 0
+    fail_first = 0
+    fail_status = 503
+    rpm = 0
+    tpm = 0
+
+    def setup(self) -> None:
+        super().setup()
+        with _STATS_LOCK:
+            STATS["connections"] += 1
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        pass
+
+    def _send_json(self, code: int, obj: dict, headers: dict[str, str] | None = None) -> None:
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_sse(self, text: str, chunk: int = 24, headers: dict[str, str] | None = None) -> None:
+        """Отдаёт text кусками; delay_s распределяется между кусками."""
+        events = [{"type": "response.created"}]
+        events += [{"type": "response.output_text.delta", "delta": text[i:i + chunk]} for i in range(0, len(text), chunk)]
+        events.append({"type": "response.completed", "response": {"output_text": text}})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        pause = self.delay_s / max(1, len(events) - 2)
+        for ev in events:
+            data = f"event: {ev['type']}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+            if ev["type"] == "response.output_text.delta" and pause:
+                time.sleep(pause)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _rate_limit(self, tokens: int) -> tuple[bool, dict[str, str]]:
+        """(пропустить ли запрос, заголовки x-ratelimit-*); без --rpm/--tpm — всегда пропускает."""
+        if not self.rpm and not self.tpm:
+            return True, {}
+        with _STATS_LOCK:
+            now = time.time()
+            if now - WINDOW["start"] >= 60:
+                WINDOW.update(start=now, requests=0, tokens=0)
+            reset = max(0.0, WINDOW["start"] + 60 - now)
+            allowed = (not self.rpm or WINDOW["requests"] < self.rpm) and (not self.tpm or WINDOW["tokens"] + tokens <= self.tpm)
+            if allowed:
+                WINDOW["requests"] += 1
+                WINDOW["tokens"] += tokens
+            else:
+                STATS["throttled"] = STATS.get("throttled", 0) + 1
+            headers = {}
+            if self.rpm:
+                headers["x-ratelimit-limit-requests"] = str(self.rpm)
+                headers["x-ratelimit-remaining-requests"] = str(max(0, self.rpm - WINDOW["requests"]))
+                headers["x-ratelimit-reset-requests"] = f"{reset:.3f}s"
+            if self.tpm:
+                headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tpm - WINDOW["tokens"]))
+                headers["x-ratelimit-reset-tokens"] = f"{reset:.3f}s"
+            if not allowed:
+                headers["retry-after-ms"] = str(int(reset * 1000))
+                headers["Retry-After"] = str(int(reset) + 1)
+        return allowed, headers
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", "0"))
+        raw = self.rfile.read(length)
+        return json.loads(raw.decode("utf-8")) if raw else {}
+
+    def _batch(self, batch_id: str) -> dict | None:
+        """Задача по id; in_progress -> completed, когда прошло batch_delay_s."""
+        with _STATS_LOCK:
+            batch = BATCHES.get(batch_id)
+            if batch is not None and batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.batch_delay_s:
+                _run_batch(batch, fail_every=self.batch_fail_every)
+                batch["status"] = "completed"
+            return batch
+
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            with _STATS_LOCK:
+                self._send_json(200, dict(STATS))
+            return
+        parts = self.path.strip("/").split("/")
+        if parts[-2:-1] == ["batches"]:
+            batch = self._batch(parts[-1])
+            if batch is not None:
+                self._send_json(200, batch)
+                return
+        if len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content" and parts[-2] in FILES:
+            data = FILES[parts[-2]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        with _STATS_LOCK:
+            STATS["requests"] += 1
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._send_json(401, {"error": {"message": "missing bearer token"}})
+            return
+
+        if self.path.endswith("/responses"):
+            payload = self._read_json()
+            tokens = (len(json.dumps(payload, ensure_ascii=False).encode("utf-8")) + 3) // 4 + int(payload.get("max_output_tokens") or 0)
+            allowed, limit_headers = self._rate_limit(tokens)
+            if not allowed:
+                self._send_json(429, {"error": {"message": "rate limit exceeded", "type": "requests"}}, limit_headers)
+                return
+            with _STATS_LOCK:
+                STATS["responses"] = STATS.get("responses", 0) + 1
+                failing = STATS["responses"] <= self.fail_first
+            if failing:
+                self._send_json(self.fail_status, {"error": {"message": "stand-in failure"}}, limit_headers)
+                return
+            text = _fragment(_user_text(payload))
+            if payload.get("stream"):
+                self._send_sse(text, headers=limit_headers)
+                return
+            if self.delay_s:
+                time.sleep(self.delay_s)
+            self._send_json(200, {"output_text": text}, limit_headers)
+            return
+
+        if self.path.endswith("/files"):
+            length = int(self.headers.get("Content-Length", "0"))
+            data = _multipart_file(self.headers.get("Content-Type", ""), self.rfile.read(length))
+            file_id = f"file-{next(_IDS)}"
+            FILES[file_id] = data
+            self._send_json(200, {"id": file_id, "object": "file", "bytes": len(data), "purpose": "batch"})
+            return
+
+        if self.path.endswith("/batches"):
+            payload = self._read_json()
+            if payload.get("input_file_id") not in FILES:
+                self._send_json(400, {"error": {"message": "unknown input_file_id"}})
+                return
+            batch_id = f"batch_{next(_IDS)}"
+            with _STATS_LOCK:
+                STATS["batches"] += 1
+                BATCHES[batch_id] = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "endpoint": payload.get("endpoint"),
+                    "input_file_id": payload["input_file_id"],
+                    "status": "in_progress",
+                    "created_at": time.time(),
+                    "output_file_id": None,
+                    "error_file_id": None,
+                }
+                batch = dict(BATCHES[batch_id])
+            self._send_json(200, batch)
+            return
+
+        if self.path.endswith("/cancel"):
+            batch_id = self.path.strip("/").split("/")[-2]
+            with _STATS_LOCK:
+                batch = BATCHES.get(batch_id)
+                if batch is not None and batch["status"] == "in_progress":
+                    # «успела» выполниться половина строк
+                    total = len(FILES[batch["input_file_id"]].splitlines())
+                    _run_batch(batch, fail_every=self.batch_fail_every, limit=total // 2)
+                    batch["status"] = "cancelled"
+            if batch is None:
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            self._send_json(200, batch)
+            return
+        self._send_json(404, {"error": {"message": "not found"}})
+
+
+def reset_state() -> None:
+    """Счётчики, файлы, задачи и окно лимитов — с нуля (для тестов, где стенды сменяют друг друга в одном процессе)."""
+    with _STATS_LOCK:
+        STATS.clear()
+        STATS.update(connections=0, requests=0, batches=0)
+        FILES.clear()
+        BATCHES.clear()
+        WINDOW.update(start=0.0, requests=0, tokens=0)
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    *,
+    delay_s: float = 0.0,
+    idle_timeout_s: float | None = None,
+    batch_delay_s: float = 0.0,
+    batch_fail_every: int = 0,
+    fail_first: int = 0,
+    fail_status: int = 503,
+    rpm: int = 0,
+    tpm: int = 0,
+) -> ThreadingHTTPServer:
+    handler = type("FakeOpenAIHandler", (Handler,), {
+        "delay_s": delay_s,
+        "timeout": idle_timeout_s,
+        "batch_delay_s": batch_delay_s,
+        "batch_fail_every": batch_fail_every,
+        "fail_first": fail_first,
+        "fail_status": fail_status,
+        "rpm": rpm,
+        "tpm": tpm,
+    })
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    return httpd
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument("--idle-timeout", type=float, default=None, help="Close keep-alive sockets idle for this long.")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="Seconds before a batch job completes.")
+    parser.add_argument("--batch-fail-every", type=int, default=0, metavar="N", help="Fail every N-th batch request (partial results).")
+    parser.add_argument("--fail-first", type=int, default=0, metavar="N", help="Answer the first N /responses requests with --fail-status.")
+    parser.add_argument("--fail-status", type=int, default=503, help="HTTP status for --fail-first (default: 503).")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute for /responses (0: unlimited).")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute for /responses (0: unlimited).")
+    args = parser.parse_args()
+
+    httpd = make_server(
+        args.host,
+        args.port,
+        delay_s=args.delay,
+        idle_timeout_s=args.idle_timeout,
+        batch_delay_s=args.batch_delay,
+        batch_fail_every=args.batch_fail_every,
+        fail_first=args.fail_first,
+        fail_status=args.fail_status,
+        rpm=args.rpm,
+        tpm=args.tpm,
+    )
+    print(f"fake openai: http://{args.host}:{httpd.server_address[1]}/v1")
+    httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
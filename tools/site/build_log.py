@@ -1,20 +1,34 @@
 from pathlib import Path
+import sys
 import markdown
 
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from scripts.log_index import write_if_changed  # noqa: E402
+from scripts.templating import Markup, Template  # noqa: E402
+
 SRC = Path("docs/log")
 TEMPLATE = SRC / "_template.html"
 
-def render(md_path):
+def render(md_path, template):
     html_body = markdown.markdown(md_path.read_text(encoding="utf-8"))
-    template = TEMPLATE.read_text(encoding="utf-8")
-    return template.replace("{{ content }}", html_body)
+    return template.render(
+        TITLE=md_path.stem,
+        CSS_HREF="../css/style.css",
+        CONTENT=Markup(html_body),
+        AGENT_COMMENT=Markup(""),
+    )
 
 def main():
+    # шаблон разбирается один раз на всю сборку
+    template = Template.from_path(TEMPLATE)
     for md in SRC.glob("*.md"):
-        html = render(md)
+        html = render(md, template)
         out = md.with_suffix(".html")
-        out.write_text(html, encoding="utf-8")
-        print(f"built: {out}")
+        if write_if_changed(out, html):
+            print(f"built: {out}")
 
 if __name__ == "__main__":
     main()